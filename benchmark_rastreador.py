@@ -0,0 +1,114 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+import tracker
+
+# Benchmark da consulta '/get_block_info' do rastreador.
+# Compara a varredura antiga (todos os peers para cada bloco pedido) com o índice invertido.
+# Com --retomada, mede também o arranque a quente: restaurar o enxame do instantâneo e do diário (--pasta-estado).
+
+
+def donos_por_varredura(enxame, ids_dos_blocos):
+    """Reproduz a implementação antiga: percorre todos os peers para cada bloco pedido."""
+    donos_dos_blocos = {}
+    for id_bloco in ids_dos_blocos:
+        donos = [pid for pid, blocos in enxame.blocos_dos_peers.items() if id_bloco in blocos and pid != 'tracker']
+        donos_dos_blocos[str(id_bloco)] = donos
+    return donos_dos_blocos
+
+
+def popular_rastreador(num_peers, num_blocos, blocos_por_peer, semente):
+    """Cria um enxame do rastreador preenchido com uma rede sintética."""
+    gerador = random.Random(semente)
+    enxame = tracker.Enxame('benchmark', num_blocos)
+    for i in range(num_peers):
+        enxame.peers_ativos[f'peer_{i}'] = f'http://127.0.0.1:{10_000 + i}'
+        enxame.ids_dos_peers.append(f'peer_{i}')
+        tracker.registrar_posse_blocos(enxame, f'peer_{i}', gerador.sample(range(num_blocos), blocos_por_peer))
+    return enxame
+
+
+def medir_retomada(enxame, atualizacoes, semente):
+    """
+    Grava o enxame num instantâneo, aplica `atualizacoes` deltas 'have' anotados no diário e simula uma queda
+    (sem instantâneo final). Retorna (segundos para restaurar tudo num enxame vazio, bytes em disco).
+    """
+    gerador = random.Random(semente)
+    with tempfile.TemporaryDirectory() as pasta:
+        tracker.enxames.clear()
+        tracker.enxames[enxame.info_hash] = enxame
+        tracker.abrir_estado(pasta)
+        tracker.gravar_instantaneo()
+        with tracker.lock:
+            for _ in range(atualizacoes):
+                id_peer = gerador.choice(enxame.ids_dos_peers)
+                tracker.aplicar_atualizacao(enxame, id_peer, {'have': [gerador.randrange(enxame.total_de_blocos)],
+                                                              'seq': enxame.sequencias_dos_peers.get(id_peer, 0) + 1})
+        tracker.diario.sincronizar()
+        bytes_em_disco = sum(os.path.getsize(os.path.join(pasta, nome)) for nome in os.listdir(pasta))
+
+        # "Queda": o processo perde a memória; o novo rastreador só tem o ficheiro e a pasta do estado.
+        tracker.diario.fechar()
+        tracker.diario = None
+        restaurado = tracker.Enxame(enxame.info_hash, enxame.total_de_blocos)
+        tracker.enxames[enxame.info_hash] = restaurado
+        inicio = time.perf_counter()
+        tracker.abrir_estado(pasta)
+        duracao = time.perf_counter() - inicio
+        tracker.diario.fechar()
+        tracker.diario = None
+
+    assert restaurado.blocos_dos_peers == enxame.blocos_dos_peers, 'O estado restaurado diverge do original.'
+    assert all(restaurado.sequencias_dos_peers[p] == enxame.sequencias_dos_peers.get(p, 0) for p in enxame.ids_dos_peers)
+    assert restaurado.disponibilidade_blocos == enxame.disponibilidade_blocos
+    return duracao, bytes_em_disco
+
+
+def medir(funcao, enxame, ids_dos_blocos, repeticoes):
+    """Retorna o menor tempo (em segundos) entre `repeticoes` execuções de `funcao`."""
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(enxame, ids_dos_blocos)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compara a varredura antiga com o índice invertido do rastreador.')
+    parser.add_argument('--peers', type=int, default=10_000)
+    parser.add_argument('--blocos', type=int, default=10_000)
+    parser.add_argument('--blocos-por-peer', type=int, default=10)
+    parser.add_argument('--consulta', type=int, default=10_000, help='Número de blocos pedidos em cada consulta.')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--retomada', action='store_true', help='Mede também o arranque a quente a partir do estado guardado.')
+    parser.add_argument('--atualizacoes', type=int, default=100_000, help='Deltas no diário depois do instantâneo (com --retomada).')
+    args = parser.parse_args()
+    # Os logs de cada atualização do rastreador custariam mais do que o que se mede.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    enxame = popular_rastreador(args.peers, args.blocos, args.blocos_por_peer, args.semente)
+    ids_consultados = random.Random(args.semente).sample(range(args.blocos), min(args.consulta, args.blocos))
+
+    # Garante que as duas implementações concordam antes de medir.
+    esperado = {k: sorted(v) for k, v in donos_por_varredura(enxame, ids_consultados[:100]).items()}
+    obtido = {k: sorted(v) for k, v in tracker.obter_donos_dos_blocos(enxame, ids_consultados[:100]).items()}
+    assert esperado == obtido, 'O índice invertido diverge da varredura.'
+
+    tempo_varredura = medir(donos_por_varredura, enxame, ids_consultados, 1)
+    tempo_indice = medir(tracker.obter_donos_dos_blocos, enxame, ids_consultados, args.repeticoes)
+
+    print(f"{args.peers} peers x {args.blocos} blocos, consulta de {len(ids_consultados)} blocos")
+    print(f"Varredura: {tempo_varredura * 1000:10.2f} ms")
+    print(f"Índice:    {tempo_indice * 1000:10.2f} ms")
+    print(f"Ganho:     {tempo_varredura / tempo_indice:10.1f}x")
+
+    if args.retomada:
+        duracao, bytes_em_disco = medir_retomada(enxame, args.atualizacoes, args.semente)
+        print(f"Retomada: {duracao * 1000:10.2f} ms ({args.peers} peers + {args.atualizacoes} registos no diário, "
+              f"{bytes_em_disco / 1e6:.1f} MB em disco)")
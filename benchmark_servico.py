@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+from metainfo import ArmazenamentoPecas, gerar_arquivo_exemplo, gerar_metainfo
+from peer import EnxameLocal, Peer
+from peer_assincrono import PeerAssincrono
+
+# Benchmark da rota '/request_block/<id>' de um peer semeador: mede os MB/s servidos
+# para diferentes tamanhos de peça, com peças inteiras ou divididas em intervalos (HTTP Range).
+# `--motor asyncio` mede o mesmo com o `PeerAssincrono`.
+
+
+class ServidorAssincrono:
+    """Corre o servidor de um `PeerAssincrono` num laço próprio, numa thread, com o `shutdown` do servidor WSGI."""
+
+    def __init__(self, peer, porta):
+        self.peer = peer
+        self.laco = asyncio.new_event_loop()
+        peer.laco = self.laco
+        peer.despertar = asyncio.Event()
+        threading.Thread(target=self.laco.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(peer.servidor.iniciar('127.0.0.1', porta), self.laco).result()
+
+    def shutdown(self):
+        asyncio.run_coroutine_threadsafe(self.peer.servidor.fechar(), self.laco).result()
+        self.laco.call_soon_threadsafe(self.laco.stop)
+
+
+def preparar_semeador(pasta, tamanho_peca, num_pecas, porta, vagas_upload, motor='threads'):
+    """
+    Cria um ficheiro de teste e um Peer semeador com todas as peças, servido num servidor WSGI com threads
+    (ou, com o motor 'asyncio', pelo servidor do `PeerAssincrono`).
+    Com `vagas_upload` igual ao número de clientes, nenhum cliente é recusado pelo choker.
+    """
+    caminho = os.path.join(pasta, f'conteudo_{tamanho_peca}.bin')
+    gerar_arquivo_exemplo(caminho, num_pecas, tamanho_peca)
+    metainfo = gerar_metainfo(caminho, tamanho_peca)
+
+    classe = PeerAssincrono if motor == 'asyncio' else Peer
+    peer = classe(f'bench_{tamanho_peca}', porta, pasta_dados=pasta, vagas_upload=vagas_upload)
+    peer.log.setLevel(logging.WARNING)
+    enxame = EnxameLocal(ArmazenamentoPecas(caminho, metainfo))
+    enxame.meus_blocos = set(range(num_pecas))
+    enxame.semeando = True
+    peer.adicionar_enxame(enxame)
+
+    if motor == 'asyncio':
+        return peer, ServidorAssincrono(peer, porta)
+    servidor = make_server('127.0.0.1', porta, peer.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return peer, servidor
+
+
+def cliente(endereco, num_pecas, tamanho_peca, partes, prazo, totais, indice):
+    """Baixa peças em sequência até o prazo, acumulando os bytes recebidos em `totais[indice]`."""
+    sessao = requests.Session()
+    tamanho_parte = tamanho_peca // partes
+    id_peca = indice
+    while time.perf_counter() < prazo:
+        for parte in range(partes):
+            cabecalhos = {}
+            if partes > 1:
+                inicio = parte * tamanho_parte
+                cabecalhos['Range'] = f'bytes={inicio}-{inicio + tamanho_parte - 1}'
+            resposta = sessao.get(f'{endereco}/request_block/{id_peca % num_pecas}',
+                                  params={'peer_id': f'cliente_{indice}'}, headers=cabecalhos)
+            totais[indice] += len(resposta.content)
+        id_peca += 1
+    sessao.close()
+
+
+def medir(endereco, num_pecas, tamanho_peca, partes, num_clientes, duracao):
+    """Retorna os MB/s servidos por um peer a `num_clientes` clientes simultâneos durante `duracao` segundos."""
+    totais = [0] * num_clientes
+    prazo = time.perf_counter() + duracao
+    threads = [threading.Thread(target=cliente, args=(endereco, num_pecas, tamanho_peca, partes, prazo, totais, i))
+               for i in range(num_clientes)]
+    inicio = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(totais) / (time.perf_counter() - inicio) / (1024 * 1024)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mede os MB/s servidos por um peer semeador.')
+    parser.add_argument('--clientes', type=int, default=4)
+    parser.add_argument('--duracao', type=float, default=5.0)
+    parser.add_argument('--porta', type=int, default=5900)
+    parser.add_argument('--mb-por-arquivo', type=int, default=64, help='Tamanho do ficheiro de teste em MiB.')
+    parser.add_argument('--motor', choices=['threads', 'asyncio'], default='threads', help='Peer com threads (Flask) ou assíncrono.')
+    args = parser.parse_args()
+
+    # Os logs de acesso do werkzeug custariam mais do que o próprio envio.
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as pasta:
+        # O Peer grava o seu log no diretório corrente; o benchmark não deve sujar o repositório.
+        os.chdir(pasta)
+        for deslocamento, tamanho_peca in enumerate((256 * 1024, 4 * 1024 * 1024)):
+            num_pecas = args.mb_por_arquivo * 1024 * 1024 // tamanho_peca
+            porta = args.porta + deslocamento
+            peer, servidor = preparar_semeador(pasta, tamanho_peca, num_pecas, porta, args.clientes, args.motor)
+            for partes in (1, 4):
+                taxa = medir(f'http://127.0.0.1:{porta}', num_pecas, tamanho_peca, partes, args.clientes, args.duracao)
+                modo = 'peça inteira' if partes == 1 else f'{partes} intervalos'
+                print(f"Peça de {tamanho_peca // 1024:5d} KiB, {modo:13s}: {taxa:8.1f} MB/s")
+            servidor.shutdown()
+            for enxame in peer.enxames.values():
+                enxame.armazenamento.fechar()
@@ -0,0 +1,40 @@
+import base64
+
+# Codificação compacta do conjunto de blocos de um peer.
+# O bit mais significativo do primeiro byte corresponde ao bloco 0, como no BitTorrent.
+
+
+def bitfield_para_bytes(blocos, total_de_blocos):
+    """Converte um conjunto de IDs de blocos em um bitfield de ceil(total/8) bytes."""
+    campo = bytearray((total_de_blocos + 7) // 8)
+    for id_bloco in blocos:
+        if 0 <= id_bloco < total_de_blocos:
+            campo[id_bloco >> 3] |= 0x80 >> (id_bloco & 7)
+    return bytes(campo)
+
+
+# Posições dos bits ligados em cada valor de byte, do mais significativo para o menos.
+BITS_LIGADOS = [tuple(bit for bit in range(8) if valor & (0x80 >> bit)) for valor in range(256)]
+
+
+def bytes_para_blocos(campo, total_de_blocos):
+    """Converte um bitfield em bytes de volta para o conjunto de IDs de blocos."""
+    blocos = []
+    for indice_byte, valor in enumerate(campo):
+        if valor:
+            base = indice_byte << 3
+            blocos.extend([base + bit for bit in BITS_LIGADOS[valor]])
+    # Bits de enchimento do último byte (ou de um campo maior do que o esperado) não são blocos.
+    while blocos and blocos[-1] >= total_de_blocos:
+        blocos.pop()
+    return set(blocos)
+
+
+def codificar_bitfield(blocos, total_de_blocos):
+    """Retorna o bitfield dos blocos codificado em base64, pronto para ir num JSON."""
+    return base64.b64encode(bitfield_para_bytes(blocos, total_de_blocos)).decode('ascii')
+
+
+def decodificar_bitfield(texto, total_de_blocos):
+    """Decodifica um bitfield em base64 para o conjunto de IDs de blocos."""
+    return bytes_para_blocos(base64.b64decode(texto), total_de_blocos)
@@ -0,0 +1,97 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Gestor de conexões HTTP persistentes (keep-alive) de um peer.
+# Cada endereço remoto (tracker ou peer) tem a sua própria sessão com um pool de conexões,
+# evitando um handshake TCP por pedido e o acúmulo de sockets em TIME_WAIT.
+
+TAMANHO_POOL_PADRAO = 4   # Conexões mantidas abertas por endereço remoto.
+
+
+class GerenciadorConexoes:
+    """Mantém uma `requests.Session` com pool próprio para cada endereço remoto."""
+
+    def __init__(self, tamanho_pool=TAMANHO_POOL_PADRAO, tamanhos_especificos=None):
+        """`tamanhos_especificos` permite um pool maior para endereços muito usados (ex.: o tracker)."""
+        self.tamanho_pool = tamanho_pool
+        self.tamanhos_especificos = dict(tamanhos_especificos or {})
+        self.sessoes = {}                  # {endereco_base: requests.Session}.
+        self.sessoes_descartadas = 0       # Sessões fechadas porque o peer remoto sumiu.
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def endereco_base(url):
+        """Reduz uma URL a 'esquema://host:porta', a chave de cada pool."""
+        partes = urlsplit(url)
+        return f'{partes.scheme}://{partes.netloc}'
+
+    def sessao(self, url):
+        """Retorna (criando se preciso) a sessão do endereço da URL."""
+        endereco = self.endereco_base(url)
+        with self.lock:
+            sessao = self.sessoes.get(endereco)
+            if sessao is None:
+                tamanho = self.tamanhos_especificos.get(endereco, self.tamanho_pool)
+                # Um único pool por endereço; `pool_maxsize` conexões podem ficar abertas e ser reutilizadas.
+                adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=tamanho, max_retries=0)
+                sessao = requests.Session()
+                sessao.mount('http://', adaptador)
+                sessao.mount('https://', adaptador)
+                self.sessoes[endereco] = sessao
+            return sessao
+
+    def get(self, url, **kwargs):
+        return self.sessao(url).get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.sessao(url).post(url, **kwargs)
+
+    def descartar(self, url):
+        """Fecha as conexões de um endereço remoto (ex.: um peer que saiu da rede)."""
+        with self.lock:
+            sessao = self.sessoes.pop(self.endereco_base(url), None)
+            if sessao is not None:
+                self.sessoes_descartadas += 1
+        if sessao is not None:
+            sessao.close()
+
+    def fechar(self):
+        """Fecha todas as sessões."""
+        with self.lock:
+            sessoes, self.sessoes = list(self.sessoes.values()), {}
+        for sessao in sessoes:
+            sessao.close()
+
+    def estatisticas(self):
+        """
+        Retorna, por endereço e no total, quantos pedidos foram feitos e quantas conexões TCP foram abertas.
+        A diferença entre os dois é o número de pedidos que reutilizaram uma conexão existente.
+        """
+        with self.lock:
+            sessoes = dict(self.sessoes)
+        por_endereco = {}
+        total_pedidos = total_conexoes = 0
+        for endereco, sessao in sessoes.items():
+            pedidos = conexoes = 0
+            for adaptador in set(sessao.adapters.values()):
+                pools = adaptador.poolmanager.pools
+                # O contêiner de pools do urllib3 não pode ser iterado diretamente; `keys()` tira uma cópia sob lock.
+                for chave in pools.keys():
+                    pool = pools.get(chave)
+                    if pool is None:
+                        continue
+                    pedidos += pool.num_requests
+                    conexoes += pool.num_connections
+            por_endereco[endereco] = {'pedidos': pedidos, 'conexoes_abertas': conexoes}
+            total_pedidos += pedidos
+            total_conexoes += conexoes
+        return {
+            'pedidos': total_pedidos,
+            'conexoes_abertas': total_conexoes,
+            'reutilizacao': (total_pedidos - total_conexoes) / total_pedidos if total_pedidos else 0.0,
+            'sessoes_descartadas': self.sessoes_descartadas,
+            'por_endereco': por_endereco,
+        }
@@ -0,0 +1,257 @@
+import argparse
+import heapq
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Gerador de carga para o rastreador: simula milhares de peers a usar todos os endpoints
+# e reporta a latência (p50/p99) por endpoint e o total de pedidos por segundo.
+# No modo 'announce' os peers só usam '/announce' e respeitam o 'interval' devolvido, para medir
+# a taxa de pedidos a que o rastreador consegue limitar uma rede grande.
+# Uso: inicie o tracker (python tracker.py) e depois execute este script.
+
+# Peso de cada operação na mistura de pedidos depois do registo.
+MISTURA_PADRAO = {'/get_peers': 3, '/get_block_info': 3, '/update_blocks': 4, '/announce': 2,
+                  '/request_block': 1, '/metainfo': 1, '/swarms': 1, '/stats': 1}
+TAMANHO_LEITURA = 64 * 1024    # Bytes lidos de cada vez do corpo de '/request_block', que chega em streaming.
+ESPERA_APOS_ERRO = 5           # Segundos até um peer do modo 'announce' tentar de novo depois de um erro.
+
+
+def percentil(valores_ordenados, fracao):
+    """Percentil por posição numa lista já ordenada."""
+    if not valores_ordenados:
+        return 0.0
+    indice = min(len(valores_ordenados) - 1, int(fracao * len(valores_ordenados)))
+    return valores_ordenados[indice]
+
+
+class PeerSimulado:
+    """Estado mínimo de um peer simulado: os blocos que diz ter e a sua sequência de atualizações."""
+
+    def __init__(self, id_peer, total_de_blocos, blocos_iniciais):
+        self.id_peer = id_peer
+        self.total_de_blocos = total_de_blocos
+        self.blocos = set(blocos_iniciais)
+        self.pendentes = set()
+        self.seq = 0
+
+
+class Trabalhador(threading.Thread):
+    """Thread que conduz um subconjunto dos peers simulados, com a sua própria sessão keep-alive."""
+
+    def __init__(self, url, info_hash, ids, gerador, mistura):
+        super().__init__(daemon=True)
+        self.url = url
+        self.info_hash = info_hash
+        self.ids = ids
+        self.gerador = gerador
+        self.mistura = mistura
+        self.peers = []
+        self.latencias = {}
+        self.erros = 0
+        self.recusas = 0
+        self.prazo = None
+        self.sessao = requests.Session()
+        self.sessao.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+    def medir(self, endpoint, metodo, caminho=None, **kwargs):
+        """
+        Faz um pedido e guarda a latência em `endpoint`. Com `stream=True` o corpo é lido até ao fim dentro da
+        medição, para que '/request_block' conte o envio das peças e não só os cabeçalhos. Um 429 é a
+        proteção do rastreador contra announces cedo demais: conta como recusa, não como erro.
+        """
+        inicio = time.perf_counter()
+        try:
+            resposta = metodo(f'{self.url}{caminho or endpoint}', timeout=10, **kwargs)
+            if kwargs.get('stream'):
+                for _ in resposta.iter_content(TAMANHO_LEITURA):
+                    pass
+            ok = resposta.status_code in (200, 429)
+        except requests.exceptions.RequestException:
+            resposta, ok = None, False
+        self.latencias.setdefault(endpoint, []).append(time.perf_counter() - inicio)
+        if not ok:
+            self.erros += 1
+        elif resposta.status_code == 429:
+            self.recusas += 1
+        return resposta if ok else None
+
+    def registrar(self):
+        for id_peer in self.ids:
+            resposta = self.medir('/register', self.sessao.post,
+                                  json={'peer_id': id_peer, 'address': f'http://sim/{id_peer}', 'info_hash': self.info_hash})
+            if resposta is not None:
+                dados = resposta.json()
+                self.peers.append(PeerSimulado(id_peer, dados['total_blocks'], dados['initial_blocks']))
+
+    def passo(self):
+        peer = self.gerador.choice(self.peers)
+        endpoint = self.gerador.choices(list(self.mistura), weights=list(self.mistura.values()))[0]
+        faltantes = [b for b in range(peer.total_de_blocos) if b not in peer.blocos]
+        if endpoint == '/get_peers':
+            self.medir(endpoint, self.sessao.get, params={'peer_id': peer.id_peer, 'info_hash': self.info_hash})
+        elif endpoint == '/get_block_info':
+            self.medir(endpoint, self.sessao.post, json={'block_ids': faltantes, 'info_hash': self.info_hash})
+        elif endpoint == '/update_blocks':
+            if not faltantes:
+                return
+            novo = self.gerador.choice(faltantes)
+            peer.blocos.add(novo)
+            peer.seq += 1
+            self.medir(endpoint, self.sessao.post,
+                       json={'peer_id': peer.id_peer, 'seq': peer.seq, 'have': [novo], 'info_hash': self.info_hash})
+        elif endpoint == '/announce':
+            # Announce periódico só com estatísticas: os blocos novos seguem por '/update_blocks'.
+            self.medir(endpoint, self.sessao.post,
+                       json={'peer_id': peer.id_peer, 'address': f'http://sim/{peer.id_peer}', 'info_hash': self.info_hash,
+                             'stats': {'uploaded': 0, 'downloaded': len(peer.blocos), 'left': len(faltantes)}})
+        elif endpoint == '/request_block':
+            # O rastreador só entrega blocos que o peer tem registados; os restantes dariam 404.
+            if not peer.blocos:
+                return
+            id_bloco = self.gerador.choice(sorted(peer.blocos))
+            self.medir(endpoint, self.sessao.get, caminho=f'{endpoint}/{id_bloco}', stream=True,
+                       params={'peer_id': peer.id_peer, 'info_hash': self.info_hash})
+        elif endpoint == '/metainfo':
+            self.medir(endpoint, self.sessao.get, params={'info_hash': self.info_hash})
+        else:
+            self.medir(endpoint, self.sessao.get)
+
+    def run(self):
+        self.registrar()
+        while self.peers and time.perf_counter() < self.prazo:
+            self.passo()
+
+
+class AnunciadorPeriodico(Trabalhador):
+    """
+    Trabalhador do modo 'announce': cada peer entra com um announce 'started' e volta a anunciar-se quando
+    passa o 'interval' devolvido, com os blocos obtidos entretanto. Um 429 ('too_soon') adia o announce por
+    'min_interval' e os blocos pendentes seguem no seguinte, como faz o peer real.
+    """
+
+    def __init__(self, url, info_hash, ids, gerador, mistura=None):
+        super().__init__(url, info_hash, ids, gerador, mistura)
+        self.agenda = []                 # Heap de (instante do próximo announce, índice do peer).
+        self.fim_arranque = None
+        self.instantes_periodicos = []
+        self.intervalos = None           # Último (interval, min_interval) devolvido pelo rastreador.
+
+    def anunciar(self, peer, evento=None):
+        """Envia um announce e retorna os segundos até ao próximo."""
+        faltantes = peer.total_de_blocos - len(peer.blocos)
+        corpo = {'peer_id': peer.id_peer, 'address': f'http://sim/{peer.id_peer}', 'info_hash': self.info_hash,
+                 'stats': {'uploaded': 0, 'downloaded': len(peer.blocos), 'left': faltantes}}
+        if evento is not None:
+            corpo['event'] = evento
+        elif peer.pendentes:
+            peer.seq += 1
+            corpo['seq'] = peer.seq
+            corpo['have'] = sorted(peer.pendentes)
+        resposta = self.medir('/announce', self.sessao.post, json=corpo)
+        if resposta is None:
+            return ESPERA_APOS_ERRO
+        dados = resposta.json()
+        self.intervalos = (dados['interval'], dados['min_interval'])
+        if resposta.status_code == 429:
+            return dados['min_interval']
+        peer.pendentes.clear()
+        return dados['interval']
+
+    def registrar(self):
+        for id_peer in self.ids:
+            corpo = {'peer_id': id_peer, 'address': f'http://sim/{id_peer}', 'info_hash': self.info_hash, 'event': 'started'}
+            resposta = self.medir('/announce started', self.sessao.post, caminho='/announce', json=corpo)
+            if resposta is None or resposta.status_code != 200:
+                continue
+            dados = resposta.json()
+            self.peers.append(PeerSimulado(id_peer, dados['total_blocks'], dados['initial_blocks']))
+            heapq.heappush(self.agenda, (time.perf_counter() + dados['interval'], len(self.peers) - 1))
+        self.fim_arranque = time.perf_counter()
+
+    def run(self):
+        self.registrar()
+        while self.agenda:
+            instante, indice = self.agenda[0]
+            if instante >= self.prazo:
+                break
+            time.sleep(max(0.0, instante - time.perf_counter()))
+            heapq.heappop(self.agenda)
+            peer = self.peers[indice]
+            # Entre dois announces o peer obtém mais um bloco, que segue no próximo announce aceite.
+            faltantes = [b for b in range(peer.total_de_blocos) if b not in peer.blocos]
+            if faltantes:
+                novo = self.gerador.choice(faltantes)
+                peer.blocos.add(novo)
+                peer.pendentes.add(novo)
+            self.instantes_periodicos.append(time.perf_counter())
+            heapq.heappush(self.agenda, (time.perf_counter() + self.anunciar(peer), indice))
+
+
+def escolher_enxame(url, info_hash):
+    """Retorna o info-hash indicado ou, sem ele, o do primeiro enxame que o rastreador lista em '/swarms'."""
+    if info_hash is not None:
+        return info_hash
+    enxames = requests.get(f'{url}/swarms', timeout=10).json()
+    if not enxames:
+        raise SystemExit('O rastreador não tem nenhum enxame.')
+    return enxames[0]['info_hash']
+
+
+def executar(url, info_hash, num_peers, concorrencia, duracao, semente, modo='mistura'):
+    info_hash = escolher_enxame(url, info_hash)
+    ids = [f'sim_{i}' for i in range(num_peers)]
+    classe = AnunciadorPeriodico if modo == 'announce' else Trabalhador
+    trabalhadores = [classe(url, info_hash, ids[i::concorrencia], random.Random(semente + i), MISTURA_PADRAO)
+                     for i in range(concorrencia)]
+    inicio = time.perf_counter()
+    for trabalhador in trabalhadores:
+        trabalhador.prazo = inicio + duracao
+        trabalhador.start()
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+    decorrido = time.perf_counter() - inicio
+
+    latencias = {}
+    for trabalhador in trabalhadores:
+        for endpoint, valores in trabalhador.latencias.items():
+            latencias.setdefault(endpoint, []).extend(valores)
+    total = sum(len(valores) for valores in latencias.values())
+    erros = sum(trabalhador.erros for trabalhador in trabalhadores)
+    recusas = sum(trabalhador.recusas for trabalhador in trabalhadores)
+
+    print(f"{num_peers} peers simulados, {concorrencia} conexões, {decorrido:.1f}s")
+    print(f"{'endpoint':18s} {'pedidos':>8s} {'p50 (ms)':>9s} {'p99 (ms)':>9s}")
+    for endpoint, valores in sorted(latencias.items()):
+        valores.sort()
+        print(f"{endpoint:18s} {len(valores):8d} {percentil(valores, 0.50) * 1000:9.2f} {percentil(valores, 0.99) * 1000:9.2f}")
+    print(f"Total: {total} pedidos, {total / decorrido:.0f} pedidos/s, {erros} erros, {recusas} announces recusados (429)")
+    if modo == 'announce':
+        # A taxa que interessa é a de regime: conta só os announces periódicos depois de todos os peers entrarem.
+        fim_arranque = max(trabalhador.fim_arranque or inicio for trabalhador in trabalhadores)
+        periodicos = sum(1 for trabalhador in trabalhadores for instante in trabalhador.instantes_periodicos
+                         if instante >= fim_arranque)
+        janela = inicio + decorrido - fim_arranque
+        intervalos = next((t.intervalos for t in trabalhadores if t.intervalos is not None), None)
+        if intervalos is None or janela <= 0:
+            print("Sem announces periódicos: aumente --duracao para lá do arranque e do 'interval'.")
+        else:
+            print(f"Regime: {periodicos} announces periódicos em {janela:.1f}s, {periodicos / janela:.1f} announces/s "
+                  f"(interval {intervalos[0]}s, min_interval {intervalos[1]}s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera carga sintética no rastreador MiniBit.')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--info-hash', help='Enxame a carregar (padrão: o primeiro listado em /swarms).')
+    parser.add_argument('--peers', type=int, default=2000, help='Número de peers simulados.')
+    parser.add_argument('--concorrencia', type=int, default=32, help='Conexões simultâneas ao rastreador.')
+    parser.add_argument('--duracao', type=float, default=20.0, help='Segundos de carga (inclui o registo).')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--modo', choices=['mistura', 'announce'], default='mistura',
+                        help="'mistura' (todos os endpoints sem pausas) ou 'announce' (só /announce, ao ritmo do 'interval').")
+    args = parser.parse_args()
+    executar(args.url, args.info_hash, args.peers, args.concorrencia, args.duracao, args.semente, args.modo)
@@ -0,0 +1,441 @@
+import asyncio
+import json
+import re
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Servidor e cliente HTTP/1.1 mínimos sobre asyncio, só com a biblioteca padrão, usados pelo peer assíncrono.
+# Falam o mesmo protocolo que o Flask e o requests do peer com threads: GET/POST, corpo com Content-Length
+# (na leitura também chunked), conexões keep-alive. Cada conexão custa uma corrotina e não uma thread, por
+# isso um processo mantém milhares de conexões abertas ao mesmo tempo.
+
+LIMITE_CABECALHOS = 64 * 1024   # Bytes máximos de uma linha de pedido, de resposta ou de cabeçalho.
+MAX_CABECALHOS = 100            # Cabeçalhos aceites numa mensagem.
+MAX_CORPO_PEDIDO = 1024 * 1024  # Bytes máximos do corpo de um pedido recebido (avisos 'have', JSON pequeno).
+TIMEOUT_OCIOSO = 120            # Segundos que o servidor mantém aberta uma conexão keep-alive sem pedidos.
+BACKLOG = 2048                  # Conexões que podem esperar por accept().
+TAMANHO_POOL_PADRAO = 4         # Conexões ociosas guardadas por endereço remoto.
+METODOS_IDEMPOTENTES = frozenset({'GET', 'HEAD'})   # Podem ser repetidos sem risco de serem aplicados duas vezes.
+ERROS_DE_REDE = (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError)
+
+
+class ErroHttp(Exception):
+    """Falha de conexão, tempo esgotado ou mensagem malformada (o papel de `requests.exceptions.RequestException`)."""
+
+
+async def _ler_cabecalhos(leitor):
+    """Lê cabeçalhos até à linha vazia. Retorna {nome em minúsculas: valor}."""
+    cabecalhos = {}
+    for _ in range(MAX_CABECALHOS + 1):
+        linha = await leitor.readline()
+        if not linha:
+            raise asyncio.IncompleteReadError(b'', None)
+        if linha in (b'\r\n', b'\n'):
+            return cabecalhos
+        nome, _, valor = linha.decode('latin-1').partition(':')
+        cabecalhos[nome.strip().lower()] = valor.strip()
+    raise ValueError('cabeçalhos demais')
+
+
+def _linhas_de_cabecalho(cabecalhos):
+    return ''.join(f'{nome}: {valor}\r\n' for nome, valor in cabecalhos.items())
+
+
+def interpretar_range(cabecalho, tamanho):
+    """
+    Interpreta um cabeçalho Range de um só intervalo ('bytes=a-b', 'bytes=a-' ou 'bytes=-n') sobre `tamanho`
+    bytes. Retorna (inicio, fim) com `fim` exclusivo, ou None se o intervalo for inválido ou não couber.
+    """
+    unidade, _, intervalo = cabecalho.partition('=')
+    if unidade.strip() != 'bytes' or ',' in intervalo:
+        return None
+    primeiro, _, ultimo = intervalo.strip().partition('-')
+    try:
+        if not primeiro:
+            inicio, fim = max(0, tamanho - int(ultimo)), tamanho
+        else:
+            inicio = int(primeiro)
+            fim = min(int(ultimo) + 1, tamanho) if ultimo else tamanho
+    except ValueError:
+        return None
+    return (inicio, fim) if 0 <= inicio < fim else None
+
+
+# --- Servidor ---
+
+class Pedido:
+    """Pedido recebido pelo servidor: método, caminho, parâmetros da query, cabeçalhos (em minúsculas) e corpo."""
+
+    def __init__(self, metodo, caminho, parametros, cabecalhos, corpo):
+        self.metodo = metodo
+        self.caminho = caminho
+        self.parametros = parametros
+        self.cabecalhos = cabecalhos
+        self.corpo = corpo
+
+    def json(self):
+        return json.loads(self.corpo) if self.corpo else None
+
+
+class Resposta:
+    """
+    Resposta de uma rota. `corpo` são bytes ou um gerador assíncrono de bytes; neste caso, o tamanho total
+    tem de vir no cabeçalho 'Content-Length' e cada pedaço é escrito à medida que a conexão o aceita.
+    """
+
+    def __init__(self, corpo=b'', status=200, cabecalhos=None, tipo='application/octet-stream'):
+        self.corpo = corpo
+        self.status = status
+        self.cabecalhos = dict(cabecalhos or {})
+        self.tipo = tipo
+
+
+def resposta_json(dados, status=200):
+    return Resposta(json.dumps(dados).encode(), status, tipo='application/json')
+
+
+def _compilar_regra(regra):
+    """Converte uma regra no estilo do Flask ('/request_block/<int:id_bloco>') em (expressão regular, conversores)."""
+    conversores = {}
+
+    def substituir(correspondencia):
+        tipo, nome = correspondencia.group(1) or 'string', correspondencia.group(2)
+        conversores[nome] = int if tipo == 'int' else str
+        return f'(?P<{nome}>\\d+)' if tipo == 'int' else f'(?P<{nome}>[^/]+)'
+
+    return re.compile(re.sub(r'<(?:(\w+):)?(\w+)>', substituir, regra)), conversores
+
+
+class ServidorHttp:
+    """
+    Servidor HTTP/1.1 com keep-alive num laço asyncio. As rotas são corrotinas `rota(pedido, **argumentos)`
+    que retornam uma `Resposta`. `ao_responder(regra, segundos)` é chamado com o tempo de montagem de cada resposta.
+    """
+
+    def __init__(self, log=None, ao_responder=None):
+        self.rotas = []                  # [(regra, expressão, conversores, {método: corrotina})].
+        self.log = log
+        self.ao_responder = ao_responder
+        self.servidor = None
+        self.conexoes_abertas = 0
+
+    def rota(self, regra, metodos=('GET',)):
+        """Decorador que associa uma corrotina a uma regra e aos seus métodos."""
+        def registrar(funcao):
+            for existente, _, _, por_metodo in self.rotas:
+                if existente == regra:
+                    por_metodo.update({metodo: funcao for metodo in metodos})
+                    return funcao
+            expressao, conversores = _compilar_regra(regra)
+            self.rotas.append((regra, expressao, conversores, {metodo: funcao for metodo in metodos}))
+            return funcao
+        return registrar
+
+    async def iniciar(self, host, porta):
+        self.servidor = await asyncio.start_server(self._atender, host, porta, limit=LIMITE_CABECALHOS, backlog=BACKLOG)
+
+    async def fechar(self):
+        if self.servidor is not None:
+            self.servidor.close()
+            await self.servidor.wait_closed()
+
+    def _encontrar(self, metodo, caminho):
+        """Retorna (regra, corrotina, argumentos), com corrotina None se só o método não servir (405)."""
+        for regra, expressao, conversores, por_metodo in self.rotas:
+            correspondencia = expressao.fullmatch(caminho)
+            if correspondencia:
+                argumentos = {nome: conversores[nome](valor) for nome, valor in correspondencia.groupdict().items()}
+                return regra, por_metodo.get(metodo), argumentos
+        return None, None, None
+
+    async def _atender(self, leitor, escritor):
+        self.conexoes_abertas += 1
+        try:
+            while await self._atender_pedido(leitor, escritor):
+                pass
+        except ERROS_DE_REDE:
+            pass  # O cliente fechou a conexão ou enviou lixo: não há a quem responder.
+        except asyncio.CancelledError:
+            pass  # Laço a encerrar. Terminar sem propagar evita que o asyncio registe a conexão como erro.
+        finally:
+            self.conexoes_abertas -= 1
+            escritor.close()
+
+    async def _atender_pedido(self, leitor, escritor):
+        """Lê um pedido, responde-lhe e retorna True se a conexão fica aberta para o seguinte."""
+        try:
+            linha = await asyncio.wait_for(leitor.readline(), TIMEOUT_OCIOSO)
+        except asyncio.TimeoutError:
+            return False
+        if not linha:
+            return False
+        inicio = time.perf_counter()
+        metodo, alvo, versao = linha.decode('latin-1').split()
+        cabecalhos = await _ler_cabecalhos(leitor)
+        conexao = cabecalhos.get('connection', '').lower()
+        manter = conexao == 'keep-alive' if versao == 'HTTP/1.0' else conexao != 'close'
+
+        tamanho = int(cabecalhos.get('content-length', 0))
+        if 'transfer-encoding' in cabecalhos or tamanho > MAX_CORPO_PEDIDO:
+            await self._escrever(escritor, resposta_json({'error': 'Corpo não suportado'}, 413), False, metodo)
+            return False
+        corpo = await leitor.readexactly(tamanho) if tamanho else b''
+
+        partes = urlsplit(alvo)
+        regra, funcao, argumentos = self._encontrar(metodo, partes.path)
+        if regra is None:
+            resposta = resposta_json({'error': 'Não encontrado'}, 404)
+        elif funcao is None:
+            resposta = resposta_json({'error': 'Método não permitido'}, 405)
+        else:
+            pedido = Pedido(metodo, partes.path, dict(parse_qsl(partes.query)), cabecalhos, corpo)
+            try:
+                resposta = await funcao(pedido, **argumentos)
+            except Exception:
+                if self.log is not None:
+                    self.log.exception(f"Erro ao atender {metodo} {partes.path}")
+                resposta = resposta_json({'error': 'Erro interno'}, 500)
+        if self.ao_responder is not None:
+            self.ao_responder(regra or partes.path, time.perf_counter() - inicio)
+        await self._escrever(escritor, resposta, manter, metodo)
+        return manter
+
+    async def _escrever(self, escritor, resposta, manter, metodo):
+        cabecalhos = {'Content-Type': resposta.tipo}
+        cabecalhos.update(resposta.cabecalhos)
+        if isinstance(resposta.corpo, bytes):
+            cabecalhos['Content-Length'] = str(len(resposta.corpo))
+        cabecalhos['Connection'] = 'keep-alive' if manter else 'close'
+        status = HTTPStatus(resposta.status)
+        escritor.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n{_linhas_de_cabecalho(cabecalhos)}\r\n'.encode('latin-1'))
+        if isinstance(resposta.corpo, bytes):
+            if metodo != 'HEAD':
+                escritor.write(resposta.corpo)
+            await escritor.drain()
+            return
+        try:
+            async for pedaco in resposta.corpo:
+                escritor.write(pedaco)
+                # Só continua quando o socket aceitou o pedaço: um cliente lento não faz a memória crescer.
+                await escritor.drain()
+        finally:
+            await resposta.corpo.aclose()
+
+
+# --- Cliente ---
+
+class _Conexao:
+    def __init__(self, leitor, escritor):
+        self.leitor = leitor
+        self.escritor = escritor
+
+
+class RespostaHttp:
+    """
+    Resposta recebida pelo cliente. Os cabeçalhos já foram lidos; o corpo é lido com `pedacos`, `conteudo`
+    ou `json`. Lido até ao fim, a conexão volta ao pool; `fechar` descarta-a a meio (ex.: pedido cancelado).
+    """
+
+    def __init__(self, cliente, endereco, conexao, status, cabecalhos, metodo, timeout, tamanho_pedido):
+        self.cliente = cliente
+        self.endereco = endereco
+        self.conexao = conexao
+        self.status = status
+        self.cabecalhos = cabecalhos
+        self.timeout = timeout
+        self.tamanho_pedido = tamanho_pedido   # Bytes do corpo enviado no pedido.
+        self.manter = cabecalhos.get('connection', '').lower() != 'close'
+        self.chunked = 'chunked' in cabecalhos.get('transfer-encoding', '').lower()
+        if self.chunked:
+            self.restante = None
+        elif metodo == 'HEAD' or status in (204, 304):
+            self.restante = 0
+        elif 'content-length' in cabecalhos:
+            self.restante = int(cabecalhos['content-length'])
+        else:
+            self.restante = None   # Corpo até o servidor fechar a conexão.
+            self.manter = False
+
+    async def _ler(self, corrotina):
+        try:
+            return await asyncio.wait_for(corrotina, self.timeout)
+        except ERROS_DE_REDE as e:
+            self.fechar()
+            raise ErroHttp(f'{self.endereco}: {e!r}') from e
+
+    async def pedacos(self, tamanho=64 * 1024):
+        """Gera o corpo em pedaços de até `tamanho` bytes; cada leitura espera no máximo `timeout` segundos."""
+        leitor = self.conexao.leitor
+        if self.chunked:
+            while True:
+                tamanho_bloco = int((await self._ler(leitor.readline())).split(b';')[0], 16)
+                if not tamanho_bloco:
+                    while (await self._ler(leitor.readline())) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                while tamanho_bloco:
+                    dados = await self._ler(leitor.read(min(tamanho, tamanho_bloco)))
+                    if not dados:
+                        await self._ler(leitor.readexactly(1))   # Conexão fechada a meio: vira ErroHttp.
+                    tamanho_bloco -= len(dados)
+                    yield dados
+                await self._ler(leitor.readexactly(2))
+        elif self.restante is not None:
+            while self.restante:
+                dados = await self._ler(leitor.read(min(tamanho, self.restante)))
+                if not dados:
+                    await self._ler(leitor.readexactly(1))
+                self.restante -= len(dados)
+                yield dados
+        else:
+            while dados := await self._ler(leitor.read(tamanho)):
+                yield dados
+        self._terminar()
+
+    async def conteudo(self):
+        return b''.join([pedaco async for pedaco in self.pedacos()])
+
+    async def json(self):
+        return json.loads(await self.conteudo())
+
+    def _terminar(self):
+        conexao, self.conexao = self.conexao, None
+        if conexao is not None:
+            if self.manter:
+                self.cliente._devolver(self.endereco, conexao)
+            else:
+                conexao.escritor.close()
+
+    def fechar(self):
+        """Fecha a conexão sem ler o resto do corpo; ela não volta ao pool."""
+        conexao, self.conexao = self.conexao, None
+        if conexao is not None:
+            conexao.escritor.close()
+
+
+class ClienteHttp:
+    """
+    Cliente HTTP/1.1 com conexões keep-alive por endereço remoto. Há tantas conexões abertas quantos pedidos
+    simultâneos; ao terminar, até `tamanho_pool` ficam guardadas para os pedidos seguintes ao mesmo endereço.
+    """
+
+    def __init__(self, tamanho_pool=TAMANHO_POOL_PADRAO, tamanhos_especificos=None):
+        """`tamanhos_especificos` permite um pool maior para endereços muito usados (ex.: o tracker)."""
+        self.tamanho_pool = tamanho_pool
+        self.tamanhos_especificos = dict(tamanhos_especificos or {})
+        self.livres = {}                   # {endereco_base: [_Conexao ociosa]}.
+        self.contagem = {}                 # {endereco_base: [pedidos, conexões abertas]}.
+        self.sessoes_descartadas = 0       # Endereços cujas conexões foram fechadas porque o peer remoto sumiu.
+
+    @staticmethod
+    def endereco_base(url):
+        """Reduz uma URL a 'esquema://host:porta', a chave de cada pool."""
+        partes = urlsplit(url)
+        return f'{partes.scheme}://{partes.netloc}'
+
+    async def get(self, url, **kwargs):
+        return await self.pedir('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.pedir('POST', url, **kwargs)
+
+    async def pedir(self, metodo, url, params=None, json=None, headers=None, timeout=5):
+        """
+        Envia um pedido e retorna a `RespostaHttp` assim que os cabeçalhos chegam. `timeout` limita a conexão,
+        o envio e cada leitura. Levanta `ErroHttp` se o servidor não responder.
+        """
+        partes = urlsplit(url)
+        endereco = f'{partes.scheme}://{partes.netloc}'
+        alvo = partes.path or '/'
+        consulta = urlencode(params) if params else partes.query
+        if consulta:
+            alvo = f'{alvo}?{consulta}'
+        corpo = b''
+        cabecalhos = {'Host': partes.netloc, 'Connection': 'keep-alive'}
+        if json is not None:
+            corpo = _json_para_bytes(json)
+            cabecalhos['Content-Type'] = 'application/json'
+        if corpo or metodo == 'POST':
+            cabecalhos['Content-Length'] = str(len(corpo))
+        cabecalhos.update(headers or {})
+        mensagem = f'{metodo} {alvo} HTTP/1.1\r\n{_linhas_de_cabecalho(cabecalhos)}\r\n'.encode('latin-1') + corpo
+
+        while True:
+            conexao = self._tirar_livre(endereco)
+            reutilizada = conexao is not None
+            try:
+                if conexao is None:
+                    conexao = await asyncio.wait_for(self._abrir(endereco, partes), timeout)
+                conexao.escritor.write(mensagem)
+                await asyncio.wait_for(conexao.escritor.drain(), timeout)
+                linha = await asyncio.wait_for(conexao.leitor.readline(), timeout)
+                if not linha:
+                    raise ConnectionResetError('conexão fechada pelo servidor')
+                status = int(linha.split(None, 2)[1])
+                cabecalhos_resposta = await asyncio.wait_for(_ler_cabecalhos(conexao.leitor), timeout)
+            except ERROS_DE_REDE as e:
+                if conexao is not None:
+                    conexao.escritor.close()
+                # Uma conexão ociosa pode ter sido fechada pelo servidor entretanto; repete-se o pedido numa
+                # conexão nova. Só os idempotentes: um POST pode ter sido recebido e aplicado antes do erro.
+                # O announce guarda os blocos pendentes para o seguinte; um 'have' perdido só atrasa a raridade.
+                if reutilizada and metodo in METODOS_IDEMPOTENTES and not isinstance(e, asyncio.TimeoutError):
+                    continue
+                raise ErroHttp(f'{metodo} {url}: {e!r}') from e
+            self.contagem.setdefault(endereco, [0, 0])[0] += 1
+            return RespostaHttp(self, endereco, conexao, status, cabecalhos_resposta, metodo, timeout, len(corpo))
+
+    async def _abrir(self, endereco, partes):
+        leitor, escritor = await asyncio.open_connection(partes.hostname, partes.port or 80, limit=LIMITE_CABECALHOS)
+        self.contagem.setdefault(endereco, [0, 0])[1] += 1
+        return _Conexao(leitor, escritor)
+
+    def _tirar_livre(self, endereco):
+        livres = self.livres.get(endereco)
+        while livres:
+            conexao = livres.pop()
+            if not conexao.escritor.is_closing() and not conexao.leitor.at_eof():
+                return conexao
+            conexao.escritor.close()
+        return None
+
+    def _devolver(self, endereco, conexao):
+        livres = self.livres.setdefault(endereco, [])
+        if len(livres) < self.tamanhos_especificos.get(endereco, self.tamanho_pool):
+            livres.append(conexao)
+        else:
+            conexao.escritor.close()
+
+    def descartar(self, url):
+        """Fecha as conexões ociosas de um endereço remoto (ex.: um peer que saiu da rede)."""
+        livres = self.livres.pop(self.endereco_base(url), None)
+        if livres is not None:
+            self.sessoes_descartadas += 1
+            for conexao in livres:
+                conexao.escritor.close()
+
+    def fechar(self):
+        """Fecha todas as conexões ociosas."""
+        livres, self.livres = self.livres, {}
+        for conexoes in livres.values():
+            for conexao in conexoes:
+                conexao.escritor.close()
+
+    def estatisticas(self):
+        """Pedidos feitos e conexões TCP abertas, por endereço e no total, como `GerenciadorConexoes.estatisticas`."""
+        por_endereco = {endereco: {'pedidos': pedidos, 'conexoes_abertas': conexoes}
+                        for endereco, (pedidos, conexoes) in self.contagem.items()}
+        total_pedidos = sum(valores['pedidos'] for valores in por_endereco.values())
+        total_conexoes = sum(valores['conexoes_abertas'] for valores in por_endereco.values())
+        return {
+            'pedidos': total_pedidos,
+            'conexoes_abertas': total_conexoes,
+            'reutilizacao': (total_pedidos - total_conexoes) / total_pedidos if total_pedidos else 0.0,
+            'sessoes_descartadas': self.sessoes_descartadas,
+            'por_endereco': por_endereco,
+        }
+
+
+def _json_para_bytes(dados):
+    return json.dumps(dados).encode()
@@ -0,0 +1,63 @@
+# Janela de pedidos em voo: que partes pedir a quem, quantas de cada vez e quando entrar em endgame.
+# A mesma política serve o peer real (um `EnxameLocal`) e o simulador (um `PeerSimulado`): as funções só usam
+# os atributos `seletor`, `pedidos_em_voo` ({(peça, parte): {fontes}}), `pedidos_por_peer` ({fonte: pedidos}),
+# `recusas_ate` ({fonte: instante}) e `inicio_endgame` (None fora do endgame). Quem as chama trata do lock.
+
+
+def entrar_em_endgame(estado, limiar_endgame, agora):
+    """
+    Entra em modo endgame quando restam `limiar_endgame` peças ou menos (0 desativa).
+    Retorna o número de peças em falta se entrou agora, ou None.
+    """
+    if estado.inicio_endgame is not None or not limiar_endgame:
+        return None
+    faltantes = estado.seletor.pecas_faltantes()
+    if faltantes > limiar_endgame:
+        return None
+    estado.inicio_endgame = agora
+    return faltantes
+
+
+def escolher_pedidos(estado, fontes_conhecidas, max_pedidos, max_pedidos_por_peer, fontes_endgame, agora):
+    """
+    Escolhe até `max_pedidos` pedidos (peça, parte, fonte) com o seletor de peças, sem os reservar.
+    Ignora fontes que nos recusaram recentemente e fontes no limite de pedidos simultâneos. Fora do endgame
+    ignora também as partes já em voo; no endgame, uma parte pode ser pedida a até `fontes_endgame` fontes.
+    """
+    escolhidos = []
+    ocupacao = dict(estado.pedidos_por_peer)
+    em_voo = {chave: set(fontes) for chave, fontes in estado.pedidos_em_voo.items()}
+    # Fontes que conhecemos e que não nos recusaram recentemente.
+    fontes_aceitas = [p for p in fontes_conhecidas if estado.recusas_ate.get(p, 0) <= agora]
+    for _ in range(max_pedidos):
+        fontes_livres = {p for p in fontes_aceitas if ocupacao.get(p, 0) < max_pedidos_por_peer}
+        if estado.inicio_endgame is not None:
+            pedido = estado.seletor.escolher_endgame(fontes_livres, em_voo, fontes_endgame)
+        else:
+            pedido = estado.seletor.escolher(fontes_livres, em_voo)
+        if pedido is None:
+            break
+        id_bloco, parte, id_peer_fonte = pedido
+        em_voo.setdefault((id_bloco, parte), set()).add(id_peer_fonte)
+        ocupacao[id_peer_fonte] = ocupacao.get(id_peer_fonte, 0) + 1
+        escolhidos.append(pedido)
+    return escolhidos
+
+
+def reservar_pedido(estado, id_bloco, parte, id_peer_fonte):
+    """Marca uma parte como em voo para que não seja pedida duas vezes."""
+    estado.pedidos_em_voo.setdefault((id_bloco, parte), set()).add(id_peer_fonte)
+    estado.pedidos_por_peer[id_peer_fonte] = estado.pedidos_por_peer.get(id_peer_fonte, 0) + 1
+
+
+def liberar_pedido(estado, id_bloco, parte, id_peer_fonte):
+    """Retira uma parte da lista em voo. Se não foi recebida, volta a ser elegível para outro pedido."""
+    fontes = estado.pedidos_em_voo.get((id_bloco, parte), set())
+    fontes.discard(id_peer_fonte)
+    if not fontes:
+        estado.pedidos_em_voo.pop((id_bloco, parte), None)
+    restantes = estado.pedidos_por_peer.get(id_peer_fonte, 1) - 1
+    if restantes > 0:
+        estado.pedidos_por_peer[id_peer_fonte] = restantes
+    else:
+        estado.pedidos_por_peer.pop(id_peer_fonte, None)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import mmap
+import os
+import random
+
+# Geração de metainfo (divisão do arquivo em peças com hash por peça) e armazenamento das peças em disco.
+
+TAMANHO_PECA_PADRAO = 256 * 1024   # 256 KiB por peça.
+ALGORITMO_PADRAO = 'sha1'          # Algoritmo de hash das peças ('sha1' ou 'sha256').
+TAMANHO_FATIA_ENVIO = 256 * 1024   # Tamanho máximo de cada pedaço escrito no socket ao servir uma peça.
+
+
+def calcular_info_hash(metainfo):
+    """Calcula o identificador do conteúdo: SHA-1 do metainfo canônico (sem o próprio 'info_hash')."""
+    info = {chave: valor for chave, valor in metainfo.items() if chave != 'info_hash'}
+    return hashlib.sha1(json.dumps(info, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def gerar_metainfo(caminho_arquivo, tamanho_peca=TAMANHO_PECA_PADRAO, algoritmo=ALGORITMO_PADRAO):
+    """Divide o arquivo em peças de `tamanho_peca` bytes e registra o hash de cada uma."""
+    hashes = []
+    with open(caminho_arquivo, 'rb') as arquivo:
+        while True:
+            peca = arquivo.read(tamanho_peca)
+            if not peca:
+                break
+            hashes.append(hashlib.new(algoritmo, peca).hexdigest())
+
+    metainfo = {
+        'name': os.path.basename(caminho_arquivo),
+        'length': os.path.getsize(caminho_arquivo),
+        'piece_length': tamanho_peca,
+        'hash_algorithm': algoritmo,
+        'pieces': hashes,
+    }
+    metainfo['info_hash'] = calcular_info_hash(metainfo)
+    return metainfo
+
+
+def salvar_metainfo(metainfo, caminho):
+    """Grava o metainfo em JSON."""
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(metainfo, arquivo, indent=2)
+
+
+def carregar_metainfo(caminho):
+    """Lê um metainfo em JSON e confere o seu 'info_hash'."""
+    with open(caminho, encoding='utf-8') as arquivo:
+        metainfo = json.load(arquivo)
+    if metainfo.get('info_hash') != calcular_info_hash(metainfo):
+        raise ValueError(f"Metainfo corrompido: {caminho}")
+    return metainfo
+
+
+def gerar_arquivo_exemplo(caminho, num_pecas, tamanho_peca=TAMANHO_PECA_PADRAO, semente=0):
+    """Cria um arquivo de bytes pseudoaleatórios com exatamente `num_pecas` peças."""
+    gerador = random.Random(semente)
+    with open(caminho, 'wb') as arquivo:
+        for _ in range(num_pecas):
+            arquivo.write(gerador.getrandbits(tamanho_peca * 8).to_bytes(tamanho_peca, 'little'))
+
+
+class ArmazenamentoPecas:
+    """Arquivo pré-alocado com o tamanho final do conteúdo, acessado via mmap peça a peça."""
+
+    def __init__(self, caminho, metainfo):
+        self.caminho = caminho
+        self.metainfo = metainfo
+        self.tamanho_peca = metainfo['piece_length']
+        self.tamanho_total = metainfo['length']
+        self.total_de_pecas = len(metainfo['pieces'])
+
+        # Pré-aloca o arquivo (sem apagar o conteúdo se ele já existir com o tamanho certo).
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        modo = 'r+b' if os.path.exists(caminho) else 'w+b'
+        self.arquivo = open(caminho, modo)
+        if os.path.getsize(caminho) != self.tamanho_total:
+            self.arquivo.truncate(self.tamanho_total)
+        self.mapa = mmap.mmap(self.arquivo.fileno(), self.tamanho_total) if self.tamanho_total else None
+
+    def limites_peca(self, id_peca):
+        """Retorna (inicio, fim) em bytes da peça dentro do arquivo. A última peça pode ser menor."""
+        inicio = id_peca * self.tamanho_peca
+        return inicio, min(inicio + self.tamanho_peca, self.tamanho_total)
+
+    def ler_peca(self, id_peca):
+        """Retorna uma memoryview da peça diretamente sobre o mmap, sem cópia."""
+        inicio, fim = self.limites_peca(id_peca)
+        return memoryview(self.mapa)[inicio:fim]
+
+    def fatias(self, id_peca, inicio=0, fim=None, tamanho_fatia=TAMANHO_FATIA_ENVIO):
+        """
+        Gera os bytes [inicio, fim) da peça em fatias de até `tamanho_fatia` bytes, cortadas do mmap.
+        O servidor WSGI exige `bytes`, por isso cada fatia é copiada; a memória usada fica limitada a uma fatia.
+        """
+        visao = self.ler_peca(id_peca)
+        fim = len(visao) if fim is None else fim
+        for posicao in range(inicio, fim, tamanho_fatia):
+            yield visao[posicao:min(posicao + tamanho_fatia, fim)].tobytes()
+
+    def verificar_peca(self, id_peca, dados):
+        """Confere o tamanho e o hash de `dados` contra o metainfo."""
+        if not 0 <= id_peca < self.total_de_pecas:
+            return False
+        inicio, fim = self.limites_peca(id_peca)
+        if len(dados) != fim - inicio:
+            return False
+        return hashlib.new(self.metainfo['hash_algorithm'], dados).hexdigest() == self.metainfo['pieces'][id_peca]
+
+    def gravar_peca(self, id_peca, dados, deslocamento=0):
+        """Grava os bytes de uma peça (ou de uma parte dela, a partir de `deslocamento`) na sua posição no arquivo."""
+        inicio = self.limites_peca(id_peca)[0] + deslocamento
+        self.mapa[inicio:inicio + len(dados)] = dados
+
+    def sincronizar(self):
+        """Descarrega para o disco as peças gravadas no mmap."""
+        if self.mapa is not None:
+            self.mapa.flush()
+
+    def fechar(self):
+        """Descarrega o mmap para o disco e fecha o arquivo."""
+        if self.mapa is not None:
+            self.mapa.flush()
+            self.mapa.close()
+        self.arquivo.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Gera o metainfo (hashes das peças) de um arquivo.')
+    parser.add_argument('arquivo')
+    parser.add_argument('--tamanho-peca', type=int, default=TAMANHO_PECA_PADRAO)
+    parser.add_argument('--algoritmo', choices=['sha1', 'sha256'], default=ALGORITMO_PADRAO)
+    parser.add_argument('--saida', help='Caminho do metainfo (padrão: <arquivo>.minibit.json).')
+    args = parser.parse_args()
+
+    metainfo = gerar_metainfo(args.arquivo, args.tamanho_peca, args.algoritmo)
+    caminho_saida = args.saida or f'{args.arquivo}.minibit.json'
+    salvar_metainfo(metainfo, caminho_saida)
+    print(f"{len(metainfo['pieces'])} peças de {args.tamanho_peca} bytes. Metainfo salvo em {caminho_saida}")
@@ -0,0 +1,241 @@
+import atexit
+import bisect
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# Métricas em memória do tracker e dos peers, expostas na rota '/metrics' no formato de texto do Prometheus.
+# Contadores, medidores e histogramas com rótulos; cada atualização custa um lock curto e nenhuma alocação
+# fora da primeira vez de cada combinação de rótulos. Inclui também os dois remédios para o custo dos logs
+# nos caminhos quentes: escrita em segundo plano (`registrar_em_segundo_plano`) e amostragem (`LogAmostrado`).
+
+TIPO_CONTEUDO = 'text/plain; version=0.0.4; charset=utf-8'
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)   # Segundos.
+LIMITES_LOCK = (0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)                                   # Segundos.
+INTERVALO_AMOSTRA_LOG = 1.0   # Segundos: cada tipo de mensagem amostrada é escrita no máximo uma vez neste intervalo.
+
+
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatar_numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metrica:
+    """Base das métricas: nome, texto de ajuda, nomes dos rótulos e os valores por combinação de rótulos."""
+
+    tipo = 'untyped'
+
+    def __init__(self, nome, ajuda, rotulos=(), funcao=None):
+        """Com `funcao`, os valores são lidos na hora da exposição: ela retorna {(rótulos...): valor} ou um número."""
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.funcao = funcao
+        self.valores = {}
+        self.lock = threading.Lock()
+
+    def amostras(self):
+        if self.funcao is None:
+            with self.lock:
+                return list(self.valores.items())
+        valores = self.funcao()
+        return list(valores.items()) if isinstance(valores, dict) else [((), valores)]
+
+    def texto(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} {self.tipo}']
+        for rotulos, valor in sorted(self.amostras(), key=lambda item: tuple(map(str, item[0]))):
+            linhas.append(f'{self.nome}{_formatar_rotulos(self.rotulos, rotulos)} {_formatar_numero(valor)}')
+        return linhas
+
+
+class Contador(Metrica):
+    """Valor que só cresce (pedidos, bytes, eventos). O Prometheus deriva as taxas com rate()."""
+
+    tipo = 'counter'
+
+    def incrementar(self, *rotulos, valor=1):
+        with self.lock:
+            self.valores[rotulos] = self.valores.get(rotulos, 0) + valor
+
+
+class Medidor(Metrica):
+    """Valor que sobe e desce (pedidos em voo, peers ativos)."""
+
+    tipo = 'gauge'
+
+    def definir(self, *rotulos, valor):
+        with self.lock:
+            self.valores[rotulos] = valor
+
+
+class Histograma(Metrica):
+    """Distribuição de valores (latências, tempos de lock) em baldes cumulativos, com soma e contagem."""
+
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos=(), limites=LIMITES_LATENCIA):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(limites)
+
+    def observar(self, valor, *rotulos):
+        indice = bisect.bisect_left(self.limites, valor)
+        with self.lock:
+            estado = self.valores.get(rotulos)
+            if estado is None:
+                # [contagem por balde (o último é +Inf), soma, total]
+                estado = self.valores[rotulos] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            estado[0][indice] += 1
+            estado[1] += valor
+            estado[2] += 1
+
+    def texto(self):
+        linhas = [f'# HELP {self.nome} {self.ajuda}', f'# TYPE {self.nome} {self.tipo}']
+        with self.lock:
+            copia = {rotulos: (list(baldes), soma, total) for rotulos, (baldes, soma, total) in self.valores.items()}
+        for rotulos in sorted(copia, key=lambda r: tuple(map(str, r))):
+            baldes, soma, total = copia[rotulos]
+            acumulado = 0
+            for limite, contagem in zip(self.limites + (float('inf'),), baldes):
+                acumulado += contagem
+                rotulo_le = f'le="{_formatar_numero(float(limite))}"'
+                linhas.append(f'{self.nome}_bucket{_formatar_rotulos(self.rotulos, rotulos, rotulo_le)} {acumulado}')
+            linhas.append(f'{self.nome}_sum{_formatar_rotulos(self.rotulos, rotulos)} {_formatar_numero(soma)}')
+            linhas.append(f'{self.nome}_count{_formatar_rotulos(self.rotulos, rotulos)} {total}')
+        return linhas
+
+
+class RegistroMetricas:
+    """Conjunto das métricas de um processo (tracker) ou de um peer, na ordem em que foram criadas."""
+
+    def __init__(self):
+        self.metricas = []
+
+    def _acrescentar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, ajuda, rotulos=(), funcao=None):
+        return self._acrescentar(Contador(nome, ajuda, rotulos, funcao))
+
+    def medidor(self, nome, ajuda, rotulos=(), funcao=None):
+        return self._acrescentar(Medidor(nome, ajuda, rotulos, funcao))
+
+    def histograma(self, nome, ajuda, rotulos=(), limites=LIMITES_LATENCIA):
+        return self._acrescentar(Histograma(nome, ajuda, rotulos, limites))
+
+    def texto(self):
+        """Todas as métricas no formato de exposição de texto do Prometheus (versão 0.0.4)."""
+        linhas = []
+        for metrica in self.metricas:
+            linhas.extend(metrica.texto())
+        return '\n'.join(linhas) + '\n'
+
+
+class LockMedido:
+    """
+    Envolve um lock e mede, em dois histogramas, quanto tempo cada uso esperou para entrar e quanto tempo o
+    manteve. Aceita um `threading.Lock` ou um `LockLeituraEscrita` (cujo `leitura()` também é medido).
+    Os tempos são registados depois de o lock ser libertado, para não alongar a posse.
+    """
+
+    def __init__(self, lock, espera, posse, nome):
+        self.lock = lock
+        self.espera = espera
+        self.posse = posse
+        self.nome = nome
+        self.modo = 'escrita' if hasattr(lock, 'leitura') else 'exclusivo'
+        self.adquirido_em = 0.0   # Só um escritor de cada vez, por isso um único campo basta.
+        self.espera_atual = 0.0
+
+    def __enter__(self):
+        inicio = time.perf_counter()
+        self.lock.__enter__()
+        self.adquirido_em = time.perf_counter()
+        self.espera_atual = self.adquirido_em - inicio
+        return self
+
+    def __exit__(self, *excecao):
+        espera, posse = self.espera_atual, time.perf_counter() - self.adquirido_em
+        self.lock.__exit__(*excecao)
+        self.espera.observar(espera, self.nome, self.modo)
+        self.posse.observar(posse, self.nome, self.modo)
+
+    @contextmanager
+    def leitura(self):
+        inicio = time.perf_counter()
+        with self.lock.leitura():
+            adquirido = time.perf_counter()
+            try:
+                yield
+            finally:
+                posse = time.perf_counter() - adquirido
+        self.espera.observar(adquirido - inicio, self.nome, 'leitura')
+        self.posse.observar(posse, self.nome, 'leitura')
+
+
+def metricas_de_lock(registro, prefixo):
+    """Cria o par de histogramas (espera, posse) de locks, com os rótulos 'lock' e 'modo'."""
+    espera = registro.histograma(f'{prefixo}_lock_espera_segundos', 'Tempo à espera de adquirir o lock.',
+                                 ('lock', 'modo'), LIMITES_LOCK)
+    posse = registro.histograma(f'{prefixo}_lock_posse_segundos', 'Tempo com o lock adquirido.',
+                                ('lock', 'modo'), LIMITES_LOCK)
+    return espera, posse
+
+
+def registrar_em_segundo_plano(log):
+    """
+    Passa os manipuladores de `log` (consola, ficheiro) para uma thread própria: quem regista uma mensagem só a
+    põe numa fila, sem esperar pela escrita. Os registos pendentes são escritos ao terminar o processo.
+    """
+    manipuladores = list(log.handlers)
+    if not manipuladores:
+        return None
+    fila = queue.SimpleQueue()
+    for manipulador in manipuladores:
+        log.removeHandler(manipulador)
+    log.addHandler(logging.handlers.QueueHandler(fila))
+    ouvinte = logging.handlers.QueueListener(fila, *manipuladores, respect_handler_level=True)
+    ouvinte.start()
+    atexit.register(ouvinte.stop)
+    return ouvinte
+
+
+class LogAmostrado:
+    """
+    Regista as mensagens de um caminho quente no máximo uma vez por `intervalo` segundos por chave (por
+    exemplo, 'bloco enviado'), indicando quantas foram omitidas desde a anterior. As métricas contam todas.
+    """
+
+    def __init__(self, log, intervalo=INTERVALO_AMOSTRA_LOG):
+        self.log = log
+        self.intervalo = intervalo
+        self.ultima = {}       # {chave: instante da última mensagem escrita}.
+        self.omitidas = {}     # {chave: mensagens omitidas desde então}.
+        self.lock = threading.Lock()
+
+    def registrar(self, chave, nivel, mensagem):
+        agora = time.monotonic()
+        with self.lock:
+            if agora - self.ultima.get(chave, float('-inf')) < self.intervalo:
+                self.omitidas[chave] = self.omitidas.get(chave, 0) + 1
+                return
+            self.ultima[chave] = agora
+            omitidas = self.omitidas.pop(chave, 0)
+        if omitidas:
+            mensagem = f"{mensagem} (+{omitidas} semelhantes omitidas)"
+        self.log.log(nivel, mensagem)
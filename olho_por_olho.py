@@ -0,0 +1,146 @@
+import math
+import random
+import time
+
+# Choker baseado em taxas medidas (tit-for-tat): cada peer remoto tem contadores móveis dos bytes que nos
+# enviou e dos que lhe enviámos, com decaimento exponencial. Enquanto baixa, o peer desbloqueia quem mais
+# lhe envia; como semeador, desbloqueia para quem envia mais depressa, rodando as vagas para ser justo.
+# Um peer em vários enxames reparte entre eles um total de vagas de upload (`repartir_vagas`).
+
+VAGAS_UPLOAD = 4                  # Peers desbloqueados pela taxa, além do desbloqueio otimista.
+CONSTANTE_TEMPO = 20.0            # Segundos: janela aproximada das taxas móveis (EWMA).
+RODADAS_OTIMISTA = 3              # O desbloqueio otimista muda a cada este número de rodadas.
+RODADAS_MAXIMAS_SEMEADOR = 3      # Como semeador, um peer desbloqueado há tantas rodadas cede a vaga a quem espera.
+VALIDADE_INTERESSE = 30.0         # Segundos desde o último pedido durante os quais um peer conta como interessado.
+
+
+def repartir_vagas(total, interessados):
+    """
+    Reparte `total` vagas de upload entre enxames. `interessados` mapeia cada enxame ao número de peers
+    interessados nele. As vagas são dadas uma a uma, de forma max-min justa, aos enxames com interessados ainda
+    sem vaga; as que sobram ficam livres em todos os enxames, para atender logo quem pedir antes da próxima rodada.
+    """
+    vagas = {chave: 0 for chave in interessados}
+    restantes = total
+    while restantes and vagas:
+        com_procura = sorted((chave for chave in vagas if vagas[chave] < interessados[chave]), key=vagas.get)
+        if not com_procura:
+            break
+        for chave in com_procura[:restantes]:
+            vagas[chave] += 1
+            restantes -= 1
+    chaves = list(vagas)
+    for indice in range(restantes if chaves else 0):
+        vagas[chaves[indice % len(chaves)]] += 1
+    return vagas
+
+
+class TaxaMovel:
+    """
+    Taxa em bytes/s com decaimento exponencial: cada byte conta com peso exp(-idade / constante_tempo).
+    Registrar e ler custam O(1) e não exigem uma thread a amostrar periodicamente.
+    """
+
+    def __init__(self, constante_tempo=CONSTANTE_TEMPO):
+        self.constante_tempo = constante_tempo
+        self.taxa = 0.0
+        self.instante = None
+
+    def _decair(self, agora):
+        if self.instante is not None and agora > self.instante:
+            self.taxa *= math.exp(-(agora - self.instante) / self.constante_tempo)
+        self.instante = agora if self.instante is None else max(self.instante, agora)
+
+    def registrar(self, num_bytes, agora):
+        self._decair(agora)
+        self.taxa += num_bytes / self.constante_tempo
+
+    def valor(self, agora):
+        self._decair(agora)
+        return self.taxa
+
+
+class OlhoPorOlho:
+    """Mede as taxas de upload e download por peer e decide, a cada rodada, quem fica desbloqueado."""
+
+    def __init__(self, vagas_upload=VAGAS_UPLOAD, constante_tempo=CONSTANTE_TEMPO, gerador=None):
+        self.vagas_upload = vagas_upload
+        self.constante_tempo = constante_tempo
+        self.gerador = gerador or random.Random()
+
+        self.taxas_download = {}          # {id_peer: TaxaMovel} dos bytes recebidos desse peer.
+        self.taxas_upload = {}            # {id_peer: TaxaMovel} dos bytes enviados a esse peer.
+        self.ultimo_pedido = {}           # {id_peer: instante} do último pedido de bloco (aceito ou não).
+        self.rodadas_desbloqueado = {}    # {id_peer: rodadas seguidas} com vaga pela taxa.
+        self.desbloqueados = set()        # Peers desbloqueados pela taxa.
+        self.otimista = None              # Peer desbloqueado ao acaso, para descobrir fontes melhores.
+        self.rodada = 0
+
+    # --- Medição ---
+
+    def registrar_download(self, id_peer, num_bytes, agora=None):
+        """Conta `num_bytes` recebidos de `id_peer`."""
+        agora = time.monotonic() if agora is None else agora
+        self.taxas_download.setdefault(id_peer, TaxaMovel(self.constante_tempo)).registrar(num_bytes, agora)
+
+    def registrar_upload(self, id_peer, num_bytes, agora=None):
+        """Conta `num_bytes` enviados a `id_peer`."""
+        agora = time.monotonic() if agora is None else agora
+        self.taxas_upload.setdefault(id_peer, TaxaMovel(self.constante_tempo)).registrar(num_bytes, agora)
+
+    def registrar_pedido(self, id_peer, agora=None):
+        """Marca `id_peer` como interessado: ele pediu-nos um bloco."""
+        self.ultimo_pedido[id_peer] = time.monotonic() if agora is None else agora
+        # Enquanto houver vagas livres, não é preciso esperar pela próxima rodada.
+        if not self.esta_desbloqueado(id_peer) and len(self.desbloqueados) < self.vagas_upload:
+            self.desbloqueados.add(id_peer)
+
+    def taxa_download(self, id_peer, agora=None):
+        taxa = self.taxas_download.get(id_peer)
+        return taxa.valor(time.monotonic() if agora is None else agora) if taxa else 0.0
+
+    def taxa_upload(self, id_peer, agora=None):
+        taxa = self.taxas_upload.get(id_peer)
+        return taxa.valor(time.monotonic() if agora is None else agora) if taxa else 0.0
+
+    def remover_peer(self, id_peer):
+        """Esquece um peer que saiu da rede."""
+        for estado in (self.taxas_download, self.taxas_upload, self.ultimo_pedido, self.rodadas_desbloqueado):
+            estado.pop(id_peer, None)
+        self.desbloqueados.discard(id_peer)
+        if self.otimista == id_peer:
+            self.otimista = None
+
+    # --- Decisão ---
+
+    def esta_desbloqueado(self, id_peer):
+        return id_peer in self.desbloqueados or id_peer == self.otimista
+
+    def interessados(self, agora):
+        """Peers que nos pediram algum bloco nos últimos `VALIDADE_INTERESSE` segundos."""
+        return [p for p, instante in self.ultimo_pedido.items() if agora - instante <= VALIDADE_INTERESSE]
+
+    def executar_rodada(self, semeando, agora=None):
+        """
+        Recalcula os desbloqueados entre os peers interessados. A baixar, escolhe as `vagas_upload` maiores
+        taxas de download (quem mais nos envia). Como semeador, escolhe as maiores taxas de upload, mas um peer
+        com `RODADAS_MAXIMAS_SEMEADOR` rodadas seguidas passa para o fim da fila, para que todos recebam.
+        O desbloqueio otimista muda a cada `RODADAS_OTIMISTA` rodadas (ou se o escolhido perdeu o interesse).
+        Retorna (desbloqueados, otimista).
+        """
+        agora = time.monotonic() if agora is None else agora
+        candidatos = self.interessados(agora)
+        # O sorteio prévio desempata ao acaso peers com a mesma taxa (por exemplo, todos a zero).
+        self.gerador.shuffle(candidatos)
+        if semeando:
+            chave = lambda p: (self.rodadas_desbloqueado.get(p, 0) >= RODADAS_MAXIMAS_SEMEADOR, -self.taxa_upload(p, agora))
+        else:
+            chave = lambda p: -self.taxa_download(p, agora)
+        self.desbloqueados = set(sorted(candidatos, key=chave)[:self.vagas_upload])
+        self.rodadas_desbloqueado = {p: self.rodadas_desbloqueado.get(p, 0) + 1 for p in self.desbloqueados}
+
+        if self.rodada % RODADAS_OTIMISTA == 0 or self.otimista not in candidatos or self.otimista in self.desbloqueados:
+            restantes = [p for p in candidatos if p not in self.desbloqueados]
+            self.otimista = self.gerador.choice(restantes) if restantes else None
+        self.rodada += 1
+        return set(self.desbloqueados), self.otimista
@@ -1,27 +1,118 @@
 import requests
 import threading
 import time
-import random
 import logging
-from flask import Flask, request, jsonify
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import Flask, Response, g, request, jsonify
+
+import janela_pedidos
+from bitfield import codificar_bitfield, decodificar_bitfield
+from conexoes import GerenciadorConexoes
+from metainfo import ArmazenamentoPecas
+from metricas import TIPO_CONTEUDO, LockMedido, LogAmostrado, RegistroMetricas, metricas_de_lock, registrar_em_segundo_plano
+from olho_por_olho import OlhoPorOlho, TaxaMovel, VAGAS_UPLOAD, repartir_vagas
+from persistencia import escrever_atomico, ler_json
+from seletor_pecas import SeletorDePecas
+from sincronizacao import LimitadorDeBanda
 
 # URL base do servidor rastreador (tracker).
 URL_RASTREADOR = 'http://127.0.0.1:5000'
 
+# Limites padrão de pedidos simultâneos (janela de pedidos em voo).
+MAX_PEDIDOS_POR_PEER = 4        # Pedidos simultâneos para um mesmo peer remoto.
+MAX_PEDIDOS_TOTAL = 16          # Pedidos simultâneos no total, somando todos os enxames.
+TIMEOUT_PEDIDO = 5              # Segundos até um pedido de bloco ser considerado perdido.
+ESPERA_APOS_CHOKE = 3           # Segundos sem pedir a um peer depois de ele nos recusar (403).
+INTERVALO_ANNOUNCE_PADRAO = 10  # Segundos entre announces ao tracker até ele indicar o seu próprio intervalo.
+TAMANHO_PARTE = 256 * 1024      # Peças maiores do que isto são pedidas em partes (cabeçalho Range), possivelmente a fontes diferentes.
+TIMEOUT_AVISO = 2               # Segundos de espera ao trocar bitfields e avisos 'have' com outros peers.
+LIMIAR_ENDGAME = 4              # Com esta quantidade de peças em falta (ou menos), entra em modo endgame.
+FONTES_ENDGAME = 3              # No endgame, cada parte pode ser pedida a até este número de fontes ao mesmo tempo.
+TAMANHO_LEITURA = 64 * 1024     # Bytes lidos por vez de uma resposta; no endgame, verifica entre leituras se ainda vale a pena.
+INTERVALO_CHOKE = 10            # Segundos entre rodadas do choker (tit-for-tat por taxa medida).
+INTERVALO_RETOMADA = 5          # Segundos entre gravações do ficheiro de retomada (bitfield das peças já gravadas).
+
+
+def have_invalido(dados):
+    """
+    Retorna a mensagem de erro de um aviso 'have' mal formado, ou None se for válido. O seletor compara
+    'block_id' com o número de peças, por isso só aceita inteiros (bool é int em Python, mas não é um bloco).
+    """
+    if not isinstance(dados, dict):
+        return 'O corpo deve ser um objeto JSON'
+    if not isinstance(dados.get('peer_id'), str) or not dados['peer_id']:
+        return "'peer_id' é obrigatório"
+    if type(dados.get('block_id')) is not int:
+        return "'block_id' deve ser um inteiro"
+    return None
+
+
+class EnxameLocal:
+    """Estado do peer num enxame: as peças de um ficheiro, os peers que o partilham e o progresso do download."""
+
+    def __init__(self, armazenamento, vagas_upload=VAGAS_UPLOAD):
+        self.info_hash = armazenamento.metainfo['info_hash']
+        self.nome = armazenamento.metainfo['name']
+        self.armazenamento = armazenamento       # Peças do ficheiro em disco (mmap).
+        self.total_de_blocos = armazenamento.total_de_pecas  # Número total de blocos que compõem o arquivo.
+        self.meus_blocos = set()                 # Conjunto de IDs dos blocos que o peer possui.
+        self.peers_conhecidos = {}               # Dicionário de peers do enxame {id_peer: endereco}.
+        self.olho_por_olho = OlhoPorOlho(vagas_upload)  # Taxas por peer e escolha de quem recebe upload (unchoke).
+        self.semeando = False                    # Torna-se True quando o peer tem todos os blocos.
+        self.seq_atualizacao = 0                 # Número de sequência da última atualização 'have' enviada ao tracker.
+        self.blocos_a_anunciar = set()           # Blocos obtidos desde o último announce aceito, enviados juntos no próximo.
+        self.intervalo_announce = INTERVALO_ANNOUNCE_PADRAO             # 'interval' indicado pelo tracker.
+        self.intervalo_minimo_announce = INTERVALO_ANNOUNCE_PADRAO // 2 # 'min_interval' indicado pelo tracker.
+        self.proximo_announce = 0                # Instante a partir do qual o próximo announce periódico é feito.
+        self.bytes_baixados = 0                  # Bytes de partes recebidas de outros peers e gravadas.
+        self.bytes_servidos = 0                  # Bytes de blocos servidos a outros peers.
+        self.pedidos_em_voo = {}                 # Partes pedidas e ainda sem resposta {(id_bloco, parte): {fontes}}.
+        self.pedidos_por_peer = {}               # Número de pedidos em voo para cada peer remoto.
+        self.recusas_ate = {}                    # Instante até o qual não se pede nada a um peer que nos recusou.
+        self.inicio_endgame = None               # Instante em que o modo endgame começou (None fora dele).
+        self.bytes_duplicados = 0                # Bytes recebidos de partes que outra fonte já tinha entregado.
+        self.pedidos_cancelados = 0              # Pedidos duplicados interrompidos antes do fim no endgame.
+        self.pecas_a_verificar = set()           # Peças retomadas do disco cujo hash só é conferido quando forem pedidas.
+        self.retomada_pendente = False           # Há peças novas ainda fora do ficheiro de retomada.
+        self.proxima_retomada = 0                # Instante da próxima gravação do ficheiro de retomada.
+
+        # Seletor local de peças (raridade a partir dos bitfields dos outros peers).
+        partes_por_peca = []
+        for id_bloco in range(self.total_de_blocos):
+            inicio, fim = armazenamento.limites_peca(id_bloco)
+            partes_por_peca.append(-(-(fim - inicio) // TAMANHO_PARTE))
+        self.seletor = SeletorDePecas(partes_por_peca)
+
+    def completo(self):
+        return len(self.meus_blocos) >= self.total_de_blocos
+
+    @property
+    def caminho_retomada(self):
+        return f'{self.armazenamento.caminho}.retomada.json'
+
+
 class Peer:
-    """Representa um cliente na rede de compartilhamento de arquivos."""
-    
-    def __init__(self, id_peer, porta):
+    """Representa um cliente na rede de compartilhamento de arquivos, participando de um ou mais enxames."""
+
+    def __init__(self, id_peer, porta, max_pedidos_por_peer=MAX_PEDIDOS_POR_PEER, max_pedidos_total=MAX_PEDIDOS_TOTAL, pasta_dados=None,
+                 limiar_endgame=LIMIAR_ENDGAME, fontes_endgame=FONTES_ENDGAME, vagas_upload=VAGAS_UPLOAD, banda_upload=0):
         """Inicializa um novo peer."""
         self.id_peer = id_peer
         self.endereco = f'http://127.0.0.1:{porta}'
-        self.meus_blocos = set()                 # Conjunto de IDs dos blocos que o peer possui.
-        self.total_de_blocos = -1                # Número total de blocos que compõem o arquivo.
-        self.peers_conhecidos = {}               # Dicionário de peers na rede {id_peer: endereco}.
-        self.peers_desbloqueados = set()         # Conjunto de peers para os quais este peer fará upload (unchoke fixo).
-        self.peer_otimista_desbloqueado = None   # Peer escolhido aleatoriamente para upload (unchoke otimista).
-        self.semeando = False                    # Torna-se True quando o peer tem todos os blocos.
-        self.lock = threading.Lock()             # Lock para garantir a segurança em operações concorrentes.
+        self.pasta_dados = pasta_dados or f'dados_{id_peer}'  # Pasta onde os ficheiros baixados são pré-alocados.
+        self.enxames = {}                        # Enxames em que o peer participa {info_hash: EnxameLocal}.
+        self.vagas_upload = vagas_upload         # Vagas de upload do peer, repartidas entre os enxames a cada rodada do choker.
+        # Teto de upload em bytes/s, somando todos os enxames (0 = sem limite).
+        self.limitador = LimitadorDeBanda(banda_upload) if banda_upload else None
+        self.bytes_enviados_rastreador = 0       # Bytes de announces e atualizações de blocos enviados ao tracker.
+        self.max_pedidos_por_peer = max_pedidos_por_peer
+        self.max_pedidos_total = max_pedidos_total
+        self.limiar_endgame = limiar_endgame     # 0 desativa o modo endgame.
+        self.fontes_endgame = fontes_endgame
+        self.configurar_metricas()
+        # Lock para garantir a segurança em operações concorrentes; mede a espera e a posse (minibit_peer_lock_*).
+        self.lock = LockMedido(threading.Lock(), *metricas_de_lock(self.metricas, 'minibit_peer'), 'peer')
 
         # Configuração do sistema de logs para exibir mensagens no console.
         self.log = logging.getLogger(self.id_peer)
@@ -38,244 +129,739 @@ class Peer:
         self.log.addHandler(arquivo_log)
 
         self.log.setLevel(logging.INFO)
-
-        # Inicia um servidor Flask para responder a requisições de outros peers.
+        # A escrita dos logs passa para uma thread própria; as mensagens por bloco são, além disso, amostradas.
+        registrar_em_segundo_plano(self.log)
+        self.log_amostrado = LogAmostrado(self.log)
+
+        self.configurar_rede()
+
+    def configurar_rede(self):
+        """Cria o cliente HTTP (conexões keep-alive) e o servidor que responde aos outros peers."""
+        # Conexões keep-alive por endereço remoto, partilhadas pelos enxames; o tracker recebe pedidos de várias threads e ganha um pool maior.
+        self.conexoes = GerenciadorConexoes(tamanho_pool=self.max_pedidos_por_peer,
+                                            tamanhos_especificos={URL_RASTREADOR: self.max_pedidos_total})
+        self.executor_avisos = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f'{self.id_peer}-avisos')  # Envia os avisos 'have' sem travar o download.
+        # Inicia um único servidor Flask, para todos os enxames, para responder a requisições de outros peers.
         self.app = Flask(__name__)
         self.configurar_rotas()
 
+    def configurar_metricas(self):
+        """Cria as métricas do peer, expostas em '/metrics'. As que leem o estado dos enxames são calculadas na exposição."""
+        self.metricas = RegistroMetricas()
+        self.latencia_por_endpoint = self.metricas.histograma(
+            'minibit_peer_pedido_segundos', 'Tempo de atendimento dos pedidos recebidos, por endpoint.', ('endpoint',))
+        self.latencia_de_blocos = self.metricas.histograma(
+            'minibit_peer_pedido_bloco_segundos', 'Duração dos pedidos de bloco feitos a outros peers, por resultado.', ('resultado',))
+        self.pedidos_servidos = self.metricas.contador(
+            'minibit_peer_pedidos_servidos_total', "Pedidos de bloco recebidos, por resultado ('ok', 'choked', 'nao_encontrado').",
+            ('resultado',))
+        self.bytes_enviados = self.metricas.contador(
+            'minibit_peer_bytes_enviados_total', 'Bytes de blocos enviados, por peer remoto.', ('peer',))
+        self.bytes_recebidos = self.metricas.contador(
+            'minibit_peer_bytes_recebidos_total', 'Bytes de blocos recebidos, por peer remoto.', ('peer',))
+        self.pecas_recebidas = self.metricas.contador(
+            'minibit_peer_pecas_total', 'Peças baixadas e verificadas, por enxame.', ('info_hash',))
+        self.eventos_choke = self.metricas.contador(
+            'minibit_peer_eventos_choke_total', "Mudanças do choker ('unchoke', 'choke', 'otimista'), por enxame.",
+            ('info_hash', 'evento'))
+        self.metricas.contador('minibit_peer_bytes_enviados_rastreador_total',
+                               'Bytes dos corpos de announces e atualizações de blocos enviados ao tracker.',
+                               funcao=lambda: self.bytes_enviados_rastreador)
+        self.taxa_pecas = TaxaMovel()   # Peças por segundo, somando os enxames.
+        self.metricas.medidor('minibit_peer_pecas_por_segundo', 'Taxa móvel de peças baixadas e verificadas.',
+                              funcao=lambda: self.taxa_pecas.valor(time.monotonic()))
+        self.metricas.medidor('minibit_peer_pedidos_em_voo', 'Pedidos de bloco em voo, por enxame.', ('info_hash',),
+                              funcao=lambda: {(e.info_hash,): len(e.pedidos_em_voo) for e in list(self.enxames.values())})
+        self.metricas.medidor('minibit_peer_blocos', 'Blocos que o peer tem, por enxame.', ('info_hash',),
+                              funcao=lambda: {(e.info_hash,): len(e.meus_blocos) for e in list(self.enxames.values())})
+
+    def enxame_do_pedido(self, info_hash):
+        """
+        Retorna o enxame local do info-hash, ou None se o peer não participar dele.
+        Sem info-hash, vale o único enxame do peer, para que clientes de um só ficheiro continuem a funcionar.
+        """
+        with self.lock:
+            if info_hash is None and len(self.enxames) == 1:
+                return next(iter(self.enxames.values()))
+            return self.enxames.get(info_hash)
+
     def configurar_rotas(self):
-        
+
+        @self.app.before_request
+        def marcar_inicio_pedido():
+            g.inicio_pedido = time.perf_counter()
+
+        # A latência de '/request_block' inclui apenas a montagem da resposta; os bytes seguem depois, em fatias.
+        @self.app.after_request
+        def medir_pedido(resposta):
+            endpoint = request.url_rule.rule if request.url_rule else request.path
+            self.latencia_por_endpoint.observar(time.perf_counter() - g.inicio_pedido, endpoint)
+            return resposta
+
         # Rota para que outros peers possam solicitar um bloco.
         @self.app.route('/request_block/<int:id_bloco>', methods=['GET'])
         def servir_bloco(id_bloco):
             id_peer_solicitante = request.args.get('peer_id')
+            enxame = self.enxame_do_pedido(request.args.get('info_hash'))
+            if enxame is None:
+                return jsonify({'error': 'Enxame desconhecido'}), 404
+            # O lock cobre apenas as verificações; a leitura e o envio dos bytes acontecem fora dele.
+            with self.lock:
+                semeando = enxame.semeando
+                # Todo pedido marca o solicitante como interessado, mesmo que seja recusado.
+                enxame.olho_por_olho.registrar_pedido(id_peer_solicitante)
+                esta_desbloqueado = enxame.olho_por_olho.esta_desbloqueado(id_peer_solicitante)
+                tem_bloco = id_bloco in enxame.meus_blocos
+
+            # Baixando ou semeando, só os peers desbloqueados pelo choker recebem blocos.
+            if not esta_desbloqueado:
+                self.pedidos_servidos.incrementar('choked')
+                self.log_amostrado.registrar('recusa', logging.WARNING,
+                                             f"Rejeitando pedido do bloco {id_bloco} de {enxame.nome} de {id_peer_solicitante} (choked).")
+                return jsonify({'error': 'choked'}), 403
+
+            if not tem_bloco or not self.confirmar_peca(enxame, id_bloco):
+                self.pedidos_servidos.incrementar('nao_encontrado')
+                return jsonify({'error': 'Bloco não encontrado'}), 404
+
+            # Uma peça presente em `meus_blocos` já foi verificada e não muda mais, então pode ser lida sem o lock.
+            self.pedidos_servidos.incrementar('ok')
+            self.log_amostrado.registrar('envio', logging.INFO,
+                                         f"{'Semeando: ' if semeando else ''}Enviando bloco {id_bloco} de {enxame.nome} para {id_peer_solicitante}")
+            return self.resposta_bloco(enxame, id_bloco, id_peer_solicitante)
+
+        # Rota para que outros peers obtenham o conjunto de blocos deste peer num enxame.
+        @self.app.route('/bitfield', methods=['GET'])
+        def servir_bitfield():
+            enxame = self.enxame_do_pedido(request.args.get('info_hash'))
+            if enxame is None:
+                return jsonify({'error': 'Enxame desconhecido'}), 404
+            self.conhecer_peer(enxame, request.args.get('peer_id'), request.args.get('address'))
             with self.lock:
-                # Caso 1: O peer já completou o download (está semeando).
-                if self.semeando:
-                    if id_bloco in self.meus_blocos:
-                        self.log.info(f"Semeando: Enviando bloco {id_bloco} para {id_peer_solicitante}")
-                        return jsonify({'block_id': id_bloco, 'data': f'Dados do bloco {id_bloco}'})
-                    else:
-                        return jsonify({'error': 'Bloco não encontrado'}), 404
-
-                # Caso 2: O peer ainda está baixando. Aplica a lógica de unchoke.
-                # Verifica se o solicitante está na lista de desbloqueados ou é o otimista.
-                esta_desbloqueado = id_peer_solicitante in self.peers_desbloqueados or id_peer_solicitante == self.peer_otimista_desbloqueado
-                
-                if not esta_desbloqueado:
-                    self.log.warning(f"Rejeitando pedido do bloco {id_bloco} de {id_peer_solicitante} (choked).")
-                    return jsonify({'error': 'choked'}), 403
-
-                # Se estiver desbloqueado, envia o bloco.
-                if id_bloco in self.meus_blocos:
-                    self.log.info(f"Enviando bloco {id_bloco} para {id_peer_solicitante}")
-                    return jsonify({'block_id': id_bloco, 'data': f'Dados do bloco {id_bloco}'})
-                else:
-                    return jsonify({'error': 'Bloco não encontrado'}), 404
+                campo = codificar_bitfield(enxame.meus_blocos, enxame.total_de_blocos)
+            return jsonify({'peer_id': self.id_peer, 'info_hash': enxame.info_hash, 'bitfield': campo})
+
+        # Rota com estatísticas locais de cada enxame (custo do endgame, taxas) e a reutilização de conexões.
+        @self.app.route('/stats', methods=['GET'])
+        def servir_estatisticas():
+            return jsonify(self.estatisticas())
+
+        # Rota para que outros peers anunciem que obtiveram um novo bloco.
+        @self.app.route('/have', methods=['POST'])
+        def receber_have():
+            dados = request.json
+            erro = have_invalido(dados)
+            if erro:
+                return jsonify({'error': erro}), 400
+            enxame = self.enxame_do_pedido(dados.get('info_hash'))
+            if enxame is None:
+                return jsonify({'error': 'Enxame desconhecido'}), 404
+            self.conhecer_peer(enxame, dados.get('peer_id'), dados.get('address'))
+            with self.lock:
+                enxame.seletor.registrar_have(dados['peer_id'], dados['block_id'])
+            return jsonify({'status': 'ok'})
+
+        # Rota com as métricas do peer no formato de texto do Prometheus.
+        @self.app.route('/metrics', methods=['GET'])
+        def servir_metricas():
+            return Response(self.metricas.texto(), content_type=TIPO_CONTEUDO)
+
+    def estatisticas(self):
+        """Progresso, endgame e taxas por peer de cada enxame, mais a reutilização das conexões (rota '/stats')."""
+        with self.lock:
+            estatisticas = {'enxames': {
+                enxame.info_hash: {'nome': enxame.nome, 'blocos': len(enxame.meus_blocos), 'total_blocos': enxame.total_de_blocos,
+                                   'semeando': enxame.semeando, 'vagas_upload': enxame.olho_por_olho.vagas_upload,
+                                   'pedidos_em_voo': len(enxame.pedidos_em_voo), 'bytes_duplicados': enxame.bytes_duplicados,
+                                   'pedidos_cancelados': enxame.pedidos_cancelados,
+                                   'taxas': {p: {'download': round(enxame.olho_por_olho.taxa_download(p)),
+                                                 'upload': round(enxame.olho_por_olho.taxa_upload(p))}
+                                             for p in enxame.peers_conhecidos}}
+                for enxame in self.enxames.values()}}
+        estatisticas['conexoes'] = self.conexoes.estatisticas()
+        estatisticas['bytes_enviados_rastreador'] = self.bytes_enviados_rastreador
+        return estatisticas
+
+    def resposta_bloco(self, enxame, id_bloco, id_peer_solicitante):
+        """
+        Monta a resposta com os bytes crus do bloco, transmitidos em fatias direto do mmap.
+        Cada fatia efetivamente enviada conta para a taxa de upload ao solicitante.
+        Suporta um intervalo de bytes (cabeçalho HTTP Range) para que uma peça grande possa ser dividida entre várias fontes.
+        """
+        inicio_peca, fim_peca = enxame.armazenamento.limites_peca(id_bloco)
+        tamanho = fim_peca - inicio_peca
+        cabecalhos = {'Accept-Ranges': 'bytes'}
+
+        if request.range is None:
+            inicio, fim, status = 0, tamanho, 200
+        else:
+            intervalo = request.range.range_for_length(tamanho)
+            if intervalo is None:
+                return Response(status=416, headers={'Content-Range': f'bytes */{tamanho}'})
+            (inicio, fim), status = intervalo, 206
+            cabecalhos['Content-Range'] = f'bytes {inicio}-{fim - 1}/{tamanho}'
+
+        cabecalhos['Content-Length'] = str(fim - inicio)
+        fatias = self.contar_envio(enxame, id_peer_solicitante, enxame.armazenamento.fatias(id_bloco, inicio, fim))
+        return Response(fatias, status=status, mimetype='application/octet-stream', headers=cabecalhos)
+
+    def contar_envio(self, enxame, id_peer, fatias):
+        """
+        Repassa as fatias de uma resposta, contando os bytes à medida que saem para o peer.
+        Com `--banda-upload`, cada fatia passa antes pelo limitador partilhado por todos os enxames.
+        """
+        for fatia in fatias:
+            if self.limitador is not None:
+                self.limitador.consumir(len(fatia))
+            yield fatia
+            with self.lock:
+                enxame.bytes_servidos += len(fatia)
+                enxame.olho_por_olho.registrar_upload(id_peer, len(fatia))
+            self.bytes_enviados.incrementar(id_peer, valor=len(fatia))
 
     def executar_app_flask(self, porta):
         """Executa o servidor Flask em uma thread separada para não bloquear o programa principal."""
+        # Uma linha de acesso por bloco servido pesa mais do que o próprio envio; os pedidos ficam nas métricas.
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
         self.app.run(port=porta, debug=False)
 
-    def mostrar_blocos(self):
+    def mostrar_blocos(self, enxame):
         with self.lock:
-            blocos_ordenados = sorted(self.meus_blocos)
-            self.log.info(f"Blocos atuais ({len(blocos_ordenados)}/{self.total_de_blocos}): {blocos_ordenados}")    
+            blocos_ordenados = sorted(enxame.meus_blocos)
+            self.log.info(f"Blocos atuais de {enxame.nome} ({len(blocos_ordenados)}/{enxame.total_de_blocos}): {blocos_ordenados}")
 
-    def registrar_no_rastreador(self):
-        """Envia uma requisição de registro para o tracker e recebe os blocos iniciais."""
+    def listar_enxames_do_rastreador(self):
+        """Retorna os info-hashes de todos os enxames que o tracker serve."""
         try:
-            dados_envio = {'peer_id': self.id_peer, 'address': self.endereco}
-            resposta = requests.post(f'{URL_RASTREADOR}/register', json=dados_envio, timeout=5)
+            resposta = self.conexoes.get(f'{URL_RASTREADOR}/swarms', timeout=5)
             if resposta.status_code == 200:
-                dados = resposta.json()
-                self.meus_blocos = set(dados['initial_blocks'])
-                self.total_de_blocos = dados['total_blocks']
-                self.log.info(f"Registrado com sucesso. Recebi {len(self.meus_blocos)} blocos. Total na rede: {self.total_de_blocos}")
-                self.mostrar_blocos() # Chamada para mostrar os blocos atuais no console
-                return True
-        except requests.exceptions.RequestException as e:
-            self.log.error(f"Não foi possível registrar no rastreador: {e}")
-        return False
-
-    def atualizar_peers_conhecidos(self):
-        """Solicita ao tracker uma lista de outros peers ativos na rede."""
+                return [enxame['info_hash'] for enxame in resposta.json()]
+            self.log.error(f"Tracker não listou os enxames. Status: {resposta.status_code}")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log.error(f"Não foi possível listar os enxames do rastreador: {e}")
+        return []
+
+    def registrar_no_rastreador(self, info_hash):
+        """
+        Entra no enxame `info_hash`: obtém o metainfo, faz o primeiro announce ('started') e recebe os blocos
+        iniciais e os primeiros peers. Retorna o enxame local, ou None se o registro falhou.
+        """
         try:
-            parametros = {'peer_id': self.id_peer}
-            resposta = requests.get(f'{URL_RASTREADOR}/get_peers', params=parametros, timeout=5)
-            if resposta.status_code == 200:
+            enxame = self.obter_metainfo(info_hash)
+            if enxame is None:
+                return None
+            self.retomar(enxame)
+            self.adicionar_enxame(enxame)
+            dados = self.anunciar_ao_rastreador(enxame, 'started')
+            if dados is None:
                 with self.lock:
-                    self.peers_conhecidos.update(resposta.json())
+                    self.enxames.pop(enxame.info_hash, None)
+                return None
+            if 'bitfield' in dados:
+                blocos_atribuidos = decodificar_bitfield(dados['bitfield'], dados['total_blocks'])
+            else:
+                blocos_atribuidos = set(dados['initial_blocks'])
+            self.baixar_blocos_iniciais(enxame, blocos_atribuidos - enxame.meus_blocos)
+            self.log.info(f"Registrado em {enxame.nome}. Recebi {len(enxame.meus_blocos)} blocos. Total na rede: {enxame.total_de_blocos}")
+            self.mostrar_blocos(enxame) # Chamada para mostrar os blocos atuais no console
+            return enxame
         except requests.exceptions.RequestException as e:
-            self.log.error(f"Não foi possível obter a lista de peers: {e}")
+            self.log.error(f"Não foi possível registrar no rastreador: {e}")
+        return None
+
+    def obter_metainfo(self, info_hash):
+        """Obtém do tracker o metainfo do ficheiro e pré-aloca o armazenamento local das peças. Retorna o novo enxame local."""
+        parametros = {'info_hash': info_hash} if info_hash else {}
+        resposta = self.conexoes.get(f'{URL_RASTREADOR}/metainfo', params=parametros, timeout=5)
+        if resposta.status_code != 200:
+            self.log.error(f"Tracker não forneceu o metainfo de {info_hash}. Status: {resposta.status_code}")
+            return None
+        metainfo = resposta.json()
+        armazenamento = ArmazenamentoPecas(os.path.join(self.pasta_dados, metainfo['name']), metainfo)
+        return EnxameLocal(armazenamento)
+
+    def adicionar_enxame(self, enxame):
+        """Passa a servir e a baixar o enxame, reservando-lhe parte das vagas de upload."""
+        with self.lock:
+            self.enxames[enxame.info_hash] = enxame
+            self.repartir_vagas_upload(time.monotonic())
+
+    def repartir_vagas_upload(self, agora):
+        """Reparte as vagas de upload do peer entre os enxames, conforme os peers interessados em cada um (com o lock)."""
+        interessados = {h: len(e.olho_por_olho.interessados(agora)) for h, e in self.enxames.items()}
+        for info_hash, vagas in repartir_vagas(self.vagas_upload, interessados).items():
+            self.enxames[info_hash].olho_por_olho.vagas_upload = vagas
+
+    def baixar_blocos_iniciais(self, enxame, blocos_atribuidos):
+        """Busca no tracker os bytes dos blocos atribuídos no registro, verificando o hash de cada um."""
+        parametros = {'peer_id': self.id_peer, 'info_hash': enxame.info_hash}
+        for id_bloco in blocos_atribuidos:
+            resposta = self.conexoes.get(f'{URL_RASTREADOR}/request_block/{id_bloco}', params=parametros, timeout=TIMEOUT_PEDIDO)
+            if resposta.status_code != 200 or not self.receber_peca(enxame, id_bloco, resposta.content):
+                self.log.error(f"Não foi possível obter o bloco inicial {id_bloco} de {enxame.nome} do tracker.")
+
+    def retomar(self, enxame):
+        """
+        Lê o ficheiro de retomada do enxame e volta a contar como obtidas as peças que ele marca, sem as baixar
+        nem ler de novo. O hash de cada uma só é conferido quando outro peer a pedir (`confirmar_peca`).
+        """
+        dados = ler_json(enxame.caminho_retomada)
+        if not dados or dados.get('info_hash') != enxame.info_hash:
+            return
+        pecas = decodificar_bitfield(dados['bitfield'], enxame.total_de_blocos)
+        with self.lock:
+            enxame.meus_blocos.update(pecas)
+            enxame.pecas_a_verificar.update(pecas)
+            for id_bloco in pecas:
+                enxame.seletor.marcar_peca_obtida(id_bloco)
+        self.log.info(f"Retomando {enxame.nome} com {len(pecas)}/{enxame.total_de_blocos} blocos já gravados.")
+
+    def salvar_retomada(self, enxame):
+        """
+        Grava (de forma atômica) o bitfield das peças obtidas no ficheiro de retomada, se houver peças novas.
+        O mmap é descarregado antes, para que o ficheiro nunca marque uma peça que ainda não chegou ao disco.
+        """
+        enxame.proxima_retomada = time.time() + INTERVALO_RETOMADA
+        with self.lock:
+            if not enxame.retomada_pendente:
+                return
+            enxame.retomada_pendente = False
+            campo = codificar_bitfield(enxame.meus_blocos, enxame.total_de_blocos)
+        enxame.armazenamento.sincronizar()
+        escrever_atomico(enxame.caminho_retomada, {'info_hash': enxame.info_hash, 'bitfield': campo})
+
+    def confirmar_peca(self, enxame, id_bloco):
+        """
+        Confere o hash de uma peça retomada do disco na primeira vez que ela é pedida. Se não conferir,
+        a peça deixa de contar como obtida e volta a ser baixada. Retorna True se a peça pode ser servida.
+        """
+        with self.lock:
+            if id_bloco not in enxame.pecas_a_verificar:
+                return True
+        correta = enxame.armazenamento.verificar_peca(id_bloco, enxame.armazenamento.ler_peca(id_bloco))
+        with self.lock:
+            enxame.pecas_a_verificar.discard(id_bloco)
+            if not correta:
+                enxame.meus_blocos.discard(id_bloco)
+                enxame.seletor.perder_peca(id_bloco)
+                enxame.semeando = False
+                enxame.retomada_pendente = True
+        if not correta:
+            self.log.error(f"Bloco {id_bloco} de {enxame.nome} retomado do disco não confere com o hash. Será baixado de novo.")
+        return correta
+
+    def receber_peca(self, enxame, id_bloco, dados):
+        """Verifica o hash de uma peça recebida e, se estiver correta, grava-a e passa a anunciá-la."""
+        if not enxame.armazenamento.verificar_peca(id_bloco, dados):
+            self.log.error(f"Bloco {id_bloco} de {enxame.nome} descartado: hash ou tamanho não confere.")
+            return False
+        enxame.armazenamento.gravar_peca(id_bloco, dados)
+        with self.lock:
+            enxame.meus_blocos.add(id_bloco)
+            enxame.seletor.marcar_peca_obtida(id_bloco)
+            enxame.retomada_pendente = True
+        return True
+
+    def limites_parte(self, enxame, id_bloco, parte):
+        """Retorna (inicio, fim) em bytes de uma parte, relativos ao início da peça."""
+        inicio_peca, fim_peca = enxame.armazenamento.limites_peca(id_bloco)
+        inicio = parte * TAMANHO_PARTE
+        return inicio, min(inicio + TAMANHO_PARTE, fim_peca - inicio_peca)
+
+    def receber_parte(self, enxame, id_bloco, parte, dados, id_peer_fonte):
+        """
+        Grava uma parte recebida na sua posição do mmap. Quando a última parte da peça chega,
+        verifica o hash da peça inteira; se conferir, a peça passa a `meus_blocos` e é anunciada.
+        """
+        inicio, fim = self.limites_parte(enxame, id_bloco, parte)
+        if len(dados) != fim - inicio:
+            self.log.error(f"Parte {parte} do bloco {id_bloco} recebida de {id_peer_fonte} com tamanho errado.")
+            return False
+        with self.lock:
+            # No endgame a mesma parte pode chegar de várias fontes: vale a primeira, as outras são descartadas.
+            if enxame.seletor.parte_recebida(id_bloco, parte):
+                enxame.bytes_duplicados += len(dados)
+                return False
+            enxame.armazenamento.gravar_peca(id_bloco, dados, inicio)
+            enxame.bytes_baixados += len(dados)
+            completa = enxame.seletor.marcar_parte_recebida(id_bloco, parte)
+        if not completa:
+            return True
+
+        if not enxame.armazenamento.verificar_peca(id_bloco, enxame.armazenamento.ler_peca(id_bloco)):
+            self.log.error(f"Bloco {id_bloco} de {enxame.nome} descartado: hash não confere.")
+            with self.lock:
+                enxame.seletor.descartar_peca(id_bloco)
+            return False
 
-    def selecionar_bloco_mais_raro(self):
-        """Implementa a estratégia 'Rarest First' para escolher qual bloco baixar."""
-        blocos_faltantes = list(set(range(self.total_de_blocos)) - self.meus_blocos)
-        if not blocos_faltantes:
-            return None, None
+        with self.lock:
+            enxame.meus_blocos.add(id_bloco)
+            enxame.seletor.marcar_peca_obtida(id_bloco)
+            # O tracker só fica a saber no próximo announce; os peers conhecidos são avisados já.
+            enxame.blocos_a_anunciar.add(id_bloco)
+            enxame.retomada_pendente = True
+            self.taxa_pecas.registrar(1, time.monotonic())
+        self.pecas_recebidas.incrementar(enxame.info_hash)
+        self.log_amostrado.registrar('peca', logging.INFO, f"Sucesso! Bloco {id_bloco} de {enxame.nome} recebido de {id_peer_fonte}. "
+                                                           f"Total: {len(enxame.meus_blocos)}/{enxame.total_de_blocos}")
+        self.anunciar_bloco(enxame, id_bloco)
+        return True
+
+    def conhecer_peer(self, enxame, id_peer, endereco):
+        """Acrescenta aos peers conhecidos do enxame um peer que nos contactou diretamente."""
+        if not id_peer or not endereco or id_peer == self.id_peer:
+            return
+        with self.lock:
+            enxame.peers_conhecidos.setdefault(id_peer, endereco)
 
+    def esquecer_peer(self, enxame, id_peer):
+        """Remove um peer inalcançável dos peers conhecidos do enxame e da contagem de disponibilidade."""
+        with self.lock:
+            endereco = enxame.peers_conhecidos.pop(id_peer, None)
+            enxame.seletor.remover_peer(id_peer)
+            enxame.olho_por_olho.remover_peer(id_peer)
+            # As conexões são partilhadas: só são recicladas se nenhum outro enxame usa o mesmo peer.
+            em_uso = any(endereco in e.peers_conhecidos.values() for e in self.enxames.values())
+        if endereco and not em_uso:
+            self.conexoes.descartar(endereco)
+
+    def sincronizar_bitfields(self, enxame):
+        """Obtém o bitfield dos peers conhecidos que ainda não o enviaram. Depois disso, bastam os avisos 'have'."""
+        with self.lock:
+            pendentes = {p: e for p, e in enxame.peers_conhecidos.items() if p not in enxame.seletor.pecas_dos_peers}
+        parametros = {'peer_id': self.id_peer, 'address': self.endereco, 'info_hash': enxame.info_hash}
+        for id_peer, endereco in pendentes.items():
+            try:
+                resposta = self.conexoes.get(f'{endereco}/bitfield', params=parametros, timeout=TIMEOUT_AVISO)
+                if resposta.status_code == 200:
+                    pecas = decodificar_bitfield(resposta.json()['bitfield'], enxame.total_de_blocos)
+                    with self.lock:
+                        enxame.seletor.registrar_bitfield(id_peer, pecas)
+            except requests.exceptions.RequestException:
+                self.log.warning(f"Peer {id_peer} inalcançável ao pedir o bitfield. Removendo dos conhecidos.")
+                self.esquecer_peer(enxame, id_peer)
+
+    def anunciar_bloco(self, enxame, id_bloco):
+        """Envia em segundo plano um aviso 'have' do novo bloco a todos os peers conhecidos do enxame."""
+        with self.lock:
+            enderecos = list(enxame.peers_conhecidos.values())
+        aviso = {'peer_id': self.id_peer, 'address': self.endereco, 'info_hash': enxame.info_hash, 'block_id': id_bloco}
+        for endereco in enderecos:
+            self.executor_avisos.submit(self._enviar_have, endereco, aviso)
+
+    def _enviar_have(self, endereco, aviso):
         try:
-            # Pede ao tracker a informação de quais peers possuem os blocos faltantes.
-            resposta = requests.post(f'{URL_RASTREADOR}/get_block_info', json={'block_ids': blocos_faltantes}, timeout=5)
-            if resposta.status_code == 200:
-                raridade_blocos = resposta.json()
-                
-                # Filtra blocos que podem não estar disponíveis em nenhum peer.
-                raridade_valida = {k: v for k, v in raridade_blocos.items() if v}
-                if not raridade_valida:
-                    return None, None
-
-                # Encontra o ID do bloco que é possuído pelo menor número de peers.
-                id_bloco_mais_raro_str = min(raridade_valida, key=lambda b: len(raridade_valida[b]))
-                id_bloco_mais_raro = int(id_bloco_mais_raro_str)
-
-                # Dentre os peers que possuem o bloco mais raro, seleciona aqueles que este peer conhece.
-                fontes_potenciais = [p for p in raridade_valida[id_bloco_mais_raro_str] if p in self.peers_conhecidos]
-
-                if not fontes_potenciais:
-                    return None, None
-
-                # Escolhe uma fonte aleatória entre as potenciais.
-                id_peer_fonte = random.choice(fontes_potenciais)
-                return id_bloco_mais_raro, id_peer_fonte
-        except requests.exceptions.RequestException as e:
-            self.log.error(f"Erro ao consultar a raridade do bloco: {e}")
-        return None, None
+            self.conexoes.post(f'{endereco}/have', json=aviso, timeout=TIMEOUT_AVISO)
+        except requests.exceptions.RequestException:
+            pass  # Um aviso perdido só atrasa a contagem de raridade no outro peer.
+
+    def selecionar_pedidos(self, enxame, max_pedidos):
+        """
+        Usa o seletor local de peças do enxame para escolher até `max_pedidos` pedidos (id_bloco, parte, id_peer_fonte).
+        Ignora fontes que nos recusaram recentemente e fontes no limite de pedidos simultâneos. Fora do endgame
+        ignora também as partes já em voo; no endgame, uma parte pode ser pedida a até `fontes_endgame` fontes.
+        A política está em `janela_pedidos`, partilhada com o simulador de enxame.
+        """
+        with self.lock:
+            return janela_pedidos.escolher_pedidos(enxame, enxame.peers_conhecidos, max_pedidos, self.max_pedidos_por_peer,
+                                                   self.fontes_endgame, time.time())
+
+    def verificar_endgame(self, enxame):
+        """Entra em modo endgame no enxame quando restam `limiar_endgame` peças ou menos."""
+        with self.lock:
+            faltantes = janela_pedidos.entrar_em_endgame(enxame, self.limiar_endgame, time.time())
+        if faltantes is not None:
+            self.log.info(f"Entrando em modo endgame em {enxame.nome} com {faltantes} blocos em falta.")
 
-    def solicitar_bloco(self, id_bloco, id_peer_fonte):
-        """Envia uma requisição a outro peer para obter um bloco específico."""
+    def reservar_pedido(self, enxame, id_bloco, parte, id_peer_fonte):
+        """Marca uma parte como em voo para que não seja pedida duas vezes."""
+        with self.lock:
+            janela_pedidos.reservar_pedido(enxame, id_bloco, parte, id_peer_fonte)
+
+    def liberar_pedido(self, enxame, id_bloco, parte, id_peer_fonte):
+        """Retira uma parte da lista em voo. Se não foi recebida, volta a ser elegível para outro pedido."""
+        with self.lock:
+            janela_pedidos.liberar_pedido(enxame, id_bloco, parte, id_peer_fonte)
+
+    def ler_corpo(self, enxame, resposta, id_bloco, parte):
+        """
+        Lê o corpo de uma resposta em pedaços. No endgame, interrompe a leitura se outra fonte já entregou a
+        mesma parte, contabilizando os bytes já lidos como duplicados. Retorna None se a leitura foi cancelada.
+        """
+        pedacos = []
+        for pedaco in resposta.iter_content(TAMANHO_LEITURA):
+            pedacos.append(pedaco)
+            if enxame.inicio_endgame is None:
+                continue
+            with self.lock:
+                if enxame.seletor.parte_recebida(id_bloco, parte):
+                    enxame.bytes_duplicados += sum(len(p) for p in pedacos)
+                    enxame.pedidos_cancelados += 1
+                    resposta.close()
+                    return None
+        return b''.join(pedacos)
+
+    def solicitar_bloco(self, enxame, id_bloco, id_peer_fonte, parte=0):
+        """Envia uma requisição a outro peer para obter um bloco específico (ou uma parte dele, via Range)."""
+        inicio = time.perf_counter()
+        resultado = self._solicitar_bloco(enxame, id_bloco, id_peer_fonte, parte)
+        self.latencia_de_blocos.observar(time.perf_counter() - inicio, 'ok' if resultado else 'falha')
+        return resultado
+
+    def _solicitar_bloco(self, enxame, id_bloco, id_peer_fonte, parte):
         try:
-            endereco_fonte = self.peers_conhecidos.get(id_peer_fonte)
+            endereco_fonte = enxame.peers_conhecidos.get(id_peer_fonte)
             if not endereco_fonte:
                 self.log.error(f"Endereço do peer {id_peer_fonte} não encontrado.")
                 return False
-                
-            parametros = {'peer_id': self.id_peer}
-            resposta = requests.get(f'{endereco_fonte}/request_block/{id_bloco}', params=parametros, timeout=5)
 
-            if resposta.status_code == 200:
-                dados = resposta.json()
+            parametros = {'peer_id': self.id_peer, 'info_hash': enxame.info_hash}
+            cabecalhos = {}
+            if enxame.seletor.partes_por_peca[id_bloco] > 1:
+                inicio, fim = self.limites_parte(enxame, id_bloco, parte)
+                cabecalhos['Range'] = f'bytes={inicio}-{fim - 1}'
+            resposta = self.conexoes.get(f'{endereco_fonte}/request_block/{id_bloco}', params=parametros, headers=cabecalhos,
+                                         timeout=TIMEOUT_PEDIDO, stream=True)
+
+            if resposta.status_code in (200, 206):
+                dados = self.ler_corpo(enxame, resposta, id_bloco, parte)
+                if dados is not None:
+                    # Mesmo uma parte duplicada mede quanto esta fonte nos consegue enviar.
+                    with self.lock:
+                        enxame.olho_por_olho.registrar_download(id_peer_fonte, len(dados))
+                    self.bytes_recebidos.incrementar(id_peer_fonte, valor=len(dados))
+                return dados is not None and self.receber_parte(enxame, id_bloco, parte, dados, id_peer_fonte)
+
+            # Lê o corpo (pequeno) das respostas de erro para que a conexão volte ao pool.
+            resposta.content
+            if resposta.status_code == 403:
+                self.log_amostrado.registrar('negado', logging.WARNING,
+                                             f"Pedido do bloco {id_bloco} de {enxame.nome} para {id_peer_fonte} negado (choked).")
+                # Evita a fonte por alguns segundos; o bloco volta para a fila e pode ir para outro peer.
                 with self.lock:
-                    self.meus_blocos.add(dados['block_id'])
-                self.log.info(f"Sucesso! Bloco {id_bloco} recebido de {id_peer_fonte}. Total: {len(self.meus_blocos)}/{self.total_de_blocos}")
-                # Informa ao tracker que agora possui um novo bloco.
-                requests.post(f'{URL_RASTREADOR}/update_blocks', json={'peer_id': self.id_peer, 'blocks': list(self.meus_blocos)})
-                return True
-            elif resposta.status_code == 403:
-                self.log.warning(f"Pedido do bloco {id_bloco} para {id_peer_fonte} negado (choked).")
+                    enxame.recusas_ate[id_peer_fonte] = time.time() + ESPERA_APOS_CHOKE
             else:
-                self.log.error(f"Falha ao obter o bloco {id_bloco} de {id_peer_fonte}. Status: {resposta.status_code}")
+                self.log.error(f"Falha ao obter o bloco {id_bloco} de {enxame.nome} de {id_peer_fonte}. Status: {resposta.status_code}")
         except requests.exceptions.RequestException as e:
             self.log.error(f"Erro de conexão ao solicitar bloco de {id_peer_fonte}: {e}")
         return False
 
-    def olho_por_olho_e_unchoke_otimista(self):
-        """Gerencia as lógicas de 'tit-for-tat' e 'optimistic unchoke' em uma thread separada."""
-        while len(self.meus_blocos) < self.total_de_blocos:
-            # A cada 10 segundos, faz o 'optimistic unchoke'.
-            time.sleep(10)
-            with self.lock:
-                # Escolhe um peer aleatório que não esteja na lista de desbloqueados fixos.
-                potenciais_otimistas = [p for p in self.peers_conhecidos if p not in self.peers_desbloqueados]
-                if potenciais_otimistas:
-                    self.peer_otimista_desbloqueado = random.choice(potenciais_otimistas)
-                    self.log.info(f"Unchoke otimista: {self.peer_otimista_desbloqueado}")
-
-            # A cada 20 segundos (10s aqui + 10s acima), reavalia os 4 melhores peers (tit-for-tat).
-            time.sleep(10)
-            blocos_faltantes = list(set(range(self.total_de_blocos)) - self.meus_blocos)
-            if not blocos_faltantes:
-                continue
-
-            pontuacoes_peers = {}
+    def anunciar_ao_rastreador(self, enxame, evento=None):
+        """
+        Faz um announce do enxame ao tracker: num só pedido envia o evento, os blocos obtidos desde o último
+        announce (delta 'have' com número de sequência) e as estatísticas, e recebe peers e o intervalo até o próximo.
+        Se o tracker recusar (429, antes de 'min_interval') ou não responder, os blocos ficam guardados para
+        o próximo announce. Retorna a resposta do tracker, ou None se o announce não foi aceito.
+        """
+        pendentes, dados_envio = self.dados_do_announce(enxame, evento)
+        try:
+            resposta = self.conexoes.post(f'{URL_RASTREADOR}/announce', json=dados_envio, timeout=5)
+            self.bytes_enviados_rastreador += len(resposta.request.body or b'')
+            dados = resposta.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log.error(f"Não foi possível fazer o announce de {enxame.nome} ao rastreador: {e}")
+            enxame.proximo_announce = time.time() + enxame.intervalo_minimo_announce
+            return None
+
+        if not self.aplicar_announce(enxame, evento, pendentes, resposta.status_code, dados):
+            return None
+        if dados.get('status') == 'resync':
             try:
-                # Pede ao tracker a lista de donos dos blocos faltantes.
-                resposta = requests.post(f'{URL_RASTREADOR}/get_block_info', json={'block_ids': blocos_faltantes}, timeout=5)
-                if resposta.status_code == 200:
-                    donos_dos_blocos = resposta.json()
-                    # Calcula uma pontuação para cada peer com base nos blocos raros que ele possui.
-                    for id_peer in self.peers_conhecidos:
-                        pontuacao = sum(1 for id_bloco in blocos_faltantes if id_peer in donos_dos_blocos.get(str(id_bloco), []) and len(donos_dos_blocos.get(str(id_bloco), [])) < 3)
-                        pontuacoes_peers[id_peer] = pontuacao
-            except requests.exceptions.RequestException:
-                self.log.error("Não foi possível obter info de blocos para o Tit-for-Tat.")
-                continue
+                resposta = self.conexoes.post(f'{URL_RASTREADOR}/update_blocks', json=self.dados_de_ressincronizacao(enxame), timeout=5)
+                self.bytes_enviados_rastreador += len(resposta.request.body or b'')
+            except requests.exceptions.RequestException as e:
+                self.log.error(f"Não foi possível ressincronizar os blocos no rastreador: {e}")
+        return dados
+
+    def dados_do_announce(self, enxame, evento):
+        """Monta o corpo de um announce. Retorna (blocos pendentes que ele leva, corpo)."""
+        with self.lock:
+            pendentes = set(enxame.blocos_a_anunciar)
+            dados_envio = {'peer_id': self.id_peer, 'address': self.endereco, 'info_hash': enxame.info_hash}
+            if evento:
+                dados_envio['event'] = evento
+            # Um peer que retomou peças do disco apresenta-as logo no registo.
+            if evento == 'started' and enxame.meus_blocos:
+                dados_envio['bitfield'] = codificar_bitfield(enxame.meus_blocos, enxame.total_de_blocos)
+            if pendentes:
+                dados_envio['seq'] = enxame.seq_atualizacao + 1
+                dados_envio['have'] = sorted(pendentes)
+            # 'left' conta blocos.
+            dados_envio['stats'] = {'uploaded': enxame.bytes_servidos, 'downloaded': enxame.bytes_baixados,
+                                    'left': enxame.total_de_blocos - len(enxame.meus_blocos)}
+        return pendentes, dados_envio
+
+    def aplicar_announce(self, enxame, evento, pendentes, status, dados):
+        """
+        Aplica a resposta do tracker a um announce: intervalos, instante do próximo announce, número de
+        sequência e peers. Retorna True se o announce foi aceito.
+        """
+        enxame.intervalo_announce = dados.get('interval', enxame.intervalo_announce)
+        enxame.intervalo_minimo_announce = dados.get('min_interval', enxame.intervalo_minimo_announce)
+        if status != 200:
+            if status != 429:
+                self.log.error(f"Announce de {enxame.nome} recusado pelo rastreador. Status: {status}")
+            enxame.proximo_announce = time.time() + enxame.intervalo_minimo_announce
+            return False
+        enxame.proximo_announce = time.time() + enxame.intervalo_announce
 
-            # Ordena os peers pela pontuação e seleciona os 4 melhores.
-            peers_ordenados = sorted(pontuacoes_peers.items(), key=lambda item: item[1], reverse=True)
-            with self.lock:
-                self.peers_desbloqueados = {id_peer for id_peer, pontuacao in peers_ordenados[:4]}
-                self.log.info(f"Peers desbloqueados (fixos): {self.peers_desbloqueados}")
-        
-        self.log.info("Thread de Choking/Unchoking encerrada pois o download foi concluído.")
+        with self.lock:
+            enxame.blocos_a_anunciar -= pendentes
+            if evento == 'started':
+                enxame.seq_atualizacao = dados.get('seq', 0)
+            elif pendentes:
+                enxame.seq_atualizacao += 1
+            enxame.peers_conhecidos.update(dados.get('peers', {}))
+        return True
+
+    def dados_de_ressincronizacao(self, enxame):
+        """
+        Corpo de '/update_blocks' com o bitfield completo, para quando o tracker pede ressincronização
+        (rara: uma atualização anterior perdeu-se).
+        """
+        self.log.warning(f"Tracker pediu ressincronização de {enxame.nome}. Enviando bitfield completo.")
+        with self.lock:
+            return {'peer_id': self.id_peer, 'info_hash': enxame.info_hash, 'seq': enxame.seq_atualizacao,
+                    'bitfield': codificar_bitfield(enxame.meus_blocos, enxame.total_de_blocos)}
 
-    def iniciar(self):
-        """Inicia a operação do peer: servidor, registro, threads e loop de download."""
+    def olho_por_olho_e_unchoke_otimista(self):
+        """
+        Executa as rodadas do choker em uma thread separada, durante o download e o seeding.
+        A cada rodada, as vagas de upload do peer são repartidas entre os enxames conforme os interessados em
+        cada um, e cada enxame escolhe os seus desbloqueados. As decisões usam apenas as taxas medidas localmente.
+        """
+        while True:
+            time.sleep(INTERVALO_CHOKE)
+            self.rodada_do_choker()
+
+    def rodada_do_choker(self):
+        """Uma rodada do choker em todos os enxames, com o registo (log e métricas) das mudanças."""
+        rodadas = []
+        with self.lock:
+            self.repartir_vagas_upload(time.monotonic())
+            for enxame in self.enxames.values():
+                anteriores = set(enxame.olho_por_olho.desbloqueados)
+                otimista_anterior = enxame.olho_por_olho.otimista
+                desbloqueados, otimista = enxame.olho_por_olho.executar_rodada(enxame.semeando)
+                rodadas.append((enxame, anteriores, otimista_anterior, desbloqueados, otimista))
+        for enxame, anteriores, otimista_anterior, desbloqueados, otimista in rodadas:
+            self.eventos_choke.incrementar(enxame.info_hash, 'unchoke', valor=len(desbloqueados - anteriores))
+            self.eventos_choke.incrementar(enxame.info_hash, 'choke', valor=len(anteriores - desbloqueados))
+            if otimista != otimista_anterior:
+                self.eventos_choke.incrementar(enxame.info_hash, 'otimista')
+                self.log.info(f"Unchoke otimista em {enxame.nome}: {otimista}")
+            self.log.info(f"Peers desbloqueados em {enxame.nome} ({'upload' if enxame.semeando else 'download'}, "
+                          f"{enxame.olho_por_olho.vagas_upload} vagas): {desbloqueados}")
+
+    def concluir(self, enxame):
+        """Passa o enxame a modo de seeding e avisa o tracker."""
+        self.entrar_em_seeding(enxame)
+        self.salvar_retomada(enxame)
+        # Eventos não esperam por 'min_interval': o tracker fica a saber já que este peer é semeador.
+        self.anunciar_ao_rastreador(enxame, 'completed')
+
+    def entrar_em_seeding(self, enxame):
+        with self.lock:
+            enxame.semeando = True
+        self.log.info(f"--- ARQUIVO {enxame.nome} COMPLETO! ---")
+        if enxame.inicio_endgame is not None:
+            self.log.info(f"Endgame durou {time.time() - enxame.inicio_endgame:.2f}s: {enxame.bytes_duplicados} bytes duplicados, "
+                          f"{enxame.pedidos_cancelados} pedidos duplicados cancelados.")
+        self.log.info(f"Todos os {enxame.total_de_blocos} blocos foram baixados. Entrando em modo de seeding.")
+
+    def iniciar(self, info_hashes=None):
+        """
+        Inicia a operação do peer: servidor, registro nos enxames `info_hashes` (padrão: todos os do tracker),
+        threads e loop de download. Todos os enxames partilham a mesma janela de pedidos em voo.
+        """
         porta = int(self.endereco.split(':')[-1])
         # Inicia o servidor Flask em sua própria thread.
         thread_flask = threading.Thread(target=self.executar_app_flask, args=(porta,))
         thread_flask.daemon = True
         thread_flask.start()
 
-        # Registra-se no tracker.
-        if not self.registrar_no_rastreador():
+        # Registra-se no tracker, em cada enxame.
+        for info_hash in info_hashes or self.listar_enxames_do_rastreador():
+            self.registrar_no_rastreador(info_hash)
+        if not self.enxames:
             return
 
-        # Obtém a lista inicial de peers.
-        self.atualizar_peers_conhecidos()
-
         # Inicia a thread que gerencia a lógica de unchoke.
         thread_choking = threading.Thread(target=self.olho_por_olho_e_unchoke_otimista)
         thread_choking.daemon = True
         thread_choking.start()
 
-        # Loop principal para baixar os blocos.
-        while len(self.meus_blocos) < self.total_de_blocos:
-            if self.total_de_blocos == -1: # Aguarda o registro ser concluído.
-                time.sleep(1)
-                continue
-
-            # Atualiza a lista de peers conhecidos periodicamente.
-            if random.randint(1, 10) == 1:
-                self.atualizar_peers_conhecidos()
-
-            # Seleciona e solicita o bloco mais raro.
-            bloco_para_obter, peer_fonte = self.selecionar_bloco_mais_raro()
-            if bloco_para_obter is not None and peer_fonte is not None:
-                self.solicitar_bloco(bloco_para_obter, peer_fonte)
-            else:
-                # Aguarda se não houver blocos disponíveis para baixar.
-                time.sleep(3)
-            
-            # Pausa para não sobrecarregar a rede.
-            time.sleep(random.uniform(0.5, 2))
-
-        # --- MODO DE SEEDING ---
-        with self.lock:
-            self.semeando = True
-        self.log.info("--- ARQUIVO COMPLETO! ---")
-        self.log.info(f"Todos os {self.total_de_blocos} blocos foram baixados. Entrando em modo de seeding.")
-
-        # Mantém o peer vivo para continuar servindo blocos para outros.
+        # Loop principal: mantém até `max_pedidos_total` pedidos de blocos em voo ao mesmo tempo, somando os enxames.
+        # Depois de completo, cada enxame continua a ser servido e anunciado no ritmo do tracker.
+        pedidos_pendentes = {}  # {futuro: (enxame, id_bloco, parte, id_peer_fonte)}
+        rodada = 0
         try:
-            while True:
-                time.sleep(60)
-                self.log.info("Atuando como seeder...")
+            with ThreadPoolExecutor(max_workers=self.max_pedidos_total, thread_name_prefix=f'{self.id_peer}-download') as executor:
+                while True:
+                    # A ordem roda a cada volta para que nenhum enxame fique sempre com as vagas da janela.
+                    enxames = list(self.enxames.values())
+                    rodada += 1
+                    enxames = enxames[rodada % len(enxames):] + enxames[:rodada % len(enxames)]
+                    for enxame in enxames:
+                        if not enxame.semeando and enxame.completo():
+                            self.concluir(enxame)
+                        # Announce periódico, no ritmo ditado pelo tracker: leva os blocos novos e traz peers.
+                        if time.time() >= enxame.proximo_announce:
+                            self.anunciar_ao_rastreador(enxame)
+                            if enxame.semeando:
+                                self.log.info(f"Atuando como seeder de {enxame.nome}...")
+                        if time.time() >= enxame.proxima_retomada:
+                            self.salvar_retomada(enxame)
+                        if enxame.semeando:
+                            continue
+                        # Peers recém-conhecidos enviam o seu bitfield uma única vez.
+                        self.sincronizar_bitfields(enxame)
+
+                        # Preenche as vagas livres da janela segundo o seletor local de peças do enxame.
+                        self.verificar_endgame(enxame)
+                        vagas = self.max_pedidos_total - len(pedidos_pendentes)
+                        for id_bloco, parte, id_peer_fonte in self.selecionar_pedidos(enxame, vagas):
+                            self.reservar_pedido(enxame, id_bloco, parte, id_peer_fonte)
+                            futuro = executor.submit(self.solicitar_bloco, enxame, id_bloco, id_peer_fonte, parte)
+                            pedidos_pendentes[futuro] = (enxame, id_bloco, parte, id_peer_fonte)
+
+                    if not pedidos_pendentes:
+                        # Aguarda se não houver blocos disponíveis para baixar (ou se todos os enxames já estão completos).
+                        time.sleep(1)
+                        continue
+
+                    # Espera o primeiro pedido terminar (com sucesso, recusa ou timeout) para reabastecer a janela.
+                    # O limite de 1 s permite aproveitar avisos 'have' que chegam enquanto a janela não está cheia.
+                    concluidos, _ = wait(pedidos_pendentes, timeout=1, return_when=FIRST_COMPLETED)
+                    for futuro in concluidos:
+                        enxame, id_bloco, parte, id_peer_fonte = pedidos_pendentes.pop(futuro)
+                        self.liberar_pedido(enxame, id_bloco, parte, id_peer_fonte)
         except KeyboardInterrupt:
-            self.log.info("Seeder encerrado manualmente.")
+            for enxame in list(self.enxames.values()):
+                self.salvar_retomada(enxame)
+                self.anunciar_ao_rastreador(enxame, 'stopped')
+            self.log.info("Peer encerrado manualmente.")
 
 
 if __name__ == '__main__':
-    import sys
+    import argparse
     # Valida os argumentos da linha de comando.
-    if len(sys.argv) != 3:
-        print("Uso: python peer.py <id_peer> <porta>")
-        sys.exit(1)
-
-    id_peer_arg = sys.argv[1]
-    porta_arg = int(sys.argv[2])
+    parser = argparse.ArgumentParser(description='Inicia um peer MiniBit.')
+    parser.add_argument('id_peer')
+    parser.add_argument('porta', type=int)
+    parser.add_argument('--info-hash', nargs='+', help='Enxames em que participar (padrão: todos os que o tracker serve).')
+    parser.add_argument('--pedidos-por-peer', type=int, default=MAX_PEDIDOS_POR_PEER, help='Pedidos simultâneos por peer remoto.')
+    parser.add_argument('--pedidos-total', type=int, default=MAX_PEDIDOS_TOTAL, help='Pedidos simultâneos no total, somando os enxames.')
+    parser.add_argument('--pasta-dados', help='Pasta onde os ficheiros são gravados (padrão: dados_<id_peer>).')
+    parser.add_argument('--limiar-endgame', type=int, default=LIMIAR_ENDGAME, help='Peças em falta para entrar em endgame (0 desativa).')
+    parser.add_argument('--fontes-endgame', type=int, default=FONTES_ENDGAME, help='Fontes simultâneas por parte no endgame.')
+    parser.add_argument('--vagas-upload', type=int, default=VAGAS_UPLOAD, help='Peers desbloqueados pela taxa, além do otimista, somando os enxames.')
+    parser.add_argument('--banda-upload', type=int, default=0, help='Teto de upload em bytes/s, somando os enxames (0 = sem limite).')
+    args = parser.parse_args()
 
     # Cria e inicia a instância do Peer.
-    peer = Peer(id_peer=id_peer_arg, porta=porta_arg)
-    peer.iniciar()
+    peer = Peer(id_peer=args.id_peer, porta=args.porta,
+                max_pedidos_por_peer=args.pedidos_por_peer, max_pedidos_total=args.pedidos_total,
+                pasta_dados=args.pasta_dados, limiar_endgame=args.limiar_endgame, fontes_endgame=args.fontes_endgame,
+                vagas_upload=args.vagas_upload, banda_upload=args.banda_upload)
+    peer.iniciar(args.info_hash)
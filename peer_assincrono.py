@@ -0,0 +1,553 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from bitfield import codificar_bitfield, decodificar_bitfield
+from http_assincrono import ClienteHttp, ErroHttp, Resposta, ServidorHttp, interpretar_range, resposta_json
+from metainfo import ArmazenamentoPecas
+from metricas import TIPO_CONTEUDO
+from olho_por_olho import VAGAS_UPLOAD
+from peer import (ESPERA_APOS_CHOKE, FONTES_ENDGAME, INTERVALO_CHOKE, INTERVALO_RETOMADA, LIMIAR_ENDGAME, MAX_PEDIDOS_POR_PEER,
+                  MAX_PEDIDOS_TOTAL, TAMANHO_LEITURA, TIMEOUT_AVISO, TIMEOUT_PEDIDO, URL_RASTREADOR, EnxameLocal, Peer,
+                  have_invalido)
+
+ENVIADORES_DE_AVISOS = 4   # Avisos 'have' em voo ao mesmo tempo, como as threads de avisos do `Peer`.
+
+# Motor assíncrono do peer: um único laço de eventos asyncio faz o servidor, o cliente HTTP, o choker e os
+# announces. Cada transferência é uma corrotina em vez de uma thread, e cada tarefa periódica é um temporizador
+# do laço em vez de um ciclo com sleep. O loop de download só acorda quando algo muda: um pedido termina, chega
+# um aviso 'have' ou um bitfield, o tracker traz peers novos, ou acaba a espera imposta por uma recusa (choke).
+# As rotas, os parâmetros, o Range e o JSON são os do `Peer` com threads, por isso os dois convivem no mesmo enxame.
+# A lógica (seletor, endgame, choker, retomada) é herdada do `Peer`. O hash das peças e as gravações com fsync
+# correm em threads (`asyncio.to_thread`), por isso o estado continua protegido pelo mesmo lock.
+
+
+class PeerAssincrono(Peer):
+    """Peer com o protocolo e a lógica de `Peer`, executado num laço de eventos asyncio."""
+
+    def configurar_rede(self):
+        """Cria o cliente e o servidor HTTP assíncronos; o laço de eventos só existe a partir de `iniciar`."""
+        self.conexoes = ClienteHttp(tamanho_pool=self.max_pedidos_por_peer,
+                                    tamanhos_especificos={URL_RASTREADOR: self.max_pedidos_total})
+        self.servidor = ServidorHttp(self.log, ao_responder=lambda regra, segundos: self.latencia_por_endpoint.observar(segundos, regra))
+        self.laco = None                  # Laço de eventos em que o peer corre.
+        self.despertar = None             # asyncio.Event que acorda o loop de download quando há trabalho novo.
+        self.tarefas = set()              # Tarefas em segundo plano (pedidos, avisos, announces) ainda por terminar.
+        self.temporizadores = {}          # Próximo announce periódico de cada enxame {info_hash: asyncio.TimerHandle}.
+        self.pedidos_ativos = 0           # Pedidos de blocos em voo, somando os enxames.
+        self.bitfields_pedidos = set()    # (info_hash, id_peer) com o bitfield já pedido e sem resposta.
+        self.avisos = None                # asyncio.Queue de avisos 'have' por enviar: (endereço, aviso).
+        self.encerrando = False
+        self.configurar_rotas()
+
+    def configurar_rotas(self):
+
+        # Rota para que outros peers possam solicitar um bloco.
+        @self.servidor.rota('/request_block/<int:id_bloco>')
+        async def servir_bloco(pedido, id_bloco):
+            id_peer_solicitante = pedido.parametros.get('peer_id')
+            enxame = self.enxame_do_pedido(pedido.parametros.get('info_hash'))
+            if enxame is None:
+                return resposta_json({'error': 'Enxame desconhecido'}, 404)
+            with self.lock:
+                semeando = enxame.semeando
+                # Todo pedido marca o solicitante como interessado, mesmo que seja recusado.
+                enxame.olho_por_olho.registrar_pedido(id_peer_solicitante)
+                esta_desbloqueado = enxame.olho_por_olho.esta_desbloqueado(id_peer_solicitante)
+                tem_bloco = id_bloco in enxame.meus_blocos
+                por_verificar = id_bloco in enxame.pecas_a_verificar
+
+            if not esta_desbloqueado:
+                self.pedidos_servidos.incrementar('choked')
+                self.log_amostrado.registrar('recusa', logging.WARNING,
+                                             f"Rejeitando pedido do bloco {id_bloco} de {enxame.nome} de {id_peer_solicitante} (choked).")
+                return resposta_json({'error': 'choked'}, 403)
+
+            # Só as peças retomadas do disco precisam de ler e conferir o hash, e isso sai do laço.
+            if tem_bloco and por_verificar and not await asyncio.to_thread(self.confirmar_peca, enxame, id_bloco):
+                tem_bloco = False
+                self.acordar()  # A peça voltou a faltar: o enxame deixa de estar completo.
+            if not tem_bloco:
+                self.pedidos_servidos.incrementar('nao_encontrado')
+                return resposta_json({'error': 'Bloco não encontrado'}, 404)
+
+            self.pedidos_servidos.incrementar('ok')
+            self.log_amostrado.registrar('envio', logging.INFO,
+                                         f"{'Semeando: ' if semeando else ''}Enviando bloco {id_bloco} de {enxame.nome} para {id_peer_solicitante}")
+            return self.resposta_bloco(enxame, id_bloco, id_peer_solicitante, pedido.cabecalhos.get('range'))
+
+        # Rota para que outros peers obtenham o conjunto de blocos deste peer num enxame.
+        @self.servidor.rota('/bitfield')
+        async def servir_bitfield(pedido):
+            enxame = self.enxame_do_pedido(pedido.parametros.get('info_hash'))
+            if enxame is None:
+                return resposta_json({'error': 'Enxame desconhecido'}, 404)
+            self.conhecer_peer(enxame, pedido.parametros.get('peer_id'), pedido.parametros.get('address'))
+            self.acordar()
+            with self.lock:
+                campo = codificar_bitfield(enxame.meus_blocos, enxame.total_de_blocos)
+            return resposta_json({'peer_id': self.id_peer, 'info_hash': enxame.info_hash, 'bitfield': campo})
+
+        # Rota com estatísticas locais de cada enxame (custo do endgame, taxas) e a reutilização de conexões.
+        @self.servidor.rota('/stats')
+        async def servir_estatisticas(pedido):
+            estatisticas = self.estatisticas()
+            estatisticas['conexoes']['conexoes_recebidas'] = self.servidor.conexoes_abertas
+            return resposta_json(estatisticas)
+
+        # Rota para que outros peers anunciem que obtiveram um novo bloco.
+        @self.servidor.rota('/have', metodos=('POST',))
+        async def receber_have(pedido):
+            try:
+                dados = pedido.json()
+            except ValueError:
+                return resposta_json({'error': 'JSON inválido'}, 400)
+            erro = have_invalido(dados)
+            if erro:
+                return resposta_json({'error': erro}, 400)
+            enxame = self.enxame_do_pedido(dados.get('info_hash'))
+            if enxame is None:
+                return resposta_json({'error': 'Enxame desconhecido'}, 404)
+            self.conhecer_peer(enxame, dados.get('peer_id'), dados.get('address'))
+            with self.lock:
+                enxame.seletor.registrar_have(dados['peer_id'], dados['block_id'])
+            self.acordar()
+            return resposta_json({'status': 'ok'})
+
+        # Rota com as métricas do peer no formato de texto do Prometheus.
+        @self.servidor.rota('/metrics')
+        async def servir_metricas(pedido):
+            return Resposta(self.metricas.texto().encode(), tipo=TIPO_CONTEUDO)
+
+    def resposta_bloco(self, enxame, id_bloco, id_peer_solicitante, cabecalho_range=None):
+        """Monta a resposta com os bytes crus do bloco (ou do intervalo pedido no cabeçalho Range), enviados em fatias."""
+        inicio_peca, fim_peca = enxame.armazenamento.limites_peca(id_bloco)
+        tamanho = fim_peca - inicio_peca
+        cabecalhos = {'Accept-Ranges': 'bytes'}
+
+        if cabecalho_range is None:
+            inicio, fim, status = 0, tamanho, 200
+        else:
+            intervalo = interpretar_range(cabecalho_range, tamanho)
+            if intervalo is None:
+                return Resposta(status=416, cabecalhos={'Content-Range': f'bytes */{tamanho}'})
+            (inicio, fim), status = intervalo, 206
+            cabecalhos['Content-Range'] = f'bytes {inicio}-{fim - 1}/{tamanho}'
+
+        cabecalhos['Content-Length'] = str(fim - inicio)
+        fatias = self.contar_envio(enxame, id_peer_solicitante, enxame.armazenamento.fatias(id_bloco, inicio, fim))
+        return Resposta(fatias, status, cabecalhos)
+
+    async def contar_envio(self, enxame, id_peer, fatias):
+        """
+        Repassa as fatias de uma resposta, contando os bytes à medida que saem para o peer.
+        Com `--banda-upload`, a espera pelo limitador cede o laço aos outros pedidos.
+        """
+        for fatia in fatias:
+            if self.limitador is not None:
+                await self.limitador.consumir_assincrono(len(fatia))
+            yield fatia
+            with self.lock:
+                enxame.bytes_servidos += len(fatia)
+                enxame.olho_por_olho.registrar_upload(id_peer, len(fatia))
+            self.bytes_enviados.incrementar(id_peer, valor=len(fatia))
+
+    # --- Tarefas e temporizadores ---
+
+    def em_segundo_plano(self, corrotina):
+        """Agenda uma corrotina como tarefa do laço, guardando uma referência até ela terminar."""
+        tarefa = self.laco.create_task(corrotina)
+        self.tarefas.add(tarefa)
+        tarefa.add_done_callback(self.tarefas.discard)
+        return tarefa
+
+    def acordar(self):
+        """Acorda o loop de download. Pode ser chamado de qualquer thread."""
+        if self.laco is not None:
+            self.laco.call_soon_threadsafe(self.despertar.set)
+
+    def agendar_announce(self, enxame):
+        """(Re)arma o temporizador do announce periódico do enxame para o instante `proximo_announce`."""
+        anterior = self.temporizadores.pop(enxame.info_hash, None)
+        if anterior is not None:
+            anterior.cancel()
+        if self.encerrando or enxame.info_hash not in self.enxames:
+            return
+        atraso = max(0.0, enxame.proximo_announce - time.time())
+        self.temporizadores[enxame.info_hash] = self.laco.call_later(
+            atraso, lambda: self.em_segundo_plano(self.announce_periodico(enxame)))
+
+    async def announce_periodico(self, enxame):
+        """Announce no ritmo ditado pelo tracker: leva os blocos novos e traz peers."""
+        await self.anunciar_ao_rastreador(enxame)
+        if enxame.semeando:
+            self.log.info(f"Atuando como seeder de {enxame.nome}...")
+
+    def agendar_choker(self):
+        """
+        Executa uma rodada do choker a cada `INTERVALO_CHOKE` segundos, durante o download e o seeding.
+        A próxima rodada é agendada mesmo que esta falhe: um erro não pode parar o choker para sempre.
+        """
+        def rodada():
+            try:
+                self.rodada_do_choker()
+            except Exception:
+                self.log.exception("Falha numa rodada do choker.")
+            finally:
+                self.agendar_choker()
+        self.laco.call_later(INTERVALO_CHOKE, rodada)
+
+    def agendar_retomadas(self):
+        """
+        Grava os ficheiros de retomada com peças novas a cada `INTERVALO_RETOMADA` segundos. Como no choker,
+        uma gravação que falha (disco cheio, por exemplo) fica no log e a seguinte é agendada na mesma.
+        """
+        async def gravar():
+            try:
+                for enxame in list(self.enxames.values()):
+                    await asyncio.to_thread(self.salvar_retomada, enxame)
+            except Exception:
+                self.log.exception("Falha ao gravar os ficheiros de retomada.")
+            finally:
+                self.agendar_retomadas()
+        self.laco.call_later(INTERVALO_RETOMADA, lambda: self.em_segundo_plano(gravar()))
+
+    # --- Comunicação com o tracker ---
+
+    async def listar_enxames_do_rastreador(self):
+        """Retorna os info-hashes de todos os enxames que o tracker serve."""
+        try:
+            resposta = await self.conexoes.get(f'{URL_RASTREADOR}/swarms', timeout=5)
+            dados = await resposta.json()
+            if resposta.status == 200:
+                return [enxame['info_hash'] for enxame in dados]
+            self.log.error(f"Tracker não listou os enxames. Status: {resposta.status}")
+        except (ErroHttp, ValueError) as e:
+            self.log.error(f"Não foi possível listar os enxames do rastreador: {e}")
+        return []
+
+    async def registrar_no_rastreador(self, info_hash):
+        """
+        Entra no enxame `info_hash`: obtém o metainfo, faz o primeiro announce ('started') e recebe os blocos
+        iniciais e os primeiros peers. Retorna o enxame local, ou None se o registro falhou.
+        """
+        try:
+            enxame = await self.obter_metainfo(info_hash)
+            if enxame is None:
+                return None
+            self.retomar(enxame)
+            self.adicionar_enxame(enxame)
+            dados = await self.anunciar_ao_rastreador(enxame, 'started')
+            if dados is None:
+                with self.lock:
+                    self.enxames.pop(enxame.info_hash, None)
+                return None
+            if 'bitfield' in dados:
+                blocos_atribuidos = decodificar_bitfield(dados['bitfield'], dados['total_blocks'])
+            else:
+                blocos_atribuidos = set(dados['initial_blocks'])
+            await self.baixar_blocos_iniciais(enxame, blocos_atribuidos - enxame.meus_blocos)
+            self.log.info(f"Registrado em {enxame.nome}. Recebi {len(enxame.meus_blocos)} blocos. Total na rede: {enxame.total_de_blocos}")
+            self.mostrar_blocos(enxame)
+            self.acordar()
+            return enxame
+        except (ErroHttp, ValueError) as e:
+            self.log.error(f"Não foi possível registrar no rastreador: {e}")
+        return None
+
+    async def obter_metainfo(self, info_hash):
+        """Obtém do tracker o metainfo do ficheiro e pré-aloca o armazenamento local das peças. Retorna o novo enxame local."""
+        parametros = {'info_hash': info_hash} if info_hash else {}
+        resposta = await self.conexoes.get(f'{URL_RASTREADOR}/metainfo', params=parametros, timeout=5)
+        corpo = await resposta.conteudo()
+        if resposta.status != 200:
+            self.log.error(f"Tracker não forneceu o metainfo de {info_hash}. Status: {resposta.status}")
+            return None
+        metainfo = json.loads(corpo)
+        # A pré-alocação do ficheiro pode demorar: corre fora do laço.
+        armazenamento = await asyncio.to_thread(ArmazenamentoPecas, os.path.join(self.pasta_dados, metainfo['name']), metainfo)
+        return EnxameLocal(armazenamento)
+
+    async def baixar_blocos_iniciais(self, enxame, blocos_atribuidos):
+        """Busca no tracker, em paralelo, os bytes dos blocos atribuídos no registro, verificando o hash de cada um."""
+        parametros = {'peer_id': self.id_peer, 'info_hash': enxame.info_hash}
+        limite = asyncio.Semaphore(self.max_pedidos_total)
+
+        async def baixar(id_bloco):
+            async with limite:
+                try:
+                    resposta = await self.conexoes.get(f'{URL_RASTREADOR}/request_block/{id_bloco}', params=parametros,
+                                                       timeout=TIMEOUT_PEDIDO)
+                    dados = await resposta.conteudo()
+                    if resposta.status == 200 and await asyncio.to_thread(self.receber_peca, enxame, id_bloco, dados):
+                        return
+                except ErroHttp:
+                    pass
+            self.log.error(f"Não foi possível obter o bloco inicial {id_bloco} de {enxame.nome} do tracker.")
+
+        await asyncio.gather(*(baixar(id_bloco) for id_bloco in blocos_atribuidos))
+
+    async def anunciar_ao_rastreador(self, enxame, evento=None):
+        """
+        Faz um announce do enxame ao tracker (ver `Peer.anunciar_ao_rastreador`) e rearma o temporizador do
+        próximo. Retorna a resposta do tracker, ou None se o announce não foi aceito.
+        """
+        pendentes, dados_envio = self.dados_do_announce(enxame, evento)
+        try:
+            resposta = await self.conexoes.post(f'{URL_RASTREADOR}/announce', json=dados_envio, timeout=5)
+            self.bytes_enviados_rastreador += resposta.tamanho_pedido
+            dados = await resposta.json()
+        except (ErroHttp, ValueError) as e:
+            self.log.error(f"Não foi possível fazer o announce de {enxame.nome} ao rastreador: {e}")
+            enxame.proximo_announce = time.time() + enxame.intervalo_minimo_announce
+            self.agendar_announce(enxame)
+            return None
+
+        aceito = self.aplicar_announce(enxame, evento, pendentes, resposta.status, dados)
+        self.agendar_announce(enxame)
+        if not aceito:
+            return None
+        self.acordar()  # Pode haver peers novos.
+        if dados.get('status') == 'resync':
+            try:
+                resposta = await self.conexoes.post(f'{URL_RASTREADOR}/update_blocks', json=self.dados_de_ressincronizacao(enxame),
+                                                    timeout=5)
+                self.bytes_enviados_rastreador += resposta.tamanho_pedido
+                await resposta.conteudo()
+            except ErroHttp as e:
+                self.log.error(f"Não foi possível ressincronizar os blocos no rastreador: {e}")
+        return dados
+
+    def concluir(self, enxame):
+        """Passa o enxame a modo de seeding já; a gravação da retomada e o aviso ao tracker seguem em segundo plano."""
+        self.entrar_em_seeding(enxame)
+
+        async def avisar():
+            await asyncio.to_thread(self.salvar_retomada, enxame)
+            # Eventos não esperam por 'min_interval': o tracker fica a saber já que este peer é semeador.
+            await self.anunciar_ao_rastreador(enxame, 'completed')
+        self.em_segundo_plano(avisar())
+
+    # --- Comunicação com outros peers ---
+
+    def sincronizar_bitfields(self, enxame):
+        """Pede, em segundo plano, o bitfield dos peers conhecidos que ainda não o enviaram."""
+        with self.lock:
+            pendentes = {p: e for p, e in enxame.peers_conhecidos.items()
+                         if p not in enxame.seletor.pecas_dos_peers and (enxame.info_hash, p) not in self.bitfields_pedidos}
+        for id_peer, endereco in pendentes.items():
+            self.bitfields_pedidos.add((enxame.info_hash, id_peer))
+            self.em_segundo_plano(self.pedir_bitfield(enxame, id_peer, endereco))
+
+    async def pedir_bitfield(self, enxame, id_peer, endereco):
+        chave = (enxame.info_hash, id_peer)
+        parametros = {'peer_id': self.id_peer, 'address': self.endereco, 'info_hash': enxame.info_hash}
+        try:
+            resposta = await self.conexoes.get(f'{endereco}/bitfield', params=parametros, timeout=TIMEOUT_AVISO)
+            corpo = await resposta.conteudo()
+            if resposta.status == 200:
+                pecas = decodificar_bitfield(json.loads(corpo)['bitfield'], enxame.total_de_blocos)
+                with self.lock:
+                    enxame.seletor.registrar_bitfield(id_peer, pecas)
+                self.bitfields_pedidos.discard(chave)
+                self.acordar()
+            else:
+                # O peer ainda não serve este enxame: volta a tentar depois, como depois de uma recusa.
+                self.laco.call_later(ESPERA_APOS_CHOKE, self.bitfields_pedidos.discard, chave)
+        except (ErroHttp, ValueError):
+            self.log.warning(f"Peer {id_peer} inalcançável ao pedir o bitfield. Removendo dos conhecidos.")
+            self.esquecer_peer(enxame, id_peer)
+            self.bitfields_pedidos.discard(chave)
+
+    def anunciar_bloco(self, enxame, id_bloco):
+        """Envia um aviso 'have' do novo bloco a todos os peers conhecidos do enxame. Pode ser chamado de qualquer thread."""
+        with self.lock:
+            enderecos = list(enxame.peers_conhecidos.values())
+        aviso = {'peer_id': self.id_peer, 'address': self.endereco, 'info_hash': enxame.info_hash, 'block_id': id_bloco}
+
+        def enfileirar():
+            for endereco in enderecos:
+                self.avisos.put_nowait((endereco, aviso))
+        self.laco.call_soon_threadsafe(enfileirar)
+
+    async def enviar_avisos(self):
+        """
+        Tarefa que envia os avisos 'have' da fila, um de cada vez. Com ENVIADORES_DE_AVISOS tarefas, um bloco
+        concluído num enxame grande não abre uma conexão por peer de uma só vez.
+        """
+        while True:
+            endereco, aviso = await self.avisos.get()
+            try:
+                resposta = await self.conexoes.post(f'{endereco}/have', json=aviso, timeout=TIMEOUT_AVISO)
+                await resposta.conteudo()
+            except ErroHttp:
+                pass  # Um aviso perdido só atrasa a contagem de raridade no outro peer.
+
+    async def ler_corpo(self, enxame, resposta, id_bloco, parte):
+        """
+        Lê o corpo de uma resposta em pedaços. No endgame, interrompe a leitura se outra fonte já entregou a
+        mesma parte, contabilizando os bytes já lidos como duplicados. Retorna None se a leitura foi cancelada.
+        """
+        pedacos = []
+        async for pedaco in resposta.pedacos(TAMANHO_LEITURA):
+            pedacos.append(pedaco)
+            if enxame.inicio_endgame is None:
+                continue
+            with self.lock:
+                if enxame.seletor.parte_recebida(id_bloco, parte):
+                    enxame.bytes_duplicados += sum(len(p) for p in pedacos)
+                    enxame.pedidos_cancelados += 1
+                    resposta.fechar()
+                    return None
+        return b''.join(pedacos)
+
+    async def solicitar_bloco(self, enxame, id_bloco, id_peer_fonte, parte=0):
+        """Envia uma requisição a outro peer para obter um bloco específico (ou uma parte dele, via Range)."""
+        inicio = time.perf_counter()
+        resultado = await self._solicitar_bloco(enxame, id_bloco, id_peer_fonte, parte)
+        self.latencia_de_blocos.observar(time.perf_counter() - inicio, 'ok' if resultado else 'falha')
+        return resultado
+
+    async def _solicitar_bloco(self, enxame, id_bloco, id_peer_fonte, parte):
+        try:
+            endereco_fonte = enxame.peers_conhecidos.get(id_peer_fonte)
+            if not endereco_fonte:
+                self.log.error(f"Endereço do peer {id_peer_fonte} não encontrado.")
+                return False
+
+            parametros = {'peer_id': self.id_peer, 'info_hash': enxame.info_hash}
+            cabecalhos = {}
+            if enxame.seletor.partes_por_peca[id_bloco] > 1:
+                inicio, fim = self.limites_parte(enxame, id_bloco, parte)
+                cabecalhos['Range'] = f'bytes={inicio}-{fim - 1}'
+            resposta = await self.conexoes.get(f'{endereco_fonte}/request_block/{id_bloco}', params=parametros, headers=cabecalhos,
+                                               timeout=TIMEOUT_PEDIDO)
+
+            if resposta.status in (200, 206):
+                dados = await self.ler_corpo(enxame, resposta, id_bloco, parte)
+                if dados is None:
+                    return False
+                # Mesmo uma parte duplicada mede quanto esta fonte nos consegue enviar.
+                with self.lock:
+                    enxame.olho_por_olho.registrar_download(id_peer_fonte, len(dados))
+                self.bytes_recebidos.incrementar(id_peer_fonte, valor=len(dados))
+                # Gravar no mmap e conferir o hash da peça completa sai do laço.
+                return await asyncio.to_thread(self.receber_parte, enxame, id_bloco, parte, dados, id_peer_fonte)
+
+            # Lê o corpo (pequeno) das respostas de erro para que a conexão volte ao pool.
+            await resposta.conteudo()
+            if resposta.status == 403:
+                self.log_amostrado.registrar('negado', logging.WARNING,
+                                             f"Pedido do bloco {id_bloco} de {enxame.nome} para {id_peer_fonte} negado (choked).")
+                # Evita a fonte por alguns segundos; o bloco volta para a fila e pode ir para outro peer.
+                with self.lock:
+                    enxame.recusas_ate[id_peer_fonte] = time.time() + ESPERA_APOS_CHOKE
+                self.laco.call_later(ESPERA_APOS_CHOKE, self.acordar)
+            else:
+                self.log.error(f"Falha ao obter o bloco {id_bloco} de {enxame.nome} de {id_peer_fonte}. Status: {resposta.status}")
+        except ErroHttp as e:
+            self.log.error(f"Erro de conexão ao solicitar bloco de {id_peer_fonte}: {e}")
+        return False
+
+    async def executar_pedido(self, enxame, id_bloco, parte, id_peer_fonte):
+        """Executa um pedido reservado e liberta a sua vaga na janela, acordando o loop para a reabastecer."""
+        try:
+            await self.solicitar_bloco(enxame, id_bloco, id_peer_fonte, parte)
+        finally:
+            self.liberar_pedido(enxame, id_bloco, parte, id_peer_fonte)
+            self.pedidos_ativos -= 1
+            self.acordar()
+
+    # --- Ciclo de vida ---
+
+    def iniciar(self, info_hashes=None):
+        """
+        Inicia a operação do peer num laço de eventos: servidor, registro nos enxames `info_hashes` (padrão:
+        todos os do tracker), temporizadores e loop de download. Bloqueia até o peer ser interrompido.
+        """
+        try:
+            asyncio.run(self.executar(info_hashes))
+        except KeyboardInterrupt:
+            asyncio.run(self.encerrar())
+            self.log.info("Peer encerrado manualmente.")
+
+    async def executar(self, info_hashes=None):
+        self.laco = asyncio.get_running_loop()
+        self.despertar = asyncio.Event()
+        self.avisos = asyncio.Queue()
+        for _ in range(ENVIADORES_DE_AVISOS):
+            self.em_segundo_plano(self.enviar_avisos())
+        porta = int(self.endereco.split(':')[-1])
+        await self.servidor.iniciar('127.0.0.1', porta)
+
+        # Os registos nos vários enxames correm em paralelo.
+        await asyncio.gather(*(self.registrar_no_rastreador(h) for h in info_hashes or await self.listar_enxames_do_rastreador()))
+        if not self.enxames:
+            await self.servidor.fechar()
+            return
+
+        self.agendar_choker()
+        self.agendar_retomadas()
+        await self.baixar()
+
+    async def baixar(self):
+        """
+        Loop de download: mantém até `max_pedidos_total` pedidos de blocos em voo ao mesmo tempo, somando os
+        enxames, e dorme até que algum evento (`acordar`) possa ter aberto trabalho novo.
+        Depois de completo, cada enxame continua a ser servido e anunciado pelos temporizadores.
+        """
+        rodada = 0
+        while True:
+            self.despertar.clear()
+            # A ordem roda a cada volta para que nenhum enxame fique sempre com as vagas da janela.
+            enxames = list(self.enxames.values())
+            rodada += 1
+            enxames = enxames[rodada % len(enxames):] + enxames[:rodada % len(enxames)]
+            for enxame in enxames:
+                if not enxame.semeando and enxame.completo():
+                    self.concluir(enxame)
+                if enxame.semeando:
+                    continue
+                # Peers recém-conhecidos enviam o seu bitfield uma única vez.
+                self.sincronizar_bitfields(enxame)
+                self.verificar_endgame(enxame)
+                vagas = self.max_pedidos_total - self.pedidos_ativos
+                for id_bloco, parte, id_peer_fonte in self.selecionar_pedidos(enxame, vagas):
+                    self.reservar_pedido(enxame, id_bloco, parte, id_peer_fonte)
+                    self.pedidos_ativos += 1
+                    self.em_segundo_plano(self.executar_pedido(enxame, id_bloco, parte, id_peer_fonte))
+            await self.despertar.wait()
+
+    async def encerrar(self):
+        """Grava as retomadas e avisa o tracker ('stopped'), num laço novo: o anterior foi interrompido."""
+        self.encerrando = True
+        self.laco = asyncio.get_running_loop()
+        # As conexões do laço anterior não servem neste.
+        self.conexoes = ClienteHttp()
+        for enxame in list(self.enxames.values()):
+            self.salvar_retomada(enxame)
+            await self.anunciar_ao_rastreador(enxame, 'stopped')
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Inicia um peer MiniBit com o motor assíncrono (asyncio).')
+    parser.add_argument('id_peer')
+    parser.add_argument('porta', type=int)
+    parser.add_argument('--info-hash', nargs='+', help='Enxames em que participar (padrão: todos os que o tracker serve).')
+    parser.add_argument('--pedidos-por-peer', type=int, default=MAX_PEDIDOS_POR_PEER, help='Pedidos simultâneos por peer remoto.')
+    parser.add_argument('--pedidos-total', type=int, default=MAX_PEDIDOS_TOTAL, help='Pedidos simultâneos no total, somando os enxames.')
+    parser.add_argument('--pasta-dados', help='Pasta onde os ficheiros são gravados (padrão: dados_<id_peer>).')
+    parser.add_argument('--limiar-endgame', type=int, default=LIMIAR_ENDGAME, help='Peças em falta para entrar em endgame (0 desativa).')
+    parser.add_argument('--fontes-endgame', type=int, default=FONTES_ENDGAME, help='Fontes simultâneas por parte no endgame.')
+    parser.add_argument('--vagas-upload', type=int, default=VAGAS_UPLOAD, help='Peers desbloqueados pela taxa, além do otimista, somando os enxames.')
+    parser.add_argument('--banda-upload', type=int, default=0, help='Teto de upload em bytes/s, somando os enxames (0 = sem limite).')
+    args = parser.parse_args()
+
+    peer = PeerAssincrono(id_peer=args.id_peer, porta=args.porta,
+                          max_pedidos_por_peer=args.pedidos_por_peer, max_pedidos_total=args.pedidos_total,
+                          pasta_dados=args.pasta_dados, limiar_endgame=args.limiar_endgame, fontes_endgame=args.fontes_endgame,
+                          vagas_upload=args.vagas_upload, banda_upload=args.banda_upload)
+    peer.iniciar(args.info_hash)
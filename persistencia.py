@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+
+# Persistência à prova de quedas. O estado é guardado num instantâneo compacto (`estado.json`) mais um diário
+# só de acréscimo (`diario.<geracao>.jsonl`) com as mudanças feitas depois dele. Cada compactação abre um
+# diário de geração nova antes de gravar o instantâneo, por isso uma queda a meio nunca perde mudanças:
+# ao carregar, o instantâneo da geração g é completado com os diários de geração g ou maior, por ordem.
+# Ficheiros inteiros (instantâneos, ficheiros de retomada) são escritos num temporário e trocados com os.replace.
+
+NOME_INSTANTANEO = 'estado.json'
+
+
+def escrever_atomico(caminho, dados):
+    """Grava `dados` em JSON de forma atômica: quem ler `caminho` vê o ficheiro antigo ou o novo, nunca metade."""
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(dados, arquivo, separators=(',', ':'))
+        arquivo.flush()
+        os.fsync(arquivo.fileno())
+    os.replace(temporario, caminho)
+
+
+def ler_json(caminho):
+    """Lê um JSON gravado por `escrever_atomico`. Retorna None se o ficheiro não existir ou estiver ilegível."""
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+class DiarioDeEstado:
+    """Diário só de acréscimo com instantâneos periódicos, guardados em `pasta`."""
+
+    def __init__(self, pasta):
+        self.pasta = pasta
+        os.makedirs(pasta, exist_ok=True)
+        self.geracao = 0
+        self.arquivo = None
+        self.registros = 0          # Registos escritos desde o último instantâneo.
+        self.lock = threading.Lock()
+
+    def _caminho_diario(self, geracao):
+        return os.path.join(self.pasta, f'diario.{geracao}.jsonl')
+
+    def _geracoes_em_disco(self):
+        geracoes = []
+        for nome in os.listdir(self.pasta):
+            partes = nome.split('.')
+            if len(partes) == 3 and partes[0] == 'diario' and partes[2] == 'jsonl' and partes[1].isdigit():
+                geracoes.append(int(partes[1]))
+        return sorted(geracoes)
+
+    def carregar(self):
+        """
+        Lê o último instantâneo e os registos escritos depois dele. Retorna (instantâneo ou None, [registos]).
+        Uma linha incompleta (a última escrita antes de uma queda) é ignorada. A seguir, os novos registos vão
+        para um diário de geração nova, para nunca acrescentar a um ficheiro com a cauda cortada.
+        """
+        instantaneo = ler_json(os.path.join(self.pasta, NOME_INSTANTANEO))
+        geracao_base = instantaneo['geracao'] if instantaneo else 0
+        registros = []
+        geracoes = self._geracoes_em_disco()
+        for geracao in geracoes:
+            if geracao < geracao_base:
+                continue
+            with open(self._caminho_diario(geracao), encoding='utf-8') as arquivo:
+                for linha in arquivo:
+                    try:
+                        registros.append(json.loads(linha))
+                    except ValueError:
+                        break
+        self._abrir(max(geracoes + [geracao_base]) + 1)
+        self.registros = len(registros)
+        return instantaneo, registros
+
+    def _abrir(self, geracao):
+        self.geracao = geracao
+        self.arquivo = open(self._caminho_diario(geracao), 'a', encoding='utf-8')
+
+    def registrar(self, registro):
+        """Acrescenta um registo ao diário. Chega ao sistema operativo já, e ao disco no próximo `sincronizar`."""
+        linha = json.dumps(registro, separators=(',', ':')) + '\n'
+        with self.lock:
+            self.arquivo.write(linha)
+            self.arquivo.flush()
+            self.registros += 1
+
+    def sincronizar(self):
+        """Força para o disco os registos já escritos (fsync)."""
+        with self.lock:
+            os.fsync(self.arquivo.fileno())
+
+    def iniciar_instantaneo(self):
+        """
+        Fecha o diário atual e abre o da geração seguinte; retorna essa geração. Deve ser chamado enquanto
+        ninguém altera o estado, no mesmo momento em que o estado a gravar é copiado.
+        """
+        with self.lock:
+            self.arquivo.flush()
+            os.fsync(self.arquivo.fileno())
+            self.arquivo.close()
+            self._abrir(self.geracao + 1)
+            self.registros = 0
+            return self.geracao
+
+    def concluir_instantaneo(self, geracao, estado):
+        """Grava o instantâneo da `geracao` (iniciado com `iniciar_instantaneo`) e apaga os diários que ele substitui."""
+        escrever_atomico(os.path.join(self.pasta, NOME_INSTANTANEO), dict(estado, geracao=geracao))
+        for antiga in self._geracoes_em_disco():
+            if antiga < geracao:
+                os.remove(self._caminho_diario(antiga))
+
+    def fechar(self):
+        with self.lock:
+            self.arquivo.flush()
+            os.fsync(self.arquivo.fileno())
+            self.arquivo.close()
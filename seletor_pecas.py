@@ -0,0 +1,232 @@
+import bisect
+import random
+
+# Seletor de peças local: decide o que pedir com base nos bitfields trocados diretamente entre peers,
+# sem consultar o tracker. Peças em falta ficam em baldes indexados pela disponibilidade (quantos peers
+# conhecidos as possuem), de modo que achar a mais rara não exige percorrer todas as peças. As contagens
+# com balde ficam numa lista ordenada, atualizada só quando um balde nasce ou fica vazio: são poucas
+# (no máximo uma por peer conhecido, mais o zero), por isso a inserção com bisect custa menos que um heap.
+
+PECAS_ALEATORIAS_INICIAIS = 4   # Antes de ter este número de peças, escolhe ao acaso (random first).
+
+
+class SeletorDePecas:
+    """Mantém a disponibilidade de cada peça e escolhe o próximo pedido (peça, parte, fonte)."""
+
+    def __init__(self, partes_por_peca, pecas_aleatorias_iniciais=PECAS_ALEATORIAS_INICIAIS, gerador=None):
+        """`partes_por_peca[i]` é o número de partes (pedidos com Range) em que a peça i é dividida."""
+        self.total_de_pecas = len(partes_por_peca)
+        self.partes_por_peca = partes_por_peca
+        self.pecas_aleatorias_iniciais = pecas_aleatorias_iniciais
+        self.gerador = gerador or random.Random()
+
+        self.donos = [set() for _ in range(self.total_de_pecas)]   # Peers conhecidos que possuem cada peça.
+        self.pecas_dos_peers = {}                                  # {id_peer: conjunto de peças anunciadas}.
+        self.minhas_pecas = set()                                  # Peças já obtidas e verificadas.
+        self.partes_pendentes = {}                                 # Peças começadas: {peça: partes ainda não recebidas}.
+
+        # Baldes por disponibilidade: {contagem: [peças em falta]}, com a posição de cada peça no seu balde
+        # para remoção em O(1) (troca com o último elemento).
+        self.baldes = {0: list(range(self.total_de_pecas))}
+        self.posicao = {peca: peca for peca in range(self.total_de_pecas)}
+        self.contagens = [0] if self.total_de_pecas else []        # Contagens com balde não vazio, por ordem.
+
+    # --- Manutenção dos baldes ---
+
+    def _retirar_do_balde(self, peca, contagem):
+        balde = self.baldes[contagem]
+        indice = self.posicao.pop(peca)
+        ultima = balde.pop()
+        if ultima != peca:
+            balde[indice] = ultima
+            self.posicao[ultima] = indice
+        if not balde:
+            del self.baldes[contagem]
+            del self.contagens[bisect.bisect_left(self.contagens, contagem)]
+
+    def _colocar_no_balde(self, peca, contagem):
+        balde = self.baldes.get(contagem)
+        if balde is None:
+            balde = self.baldes[contagem] = []
+            bisect.insort(self.contagens, contagem)
+        self.posicao[peca] = len(balde)
+        balde.append(peca)
+
+    def _alterar_disponibilidade(self, peca, id_peer, possui):
+        donos = self.donos[peca]
+        contagem = len(donos)
+        if possui:
+            donos.add(id_peer)
+        else:
+            donos.discard(id_peer)
+        if peca in self.posicao and len(donos) != contagem:
+            self._retirar_do_balde(peca, contagem)
+            self._colocar_no_balde(peca, len(donos))
+
+    # --- Informação vinda dos outros peers ---
+
+    def registrar_bitfield(self, id_peer, pecas):
+        """Substitui o conjunto de peças conhecido de um peer pelo seu bitfield completo."""
+        anteriores = self.pecas_dos_peers.get(id_peer, set())
+        novas = set(pecas)
+        for peca in anteriores - novas:
+            self._alterar_disponibilidade(peca, id_peer, False)
+        for peca in novas - anteriores:
+            self._alterar_disponibilidade(peca, id_peer, True)
+        self.pecas_dos_peers[id_peer] = novas
+
+    def registrar_have(self, id_peer, peca):
+        """Regista que um peer anunciou ter obtido uma peça."""
+        pecas = self.pecas_dos_peers.setdefault(id_peer, set())
+        if peca not in pecas and 0 <= peca < self.total_de_pecas:
+            pecas.add(peca)
+            self._alterar_disponibilidade(peca, id_peer, True)
+
+    def remover_peer(self, id_peer):
+        """Esquece um peer que saiu da rede."""
+        for peca in self.pecas_dos_peers.pop(id_peer, set()):
+            self._alterar_disponibilidade(peca, id_peer, False)
+
+    # --- Progresso local ---
+
+    def parte_recebida(self, peca, parte):
+        """Indica se a parte já chegou (ou se a peça inteira já foi obtida)."""
+        if peca in self.minhas_pecas:
+            return True
+        pendentes = self.partes_pendentes.get(peca)
+        return pendentes is not None and parte not in pendentes
+
+    def marcar_parte_recebida(self, peca, parte):
+        """Regista a chegada de uma parte. Retorna True quando todas as partes da peça chegaram."""
+        pendentes = self.partes_pendentes.get(peca)
+        if pendentes is None or parte not in pendentes:
+            return False
+        pendentes.discard(parte)
+        return not pendentes
+
+    def pecas_faltantes(self):
+        """Número de peças ainda não obtidas."""
+        return len(self.posicao)
+
+    def marcar_peca_obtida(self, peca):
+        """Retira a peça dos baldes depois de verificada."""
+        self.partes_pendentes.pop(peca, None)
+        if peca in self.posicao:
+            self._retirar_do_balde(peca, len(self.donos[peca]))
+        self.minhas_pecas.add(peca)
+
+    def perder_peca(self, peca):
+        """Devolve aos baldes uma peça que se julgava obtida (por exemplo, retomada do disco com o hash errado)."""
+        if peca in self.minhas_pecas:
+            self.minhas_pecas.discard(peca)
+            self._colocar_no_balde(peca, len(self.donos[peca]))
+
+    def descartar_peca(self, peca):
+        """Recomeça uma peça cujo hash não conferiu: todas as partes voltam a ser pedidas."""
+        self.partes_pendentes.pop(peca, None)
+
+    # --- Escolha ---
+
+    def _primeira_parte_livre(self, peca, em_voo):
+        pendentes = self.partes_pendentes.get(peca)
+        partes = pendentes if pendentes is not None else range(self.partes_por_peca[peca])
+        for parte in partes:
+            if (peca, parte) not in em_voo:
+                return parte
+        return None
+
+    def _tentar(self, peca, fontes_livres, em_voo):
+        """Retorna (peça, parte, fonte) se houver uma parte livre e uma fonte livre que tenha a peça."""
+        parte = self._primeira_parte_livre(peca, em_voo)
+        if parte is None:
+            return None
+        fontes = [p for p in self.donos[peca] if p in fontes_livres]
+        if not fontes:
+            return None
+        if peca not in self.partes_pendentes:
+            self.partes_pendentes[peca] = set(range(self.partes_por_peca[peca]))
+        return peca, parte, self.gerador.choice(fontes)
+
+    def _percorrer_balde(self, balde, fontes_livres, em_voo):
+        """Percorre o balde a partir de uma posição aleatória, o que desempata as peças ao acaso."""
+        inicio = self.gerador.randrange(len(balde))
+        for deslocamento in range(len(balde)):
+            pedido = self._tentar(balde[(inicio + deslocamento) % len(balde)], fontes_livres, em_voo)
+            if pedido is not None:
+                return pedido
+        return None
+
+    def _percorrer_baldes(self, baldes, fontes_livres, em_voo):
+        """
+        Percorre vários baldes como se fossem uma só lista, a partir de uma posição aleatória: a primeira peça
+        tentada é uniforme entre todas as candidatas, sem as copiar nem embaralhar a cada escolha.
+        """
+        total = sum(len(balde) for balde in baldes)
+        if not total:
+            return None
+        inicio = self.gerador.randrange(total)
+        for primeiro, balde in enumerate(baldes):
+            if inicio < len(balde):
+                break
+            inicio -= len(balde)
+        # Do ponto sorteado até ao fim, pelos baldes seguintes e de volta ao começo do primeiro.
+        trechos = [(baldes[primeiro], inicio, len(baldes[primeiro]))]
+        trechos += [(balde, 0, len(balde)) for balde in baldes[primeiro + 1:] + baldes[:primeiro]]
+        trechos.append((baldes[primeiro], 0, inicio))
+        for balde, de, ate in trechos:
+            for indice in range(de, ate):
+                pedido = self._tentar(balde[indice], fontes_livres, em_voo)
+                if pedido is not None:
+                    return pedido
+        return None
+
+    def escolher(self, fontes_livres, em_voo):
+        """
+        Escolhe o próximo pedido (peça, parte, fonte) entre as fontes livres, ignorando as partes em voo:
+          1. prioridade estrita para terminar peças já começadas;
+          2. peça aleatória enquanto o peer tiver menos de `pecas_aleatorias_iniciais` peças;
+          3. caso contrário, a peça mais rara (menor disponibilidade), com desempate aleatório.
+        Retorna None se nada puder ser pedido agora.
+        """
+        if not fontes_livres:
+            return None
+
+        for peca in list(self.partes_pendentes):
+            pedido = self._tentar(peca, fontes_livres, em_voo)
+            if pedido is not None:
+                return pedido
+
+        # As peças sem nenhum dono conhecido (contagem 0) não podem ser pedidas.
+        contagens = self.contagens[1:] if self.contagens and self.contagens[0] == 0 else self.contagens
+        if len(self.minhas_pecas) < self.pecas_aleatorias_iniciais:
+            return self._percorrer_baldes([self.baldes[contagem] for contagem in contagens], fontes_livres, em_voo)
+
+        for contagem in contagens:
+            pedido = self._percorrer_balde(self.baldes[contagem], fontes_livres, em_voo)
+            if pedido is not None:
+                return pedido
+        return None
+
+    def escolher_endgame(self, fontes_livres, em_voo, max_fontes):
+        """
+        Modo endgame: permite pedir a mesma parte a até `max_fontes` fontes ao mesmo tempo.
+        `em_voo` mapeia (peça, parte) para o conjunto de fontes a quem ela já foi pedida.
+        Prefere as partes com menos pedidos em voo. Retorna (peça, parte, fonte) ou None.
+        """
+        candidatos = []
+        for peca in self.posicao:
+            pendentes = self.partes_pendentes.get(peca)
+            partes = pendentes if pendentes is not None else range(self.partes_por_peca[peca])
+            for parte in partes:
+                fontes_pedidas = em_voo.get((peca, parte), ())
+                if len(fontes_pedidas) >= max_fontes:
+                    continue
+                fontes = [p for p in self.donos[peca] if p in fontes_livres and p not in fontes_pedidas]
+                if fontes:
+                    candidatos.append((len(fontes_pedidas), peca, parte, fontes))
+        if not candidatos:
+            return None
+        _, peca, parte, fontes = min(candidatos, key=lambda candidato: candidato[0])
+        if peca not in self.partes_pendentes:
+            self.partes_pendentes[peca] = set(range(self.partes_por_peca[peca]))
+        return peca, parte, self.gerador.choice(fontes)
@@ -0,0 +1,499 @@
+import argparse
+import csv
+import heapq
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import janela_pedidos
+import tracker
+from gerador_carga import percentil
+from olho_por_olho import OlhoPorOlho, VAGAS_UPLOAD
+from peer import (ESPERA_APOS_CHOKE, FONTES_ENDGAME, INTERVALO_CHOKE, LIMIAR_ENDGAME, MAX_PEDIDOS_POR_PEER,
+                  MAX_PEDIDOS_TOTAL, TAMANHO_LEITURA, TAMANHO_PARTE)
+from seletor_pecas import SeletorDePecas
+
+# Simulador de enxame: executa a lógica real do rastreador (announce e distribuição inicial), do seletor
+# de peças e do choker para centenas ou milhares de peers num relógio simulado, sem HTTP nem disco.
+# Cada ligação tem banda e latência próprias; o resultado (tempos de conclusão, pedidos ao rastreador,
+# bytes duplicados e curvas de disponibilidade) vai para JSON/CSV, para comparar mudanças cenário a cenário.
+# Uso: python simulador.py --cenarios pequeno medio --sementes 1 2 3 --processos 4
+
+KIB = 1024
+MIB = 1024 * 1024
+
+# Cada cenário fixa o enxame e a rede. 'classes' lista (fração dos peers, banda de upload, banda de download) em bytes/s.
+CENARIOS = {
+    'pequeno': {'peers': 50, 'pecas': 50, 'tamanho_peca': 256 * KIB, 'chegada': 10, 'latencia': (0.01, 0.05),
+                'classes': [(1.0, 1 * MIB, 4 * MIB)], 'banda_rastreador': 10 * MIB, 'tempo_maximo': 600},
+    'medio': {'peers': 500, 'pecas': 100, 'tamanho_peca': 256 * KIB, 'chegada': 60, 'latencia': (0.01, 0.1),
+              'classes': [(0.8, 512 * KIB, 2 * MIB), (0.2, 4 * MIB, 16 * MIB)], 'banda_rastreador': 20 * MIB,
+              'tempo_maximo': 1800},
+    'grande': {'peers': 2000, 'pecas': 100, 'tamanho_peca': 256 * KIB, 'chegada': 120, 'latencia': (0.01, 0.2),
+               'classes': [(0.8, 512 * KIB, 2 * MIB), (0.2, 4 * MIB, 16 * MIB)], 'banda_rastreador': 50 * MIB,
+               'tempo_maximo': 3600},
+    'pecas_grandes': {'peers': 200, 'pecas': 40, 'tamanho_peca': 1 * MIB, 'chegada': 30, 'latencia': (0.02, 0.1),
+                      'classes': [(1.0, 1 * MIB, 4 * MIB)], 'banda_rastreador': 20 * MIB, 'tempo_maximo': 1800},
+}
+
+# Parâmetros dos peers simulados; os padrões são os mesmos do peer real.
+PARAMETROS_PEER = {'vagas_upload': VAGAS_UPLOAD, 'max_pedidos_por_peer': MAX_PEDIDOS_POR_PEER,
+                   'max_pedidos_total': MAX_PEDIDOS_TOTAL, 'limiar_endgame': LIMIAR_ENDGAME,
+                   'fontes_endgame': FONTES_ENDGAME}
+
+INTERVALO_AMOSTRA = 5        # Segundos simulados entre amostras da curva de disponibilidade.
+ESPERA_SEM_PEDIDOS = 1       # Como no peer real: sem nada para pedir, tenta de novo depois deste tempo.
+INFO_HASH_SIMULADO = 'simulado' # Info-hash do único enxame de cada simulação.
+
+
+def reiniciar_rastreador(num_pecas):
+    """Substitui os enxames do rastreador por um único enxame vazio, para uma nova simulação no mesmo processo."""
+    enxame = tracker.Enxame(INFO_HASH_SIMULADO, num_pecas)
+    tracker.enxames.clear()
+    tracker.enxames[INFO_HASH_SIMULADO] = enxame
+    tracker.taxa_de_pedidos = 0.0
+    return enxame
+
+
+class PeerSimulado:
+    """Estado de um peer na simulação. Os IDs são inteiros, para que a ordem dos conjuntos não dependa do PYTHONHASHSEED."""
+
+    def __init__(self, id_peer, chegada, banda_upload, banda_download, latencia, partes_por_peca, parametros, gerador):
+        self.id_peer = id_peer
+        self.chegada = chegada
+        self.banda_upload = banda_upload
+        self.banda_download = banda_download
+        self.latencia = latencia                 # Latência de ida da ligação deste peer, em segundos.
+        self.parametros = parametros
+        self.seletor = SeletorDePecas(partes_por_peca, gerador=random.Random(gerador.random()))
+        self.olho_por_olho = OlhoPorOlho(parametros['vagas_upload'], gerador=random.Random(gerador.random()))
+        self.conhecidos = set()
+        self.meus_blocos = set()
+        self.peers_iniciais = []                 # Peers recebidos no primeiro announce, contactados depois dos blocos iniciais.
+        self.blocos_iniciais_pendentes = set()
+        self.blocos_a_anunciar = set()
+        self.seq_atualizacao = 0
+        self.pedidos_em_voo = {}                 # {(peça, parte): {fontes}}, como no peer real.
+        self.pedidos_por_peer = {}
+        self.recusas_ate = {}
+        self.uploads_ativos = 0
+        self.downloads_ativos = 0
+        self.inicio_endgame = None
+        self.conclusao = None
+        self.bytes_enviados = 0
+        self.bytes_recebidos = 0
+        self.bytes_duplicados = 0
+        self.espera_agendada = False
+        self.ativo = False                       # Torna-se True quando os blocos iniciais chegaram.
+
+    @property
+    def semeando(self):
+        return self.conclusao is not None
+
+
+class Simulacao:
+    """Simulação de eventos discretos de um cenário com uma semente."""
+
+    def __init__(self, nome, cenario, parametros, semente):
+        self.nome = nome
+        self.cenario = cenario
+        self.parametros = parametros
+        self.semente = semente
+        self.gerador = random.Random(semente)
+        # O rastreador sorteia blocos iniciais e peers com o módulo `random`.
+        random.seed(semente)
+        self.enxame = reiniciar_rastreador(cenario['pecas'])
+
+        self.tamanho_peca = cenario['tamanho_peca']
+        self.partes_por_peca = [-(-self.tamanho_peca // TAMANHO_PARTE)] * cenario['pecas']
+        self.eventos = []
+        self.contador_eventos = 0
+        self.agora = 0.0
+        self.completos = 0
+        self.uploads_rastreador = 0
+        self.transferencias = {}                 # {(destino, peça, parte, fonte): (início, fim, bytes)}.
+        self.disponibilidade = [0] * cenario['pecas']
+        self.amostras = []
+        self.contadores = {'announce': 0, 'announce_recusados': 0, 'request_block': 0, 'update_blocks': 0, 'mensagens_have': 0,
+                           'recusas_choke': 0, 'pedidos_cancelados': 0}
+        self.pedidos_rastreador_por_segundo = {}
+        self.inicio_janela_taxa = 0.0
+        self.pedidos_na_janela = 0
+
+        self.peers = {}
+        for id_peer in range(cenario['peers']):
+            _, banda_upload, banda_download = self._sortear_classe()
+            latencia = self.gerador.uniform(*cenario['latencia'])
+            chegada = self.gerador.uniform(0, cenario['chegada'])
+            self.peers[id_peer] = PeerSimulado(id_peer, chegada, banda_upload, banda_download, latencia,
+                                               self.partes_por_peca, parametros, self.gerador)
+            self.agendar(chegada, self.chegar, self.peers[id_peer])
+        self.agendar(0, self.amostrar)
+
+    def _sortear_classe(self):
+        sorteio = self.gerador.random()
+        for classe in self.cenario['classes']:
+            sorteio -= classe[0]
+            if sorteio <= 0:
+                return classe
+        return self.cenario['classes'][-1]
+
+    # --- Motor de eventos ---
+
+    def agendar(self, instante, funcao, *argumentos):
+        self.contador_eventos += 1
+        heapq.heappush(self.eventos, (instante, self.contador_eventos, funcao, argumentos))
+
+    def executar(self):
+        """Processa os eventos até todos os peers completarem ou até 'tempo_maximo'. Retorna o resumo."""
+        inicio_real = time.perf_counter()
+        while self.eventos and self.completos < len(self.peers):
+            instante, _, funcao, argumentos = heapq.heappop(self.eventos)
+            if instante > self.cenario['tempo_maximo']:
+                break
+            self.agora = instante
+            funcao(*argumentos)
+        self.amostrar(reagendar=False)
+        return self.resumo(time.perf_counter() - inicio_real)
+
+    @staticmethod
+    def latencia(origem, destino):
+        """Latência de ida entre dois peers: soma das latências das duas ligações."""
+        return origem.latencia + destino.latencia
+
+    # --- Rastreador ---
+
+    def contar_pedido_rastreador(self, endpoint):
+        """Conta um pedido ao rastreador e atualiza a taxa que ele usa para escalar os intervalos."""
+        self.contadores[endpoint] += 1
+        segundo = int(self.agora)
+        self.pedidos_rastreador_por_segundo[segundo] = self.pedidos_rastreador_por_segundo.get(segundo, 0) + 1
+        self.pedidos_na_janela += 1
+        if self.agora - self.inicio_janela_taxa >= tracker.JANELA_TAXA:
+            tracker.taxa_de_pedidos = self.pedidos_na_janela / (self.agora - self.inicio_janela_taxa)
+            self.inicio_janela_taxa, self.pedidos_na_janela = self.agora, 0
+
+    def anunciar(self, peer, evento=None):
+        """Announce de um peer, processado pela mesma função da rota '/announce' do rastreador."""
+        pendentes = set(peer.blocos_a_anunciar)
+        dados = {'peer_id': peer.id_peer, 'address': f'sim://{peer.id_peer}', 'info_hash': INFO_HASH_SIMULADO}
+        if evento:
+            dados['event'] = evento
+        if pendentes:
+            dados['seq'] = peer.seq_atualizacao + 1
+            dados['have'] = sorted(pendentes)
+        if evento != 'started':
+            dados['stats'] = {'uploaded': peer.bytes_enviados, 'downloaded': peer.bytes_recebidos,
+                              'left': len(self.partes_por_peca) - len(peer.meus_blocos)}
+        self.contar_pedido_rastreador('announce')
+        resposta, status = tracker.processar_announce(dados, self.agora)
+        if status != 200:
+            self.contadores['announce_recusados'] += 1
+            self.agendar(self.agora + resposta['min_interval'], self.anunciar_periodicamente, peer)
+            return None
+        peer.blocos_a_anunciar -= pendentes
+        if evento == 'started':
+            peer.seq_atualizacao = resposta['seq']
+        elif pendentes:
+            peer.seq_atualizacao += 1
+        if resposta.get('status') == 'resync':
+            # Como no peer real, o bitfield completo segue por '/update_blocks'.
+            with tracker.lock:
+                tracker.aplicar_atualizacao(self.enxame, peer.id_peer, {'seq': peer.seq_atualizacao, 'bitfield': tracker.codificar_bitfield(
+                    peer.meus_blocos, self.enxame.total_de_blocos)})
+            self.contar_pedido_rastreador('update_blocks')
+        if evento in (None, 'started'):
+            self.agendar(self.agora + resposta['interval'], self.anunciar_periodicamente, peer)
+        for id_outro in resposta.get('peers', {}):
+            self.conhecer(peer, self.peers[id_outro])
+        return resposta
+
+    def anunciar_periodicamente(self, peer):
+        self.anunciar(peer)
+
+    # --- Ciclo de vida de um peer ---
+
+    def chegar(self, peer):
+        """Primeiro announce ('started') e download dos blocos iniciais a partir do rastreador."""
+        resposta = self.anunciar(peer, 'started')
+        peer.peers_iniciais = list(resposta['peers'])
+        peer.blocos_iniciais_pendentes = set(resposta['initial_blocks'])
+        # Como no peer real, os blocos iniciais vêm um a um, antes de qualquer troca com outros peers.
+        self.pedir_bloco_inicial(peer)
+
+    def pedir_bloco_inicial(self, peer):
+        if not peer.blocos_iniciais_pendentes:
+            self.ativar(peer)
+            return
+        id_bloco = min(peer.blocos_iniciais_pendentes)
+        self.contar_pedido_rastreador('request_block')
+        self.uploads_rastreador += 1
+        peer.downloads_ativos += 1
+        taxa = min(self.cenario['banda_rastreador'] / self.uploads_rastreador, peer.banda_download / peer.downloads_ativos)
+        # Ida e volta só pela ligação do peer: o rastreador não tem latência própria no modelo.
+        self.agendar(self.agora + 2 * peer.latencia + self.tamanho_peca / taxa, self.receber_bloco_inicial, peer, id_bloco)
+
+    def receber_bloco_inicial(self, peer, id_bloco):
+        self.uploads_rastreador -= 1
+        peer.downloads_ativos -= 1
+        peer.blocos_iniciais_pendentes.discard(id_bloco)
+        self.obter_peca(peer, id_bloco)
+        self.pedir_bloco_inicial(peer)
+
+    def ativar(self, peer):
+        """Com os blocos iniciais, o peer troca bitfields com os peers conhecidos e começa o choker."""
+        peer.ativo = True
+        for id_outro in peer.peers_iniciais:
+            self.conhecer(peer, self.peers[id_outro])
+        self.agendar(self.agora + INTERVALO_CHOKE, self.rodada_choke, peer)
+        if len(peer.meus_blocos) == len(self.partes_por_peca):
+            self.concluir(peer)
+        self.preencher(peer)
+
+    def conhecer(self, peer, outro):
+        """Troca de bitfields entre dois peers ativos, como em '/bitfield' (cada um passa a conhecer o outro)."""
+        if outro is peer or not peer.ativo or not outro.ativo or outro.id_peer in peer.conhecidos:
+            return
+        peer.conhecidos.add(outro.id_peer)
+        outro.conhecidos.add(peer.id_peer)
+        peer.seletor.registrar_bitfield(outro.id_peer, outro.meus_blocos)
+        outro.seletor.registrar_bitfield(peer.id_peer, peer.meus_blocos)
+        self.preencher(outro)
+
+    def rodada_choke(self, peer):
+        peer.olho_por_olho.executar_rodada(peer.semeando, self.agora)
+        self.agendar(self.agora + INTERVALO_CHOKE, self.rodada_choke, peer)
+
+    def concluir(self, peer):
+        peer.conclusao = self.agora
+        self.completos += 1
+        self.anunciar(peer, 'completed')
+
+    # --- Pedidos de blocos ---
+
+    def preencher(self, peer):
+        """Preenche a janela de pedidos em voo com a política do peer real (`janela_pedidos`)."""
+        if peer.semeando or not peer.ativo:
+            return
+        parametros = peer.parametros
+        janela_pedidos.entrar_em_endgame(peer, parametros['limiar_endgame'], self.agora)
+        vagas = parametros['max_pedidos_total'] - sum(peer.pedidos_por_peer.values())
+        if vagas <= 0:
+            return
+        for id_bloco, parte, id_fonte in janela_pedidos.escolher_pedidos(
+                peer, peer.conhecidos, vagas, parametros['max_pedidos_por_peer'], parametros['fontes_endgame'], self.agora):
+            janela_pedidos.reservar_pedido(peer, id_bloco, parte, id_fonte)
+            fonte = self.peers[id_fonte]
+            self.agendar(self.agora + self.latencia(peer, fonte), self.chegar_pedido, peer, fonte, id_bloco, parte)
+
+        if not peer.pedidos_por_peer and not peer.espera_agendada:
+            peer.espera_agendada = True
+            self.agendar(self.agora + ESPERA_SEM_PEDIDOS, self.esperar, peer)
+
+    def esperar(self, peer):
+        peer.espera_agendada = False
+        self.preencher(peer)
+
+    def tamanho_parte(self, parte):
+        return min(TAMANHO_PARTE, self.tamanho_peca - parte * TAMANHO_PARTE)
+
+    def chegar_pedido(self, peer, fonte, id_bloco, parte):
+        """
+        O pedido chega à fonte: é recusado (choked) ou transmitido. A taxa da transferência é a banda repartida
+        pelas transferências ativas nas duas pontas no momento em que começa, e não muda depois.
+        """
+        fonte.olho_por_olho.registrar_pedido(peer.id_peer, self.agora)
+        if not fonte.olho_por_olho.esta_desbloqueado(peer.id_peer):
+            self.contadores['recusas_choke'] += 1
+            self.agendar(self.agora + self.latencia(peer, fonte), self.receber_recusa, peer, fonte, id_bloco, parte)
+            return
+        tamanho = self.tamanho_parte(parte)
+        if peer.seletor.parte_recebida(id_bloco, parte):
+            # No endgame, o peer real fecha a resposta depois da primeira leitura se outra fonte já entregou a parte.
+            peer.bytes_duplicados += min(TAMANHO_LEITURA, tamanho)
+            self.contadores['pedidos_cancelados'] += 1
+            self.agendar(self.agora + self.latencia(peer, fonte), self.cancelar_pedido, peer, fonte, id_bloco, parte)
+            return
+        fonte.uploads_ativos += 1
+        peer.downloads_ativos += 1
+        taxa = min(fonte.banda_upload / fonte.uploads_ativos, peer.banda_download / peer.downloads_ativos)
+        fim = self.agora + tamanho / taxa + self.latencia(peer, fonte)
+        self.transferencias[(peer.id_peer, id_bloco, parte, fonte.id_peer)] = (self.agora, fim, tamanho)
+        self.agendar(fim, self.receber_parte, peer, fonte, id_bloco, parte)
+
+    def receber_recusa(self, peer, fonte, id_bloco, parte):
+        peer.recusas_ate[fonte.id_peer] = self.agora + ESPERA_APOS_CHOKE
+        self.cancelar_pedido(peer, fonte, id_bloco, parte)
+
+    def cancelar_pedido(self, peer, fonte, id_bloco, parte):
+        janela_pedidos.liberar_pedido(peer, id_bloco, parte, fonte.id_peer)
+        self.preencher(peer)
+
+    def encerrar_transferencia(self, peer, fonte, id_bloco, parte):
+        """Libera a banda de uma transferência e retorna os bytes já transmitidos (ou None se foi cancelada)."""
+        transferencia = self.transferencias.pop((peer.id_peer, id_bloco, parte, fonte.id_peer), None)
+        if transferencia is None:
+            return None
+        inicio, fim, tamanho = transferencia
+        fonte.uploads_ativos -= 1
+        peer.downloads_ativos -= 1
+        transmitidos = tamanho if self.agora >= fim else int(tamanho * (self.agora - inicio) / (fim - inicio))
+        fonte.olho_por_olho.registrar_upload(peer.id_peer, transmitidos, self.agora)
+        peer.olho_por_olho.registrar_download(fonte.id_peer, transmitidos, self.agora)
+        fonte.bytes_enviados += transmitidos
+        peer.bytes_recebidos += transmitidos
+        return transmitidos
+
+    def receber_parte(self, peer, fonte, id_bloco, parte):
+        transmitidos = self.encerrar_transferencia(peer, fonte, id_bloco, parte)
+        if transmitidos is None:
+            return
+        janela_pedidos.liberar_pedido(peer, id_bloco, parte, fonte.id_peer)
+        if peer.seletor.parte_recebida(id_bloco, parte):
+            peer.bytes_duplicados += transmitidos
+        elif peer.seletor.marcar_parte_recebida(id_bloco, parte):
+            self.obter_peca(peer, id_bloco)
+            # O peer real anuncia cada peça nova diretamente aos peers conhecidos.
+            peer.blocos_a_anunciar.add(id_bloco)
+            for id_outro in peer.conhecidos:
+                self.contadores['mensagens_have'] += 1
+                outro = self.peers[id_outro]
+                self.agendar(self.agora + self.latencia(peer, outro), self.receber_have, outro, peer.id_peer, id_bloco)
+        # No endgame, as cópias da mesma parte ainda em curso são interrompidas.
+        for id_outra_fonte in list(peer.pedidos_em_voo.get((id_bloco, parte), ())):
+            cancelados = self.encerrar_transferencia(peer, self.peers[id_outra_fonte], id_bloco, parte)
+            if cancelados is not None:
+                peer.bytes_duplicados += cancelados
+                self.contadores['pedidos_cancelados'] += 1
+                janela_pedidos.liberar_pedido(peer, id_bloco, parte, id_outra_fonte)
+        if len(peer.meus_blocos) == len(self.partes_por_peca) and not peer.semeando:
+            self.concluir(peer)
+        self.preencher(peer)
+
+    def receber_have(self, peer, id_outro, id_bloco):
+        peer.seletor.registrar_have(id_outro, id_bloco)
+        self.preencher(peer)
+
+    def obter_peca(self, peer, id_bloco):
+        if id_bloco in peer.meus_blocos:
+            return
+        peer.meus_blocos.add(id_bloco)
+        peer.seletor.marcar_peca_obtida(id_bloco)
+        self.disponibilidade[id_bloco] += 1
+
+    # --- Resultados ---
+
+    def amostrar(self, reagendar=True):
+        """Regista um ponto da curva de disponibilidade das peças no enxame."""
+        presentes = sum(1 for p in self.peers.values() if p.chegada <= self.agora)
+        completos = sum(1 for p in self.peers.values() if p.semeando)
+        self.amostras.append({'tempo': round(self.agora, 3), 'peers_presentes': presentes, 'completos': completos,
+                              'copias_min': min(self.disponibilidade),
+                              'copias_media': round(sum(self.disponibilidade) / len(self.disponibilidade), 3),
+                              'pecas_ausentes': sum(1 for copias in self.disponibilidade if copias == 0)})
+        if reagendar:
+            self.agendar(self.agora + INTERVALO_AMOSTRA, self.amostrar)
+
+    def resumo(self, duracao_real):
+        duracoes = sorted(p.conclusao - p.chegada for p in self.peers.values() if p.conclusao is not None)
+        return {
+            'cenario': self.nome, 'semente': self.semente, 'cenario_parametros': self.cenario, 'peer_parametros': self.parametros,
+            'peers': len(self.peers), 'completos': len(duracoes), 'tempo_simulado': round(self.agora, 3),
+            'duracao_real': round(duracao_real, 3),
+            'conclusao': {'media': round(sum(duracoes) / len(duracoes), 3) if duracoes else None,
+                          **{f'p{int(f * 100)}': round(percentil(duracoes, f), 3) for f in (0.1, 0.5, 0.9, 0.99)},
+                          'max': round(duracoes[-1], 3) if duracoes else None},
+            'rastreador': {'announce': self.contadores['announce'], 'announce_recusados': self.contadores['announce_recusados'],
+                           'request_block': self.contadores['request_block'],
+                           'pedidos_por_segundo_max': max(self.pedidos_rastreador_por_segundo.values(), default=0)},
+            'bytes_transferidos': sum(p.bytes_recebidos for p in self.peers.values()),
+            'bytes_duplicados': sum(p.bytes_duplicados for p in self.peers.values()),
+            'pedidos_cancelados': self.contadores['pedidos_cancelados'],
+            'recusas_choke': self.contadores['recusas_choke'],
+            'mensagens_have': self.contadores['mensagens_have'],
+        }
+
+    def salvar(self, pasta, resumo):
+        """Grava o resumo (JSON), os resultados por peer e a curva de disponibilidade (CSV)."""
+        prefixo = os.path.join(pasta, f'{self.nome}_s{self.semente}')
+        with open(f'{prefixo}.json', 'w', encoding='utf-8') as arquivo:
+            json.dump(resumo, arquivo, indent=2)
+        with open(f'{prefixo}_peers.csv', 'w', newline='', encoding='utf-8') as arquivo:
+            escritor = csv.writer(arquivo)
+            escritor.writerow(['id_peer', 'chegada', 'conclusao', 'duracao', 'banda_upload', 'banda_download',
+                               'bytes_enviados', 'bytes_recebidos', 'bytes_duplicados'])
+            for p in self.peers.values():
+                duracao = round(p.conclusao - p.chegada, 3) if p.conclusao is not None else ''
+                escritor.writerow([p.id_peer, round(p.chegada, 3), '' if p.conclusao is None else round(p.conclusao, 3), duracao,
+                                   p.banda_upload, p.banda_download, p.bytes_enviados, p.bytes_recebidos, p.bytes_duplicados])
+        with open(f'{prefixo}_disponibilidade.csv', 'w', newline='', encoding='utf-8') as arquivo:
+            escritor = csv.DictWriter(arquivo, fieldnames=list(self.amostras[0]))
+            escritor.writeheader()
+            escritor.writerows(self.amostras)
+
+
+def simular(nome, cenario, parametros, semente, pasta):
+    """Executa e grava uma simulação. Função de topo para poder correr num processo do pool."""
+    # O rastreador regista cada peer novo; com milhares de peers simulados, isso custaria mais do que a simulação.
+    logging.getLogger().setLevel(logging.WARNING)
+    simulacao = Simulacao(nome, cenario, parametros, semente)
+    resumo = simulacao.executar()
+    simulacao.salvar(pasta, resumo)
+    return resumo
+
+
+def executar(tarefas, pasta, processos):
+    """Executa as simulações neste processo (processos=1) ou num pool de processos; retorna os resumos na ordem das tarefas."""
+    os.makedirs(pasta, exist_ok=True)
+    if processos <= 1:
+        resumos = [simular(*tarefa, pasta) for tarefa in tarefas]
+    else:
+        # Cada simulação altera o estado global do módulo `tracker`, que é por processo.
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            resumos = list(executor.map(simular, *zip(*tarefas), [pasta] * len(tarefas)))
+
+    with open(os.path.join(pasta, 'resumo.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump(resumos, arquivo, indent=2)
+    with open(os.path.join(pasta, 'resumo.csv'), 'w', newline='', encoding='utf-8') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(['cenario', 'semente', 'peers', 'completos', 'conclusao_p50', 'conclusao_p90', 'conclusao_max',
+                           'announces', 'pedidos_rastreador_por_segundo_max', 'bytes_duplicados', 'duracao_real'])
+        for r in resumos:
+            escritor.writerow([r['cenario'], r['semente'], r['peers'], r['completos'], r['conclusao']['p50'],
+                               r['conclusao']['p90'], r['conclusao']['max'], r['rastreador']['announce'],
+                               r['rastreador']['pedidos_por_segundo_max'], r['bytes_duplicados'], r['duracao_real']])
+    return resumos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simula um enxame MiniBit e grava métricas em JSON/CSV.')
+    parser.add_argument('--cenarios', nargs='+', choices=list(CENARIOS), default=['pequeno'])
+    parser.add_argument('--sementes', nargs='+', type=int, default=[42])
+    parser.add_argument('--processos', type=int, default=1, help='1 executa neste processo; mais usa um pool de processos.')
+    parser.add_argument('--saida', default='resultados_simulacao', help='Pasta dos ficheiros JSON/CSV.')
+    parser.add_argument('--peers', type=int, help='Substitui o número de peers dos cenários.')
+    parser.add_argument('--pecas', type=int, help='Substitui o número de peças dos cenários.')
+    parser.add_argument('--vagas-upload', type=int, default=VAGAS_UPLOAD)
+    parser.add_argument('--limiar-endgame', type=int, default=LIMIAR_ENDGAME)
+    parser.add_argument('--fontes-endgame', type=int, default=FONTES_ENDGAME)
+    args = parser.parse_args()
+
+    parametros = dict(PARAMETROS_PEER, vagas_upload=args.vagas_upload, limiar_endgame=args.limiar_endgame,
+                      fontes_endgame=args.fontes_endgame)
+    tarefas = []
+    for nome in args.cenarios:
+        cenario = dict(CENARIOS[nome])
+        if args.peers:
+            cenario['peers'] = args.peers
+        if args.pecas:
+            cenario['pecas'] = args.pecas
+        tarefas.extend((nome, cenario, parametros, semente) for semente in args.sementes)
+
+    for r in executar(tarefas, args.saida, args.processos):
+        c = r['conclusao']
+        print(f"{r['cenario']:14s} semente {r['semente']:4d}: {r['completos']}/{r['peers']} completos, "
+              f"p50 {c['p50']}s, p90 {c['p90']}s, {r['rastreador']['announce']} announces, "
+              f"{r['bytes_duplicados']} bytes duplicados ({r['duracao_real']:.1f}s reais)")
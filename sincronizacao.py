@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+# Primitivas de sincronização partilhadas pelo tracker e pelos peers.
+
+
+class LockLeituraEscrita:
+    """
+    Lock de leitores/escritor: vários leitores podem entrar ao mesmo tempo; um escritor entra sozinho.
+    Escritores têm preferência: quando um escritor espera, novos leitores aguardam, para que as
+    atualizações não fiquem famintas sob muitas leituras.
+
+    Usado diretamente (`with lock:`) comporta-se como o lock de escrita, como um `threading.Lock`.
+    """
+
+    def __init__(self):
+        self.condicao = threading.Condition(threading.Lock())
+        self.leitores_ativos = 0
+        self.escritor_ativo = False
+        self.escritores_esperando = 0
+
+    def adquirir_leitura(self):
+        with self.condicao:
+            while self.escritor_ativo or self.escritores_esperando:
+                self.condicao.wait()
+            self.leitores_ativos += 1
+
+    def liberar_leitura(self):
+        with self.condicao:
+            self.leitores_ativos -= 1
+            if not self.leitores_ativos:
+                self.condicao.notify_all()
+
+    def adquirir_escrita(self):
+        with self.condicao:
+            self.escritores_esperando += 1
+            while self.escritor_ativo or self.leitores_ativos:
+                self.condicao.wait()
+            self.escritores_esperando -= 1
+            self.escritor_ativo = True
+
+    def liberar_escrita(self):
+        with self.condicao:
+            self.escritor_ativo = False
+            self.condicao.notify_all()
+
+    @contextmanager
+    def leitura(self):
+        self.adquirir_leitura()
+        try:
+            yield
+        finally:
+            self.liberar_leitura()
+
+    @contextmanager
+    def escrita(self):
+        self.adquirir_escrita()
+        try:
+            yield
+        finally:
+            self.liberar_escrita()
+
+    def __enter__(self):
+        self.adquirir_escrita()
+        return self
+
+    def __exit__(self, *excecao):
+        self.liberar_escrita()
+
+
+class LimitadorDeBanda:
+    """
+    Balde de fichas partilhado por várias threads: limita a `taxa` bytes/s o total que passa por `consumir`.
+    Rajadas de até `capacidade` bytes passam sem espera. Quem excede fica a dever e dorme o tempo da dívida,
+    fora do lock, por isso os pedidos seguintes esperam também pela dívida dos anteriores.
+    """
+
+    def __init__(self, taxa, capacidade=None):
+        self.taxa = taxa
+        self.capacidade = capacidade or taxa
+        self.fichas = self.capacidade
+        self.instante = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reservar(self, num_bytes):
+        """Tira `num_bytes` do balde e retorna quantos segundos é preciso esperar pela dívida."""
+        with self.lock:
+            agora = time.monotonic()
+            self.fichas = min(self.capacidade, self.fichas + (agora - self.instante) * self.taxa)
+            self.instante = agora
+            self.fichas -= num_bytes
+            return -self.fichas / self.taxa if self.fichas < 0 else 0
+
+    def consumir(self, num_bytes):
+        espera = self._reservar(num_bytes)
+        if espera:
+            time.sleep(espera)
+
+    async def consumir_assincrono(self, num_bytes):
+        """Como `consumir`, mas a espera cede o laço de eventos em vez de dormir a thread."""
+        espera = self._reservar(num_bytes)
+        if espera:
+            await asyncio.sleep(espera)
@@ -0,0 +1,26 @@
+import pytest
+
+from bitfield import bitfield_para_bytes, bytes_para_blocos, codificar_bitfield, decodificar_bitfield
+
+
+@pytest.mark.parametrize('total', [1, 5, 7, 8, 9, 13, 63, 64, 65, 1001])
+def test_ida_e_volta_em_base64(total):
+    conjuntos = [set(), set(range(total)), {0}, {total - 1}, set(range(0, total, 3))]
+    for blocos in conjuntos:
+        assert decodificar_bitfield(codificar_bitfield(blocos, total), total) == blocos
+
+
+@pytest.mark.parametrize('total, tamanho', [(1, 1), (8, 1), (9, 2), (16, 2), (17, 3)])
+def test_tamanho_e_de_um_bit_por_bloco_arredondado_ao_byte(total, tamanho):
+    assert len(bitfield_para_bytes(range(total), total)) == tamanho
+
+
+def test_bloco_zero_e_o_bit_mais_significativo():
+    assert bitfield_para_bytes({0}, 8) == b'\x80'
+    assert bitfield_para_bytes({7, 8}, 10) == b'\x01\x80'
+
+
+def test_bits_de_enchimento_e_ids_fora_do_intervalo_sao_ignorados():
+    assert bytes_para_blocos(b'\xff', 5) == {0, 1, 2, 3, 4}
+    assert bytes_para_blocos(b'\x00\xff', 10) == {8, 9}
+    assert bitfield_para_bytes({-1, 3, 5}, 4) == b'\x10'
@@ -0,0 +1,29 @@
+import pytest
+
+from olho_por_olho import repartir_vagas
+
+
+def test_vagas_repartidas_por_igual_entre_enxames_com_procura():
+    assert repartir_vagas(4, {'a': 10, 'b': 10}) == {'a': 2, 'b': 2}
+
+
+def test_enxame_com_pouca_procura_cede_as_vagas_que_nao_usa():
+    assert repartir_vagas(4, {'a': 1, 'b': 10}) == {'a': 1, 'b': 3}
+    assert repartir_vagas(6, {'a': 1, 'b': 2, 'c': 10}) == {'a': 1, 'b': 2, 'c': 3}
+
+
+def test_sobras_ficam_livres_em_todos_os_enxames():
+    assert repartir_vagas(5, {'a': 0, 'b': 0}) == {'a': 3, 'b': 2}
+    assert repartir_vagas(5, {'a': 1, 'b': 1}) == {'a': 3, 'b': 2}
+
+
+def test_menos_vagas_do_que_enxames():
+    vagas = repartir_vagas(3, {'a': 5, 'b': 5, 'c': 5, 'd': 5})
+    assert sorted(vagas.values()) == [0, 1, 1, 1]
+
+
+@pytest.mark.parametrize('total, interessados', [(0, {'a': 3}), (4, {}), (7, {'a': 2, 'b': 9, 'c': 0})])
+def test_nunca_reparte_mais_do_que_o_total(total, interessados):
+    vagas = repartir_vagas(total, interessados)
+    assert set(vagas) == set(interessados)
+    assert sum(vagas.values()) == (total if interessados else 0)
@@ -0,0 +1,21 @@
+import pytest
+
+from peer import have_invalido
+
+
+def test_aviso_have_valido():
+    assert have_invalido({'peer_id': 'p2', 'address': 'http://127.0.0.1:5102', 'block_id': 3}) is None
+
+
+@pytest.mark.parametrize('dados', [
+    ['p2', 3],
+    {'block_id': 3},
+    {'peer_id': '', 'block_id': 3},
+    {'peer_id': 'p2'},
+    {'peer_id': 'p2', 'block_id': '3'},
+    {'peer_id': 'p2', 'block_id': 3.0},
+    {'peer_id': 'p2', 'block_id': True},
+    {'peer_id': 'p2', 'block_id': None},
+])
+def test_aviso_have_mal_formado_e_recusado(dados):
+    assert have_invalido(dados)
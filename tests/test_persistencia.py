@@ -0,0 +1,84 @@
+import json
+import os
+
+from persistencia import NOME_INSTANTANEO, DiarioDeEstado, escrever_atomico, ler_json
+
+
+def abrir(pasta):
+    diario = DiarioDeEstado(str(pasta))
+    instantaneo, registros = diario.carregar()
+    return diario, instantaneo, registros
+
+
+def test_registos_sobrevivem_a_um_reinicio(tmp_path):
+    diario, instantaneo, registros = abrir(tmp_path)
+    assert (instantaneo, registros) == (None, [])
+    diario.registrar({'op': 'peer', 'id_peer': 'p1'})
+    diario.registrar({'op': 'seq', 'id_peer': 'p1', 'seq': 1})
+    diario.fechar()
+
+    diario, _, registros = abrir(tmp_path)
+    assert [r['op'] for r in registros] == ['peer', 'seq']
+    assert diario.registros == 2
+    diario.fechar()
+
+
+def test_ultima_linha_cortada_e_ignorada(tmp_path):
+    diario, _, _ = abrir(tmp_path)
+    diario.registrar({'op': 'peer', 'id_peer': 'p1'})
+    diario.registrar({'op': 'peer', 'id_peer': 'p2'})
+    caminho = diario.arquivo.name
+    diario.fechar()
+    # Queda a meio da escrita do terceiro registo.
+    with open(caminho, 'a', encoding='utf-8') as arquivo:
+        arquivo.write('{"op": "peer", "id_pe')
+
+    diario, _, registros = abrir(tmp_path)
+    assert [r['id_peer'] for r in registros] == ['p1', 'p2']
+    # Os registos seguintes vão para um diário novo, não para a seguir à linha cortada.
+    assert diario.arquivo.name != caminho
+    diario.registrar({'op': 'peer', 'id_peer': 'p3'})
+    diario.fechar()
+
+    diario, _, registros = abrir(tmp_path)
+    assert [r['id_peer'] for r in registros] == ['p1', 'p2', 'p3']
+    diario.fechar()
+
+
+def test_instantaneo_substitui_os_diarios_anteriores(tmp_path):
+    diario, _, _ = abrir(tmp_path)
+    diario.registrar({'op': 'peer', 'id_peer': 'p1'})
+    geracao = diario.iniciar_instantaneo()
+    diario.registrar({'op': 'peer', 'id_peer': 'p2'})   # Depois da cópia do estado: fica só no diário novo.
+    diario.concluir_instantaneo(geracao, {'peers': ['p1']})
+    diario.fechar()
+    assert not [nome for nome in os.listdir(tmp_path) if nome.startswith('diario.') and int(nome.split('.')[1]) < geracao]
+
+    diario, instantaneo, registros = abrir(tmp_path)
+    assert instantaneo == {'peers': ['p1'], 'geracao': geracao}
+    assert [r['id_peer'] for r in registros] == ['p2']
+    diario.fechar()
+
+
+def test_queda_antes_de_gravar_o_instantaneo_nao_perde_registos(tmp_path):
+    diario, _, _ = abrir(tmp_path)
+    diario.registrar({'op': 'peer', 'id_peer': 'p1'})
+    diario.iniciar_instantaneo()
+    diario.registrar({'op': 'peer', 'id_peer': 'p2'})
+    diario.fechar()   # Sem concluir_instantaneo.
+
+    diario, instantaneo, registros = abrir(tmp_path)
+    assert instantaneo is None
+    assert [r['id_peer'] for r in registros] == ['p1', 'p2']
+    diario.fechar()
+
+
+def test_escrita_atomica_e_leitura_tolerante(tmp_path):
+    caminho = str(tmp_path / NOME_INSTANTANEO)
+    assert ler_json(caminho) is None
+    escrever_atomico(caminho, {'a': [1, 2]})
+    assert ler_json(caminho) == {'a': [1, 2]}
+    assert not os.path.exists(f'{caminho}.tmp')
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        arquivo.write(json.dumps({'a': 1})[:-2])
+    assert ler_json(caminho) is None
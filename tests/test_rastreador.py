@@ -0,0 +1,152 @@
+import pytest
+
+import tracker
+from bitfield import codificar_bitfield
+
+TOTAL = 20
+
+
+@pytest.fixture
+def enxame(monkeypatch):
+    """Enxame com um peer registado ('p1'), servido como o único enxame do rastreador."""
+    enxame = tracker.Enxame('teste', TOTAL)
+    tracker.registrar_posse_blocos(enxame, 'tracker', enxame.blocos_do_rastreador)
+    tracker.registrar_peer_no_enxame(enxame, 'p1', 'http://127.0.0.1:5001')
+    monkeypatch.setattr(tracker, 'enxames', {'teste': enxame})
+    return enxame
+
+
+def bloco_em_falta(enxame, id_peer='p1'):
+    return min(set(range(TOTAL)) - enxame.blocos_dos_peers[id_peer])
+
+
+def test_delta_seguinte_avanca_a_sequencia(enxame):
+    bloco = bloco_em_falta(enxame)
+    resposta = tracker.aplicar_atualizacao(enxame, 'p1', {'have': [bloco], 'seq': 1})
+    assert resposta == {'status': 'updated', 'seq': 1}
+    assert 'p1' in enxame.donos_por_bloco[bloco]
+
+
+def test_delta_repetido_nao_conta_duas_vezes(enxame):
+    bloco = bloco_em_falta(enxame)
+    tracker.aplicar_atualizacao(enxame, 'p1', {'have': [bloco], 'seq': 1})
+    resposta = tracker.aplicar_atualizacao(enxame, 'p1', {'have': [bloco], 'seq': 1})
+    assert resposta == {'status': 'updated', 'seq': 1}
+    assert enxame.disponibilidade_blocos[bloco] == 1
+
+
+def test_salto_na_sequencia_pede_ressincronizacao(enxame):
+    resposta = tracker.aplicar_atualizacao(enxame, 'p1', {'have': [bloco_em_falta(enxame)], 'seq': 3})
+    assert resposta == {'status': 'resync', 'seq': 0}
+
+    # O bitfield completo repõe o estado e a sequência, seja ela qual for.
+    blocos = set(range(TOTAL // 2))
+    resposta = tracker.aplicar_atualizacao(enxame, 'p1', {'bitfield': codificar_bitfield(blocos, TOTAL), 'seq': 3})
+    assert resposta == {'status': 'updated', 'seq': 3}
+    assert blocos <= enxame.blocos_dos_peers['p1']
+    assert tracker.aplicar_atualizacao(enxame, 'p1', {'have': [TOTAL - 1], 'seq': 4})['seq'] == 4
+
+
+def test_formato_antigo_sem_sequencia(enxame):
+    assert tracker.aplicar_atualizacao(enxame, 'p1', {'blocks': [0, 1]}) == {'status': 'updated'}
+    assert {0, 1} <= enxame.blocos_dos_peers['p1']
+
+
+@pytest.mark.parametrize('dados', [{'have': [TOTAL]}, {'have': [-1]}, {'have': ['3']}, {'have': 3}, {'blocks': [0, TOTAL + 5]}])
+def test_ids_fora_do_enxame_sao_recusados(enxame, dados):
+    assert tracker.blocos_invalidos(enxame, dados)
+
+
+@pytest.mark.parametrize('bitfield', ['%%%', 'AAA', 5, codificar_bitfield({0}, TOTAL + 8), codificar_bitfield({0}, TOTAL - 8)])
+def test_bitfield_mal_formado_ou_de_outro_tamanho_e_recusado(enxame, bitfield):
+    assert tracker.blocos_invalidos(enxame, {'bitfield': bitfield})
+
+
+def test_bitfield_do_tamanho_do_enxame_e_aceito(enxame):
+    assert tracker.blocos_invalidos(enxame, {'bitfield': codificar_bitfield({0, TOTAL - 1}, TOTAL)}) is None
+
+
+def test_announce_com_id_invalido_nao_muda_o_estado(enxame):
+    disponibilidade = list(enxame.disponibilidade_blocos)
+    resposta, status = tracker.processar_announce({'peer_id': 'p1', 'address': 'http://127.0.0.1:5001', 'info_hash': 'teste',
+                                                   'have': [0, TOTAL], 'seq': 1}, 1000.0)
+    assert status == 400 and 'error' in resposta
+    assert enxame.disponibilidade_blocos == disponibilidade
+    assert 'p1' not in enxame.ultimo_announce
+    assert enxame.sequencias_dos_peers['p1'] == 0
+
+
+def announce(id_peer, instante, evento=None, restantes=None):
+    dados = {'peer_id': id_peer, 'address': f'http://{id_peer}', 'info_hash': 'teste'}
+    if evento:
+        dados['event'] = evento
+    if restantes is not None:
+        dados['stats'] = {'uploaded': 0, 'downloaded': 0, 'left': restantes}
+    return tracker.processar_announce(dados, instante)[0]
+
+
+def test_contagem_de_semeadores_acompanha_os_announces(enxame):
+    assert announce('p2', 1000.0, 'started', restantes=5)['complete'] == 0
+    resposta = announce('p3', 1000.0, 'started', restantes=0)
+    assert (resposta['complete'], resposta['incomplete']) == (1, 2)
+    assert announce('p2', 1100.0, 'completed', restantes=0)['complete'] == 2
+    assert announce('p2', 1200.0, restantes=0)['complete'] == 2       # 'left' continua 0: não conta duas vezes.
+    assert announce('p3', 1200.0, 'started', restantes=3)['complete'] == 1   # Reinício com peças em falta.
+    announce('p2', 1300.0, 'stopped')
+    assert enxame.semeadores == 0
+    assert enxame.semeadores == sum(1 for e in enxame.estatisticas_dos_peers.values() if e.get('left') == 0)
+
+
+def test_rotas_recusam_bitfield_invalido_sem_mudar_o_estado(enxame):
+    cliente = tracker.app.test_client()
+    blocos = set(enxame.blocos_dos_peers['p1'])
+    resposta = cliente.post('/update_blocks', json={'peer_id': 'p1', 'info_hash': 'teste', 'bitfield': '%%%', 'seq': 1})
+    assert resposta.status_code == 400
+    resposta = cliente.post('/register', json={'peer_id': 'p2', 'address': 'http://p2', 'info_hash': 'teste', 'bitfield': '%%%'})
+    assert resposta.status_code == 400
+    assert enxame.blocos_dos_peers['p1'] == blocos and 'p2' not in enxame.peers_ativos
+
+
+class DiarioEmMemoria:
+    def __init__(self):
+        self.registros = []
+
+    def registrar(self, registro):
+        self.registros.append(registro)
+
+
+@pytest.mark.parametrize('erro', [{'address': None}, {'address': ''}, {'bitfield': '%%%'}, {'bitfield': 'AA=='}])
+def test_started_mal_formado_nao_remove_um_peer_conhecido(enxame, monkeypatch, erro):
+    diario = DiarioEmMemoria()
+    monkeypatch.setattr(tracker, 'diario', diario)
+    blocos = set(enxame.blocos_dos_peers['p1'])
+    dados = {'peer_id': 'p1', 'address': 'http://127.0.0.1:5001', 'info_hash': 'teste', 'event': 'started'}
+    dados.update(erro)
+    if dados['address'] is None:
+        del dados['address']
+    resposta, status = tracker.processar_announce(dados, 1000.0)
+    assert status == 400 and 'error' in resposta
+    assert 'p1' in enxame.peers_ativos and enxame.blocos_dos_peers['p1'] == blocos
+    assert diario.registros == []
+
+
+@pytest.mark.parametrize('mudanca', [
+    {'peer_id': None}, {'peer_id': ''}, {'peer_id': ['p9']}, {'address': None}, {'event': 'pausado'},
+    {'stats': [1]}, {'stats': {'left': -1}}, {'stats': {'uploaded': '10'}}, {'seq': 'um'}, {'num_want': -3},
+])
+def test_announce_com_campos_invalidos_e_recusado(enxame, mudanca):
+    dados = {'peer_id': 'p9', 'address': 'http://p9', 'info_hash': 'teste', 'stats': {'uploaded': 0, 'downloaded': 0, 'left': 3}}
+    dados.update(mudanca)
+    dados = {campo: valor for campo, valor in dados.items() if valor is not None}
+    resposta, status = tracker.processar_announce(dados, 1000.0)
+    assert status == 400 and 'error' in resposta
+    assert 'p9' not in enxame.peers_ativos and enxame.semeadores == 0
+
+
+def test_rotas_recusam_pedidos_sem_identificacao(enxame):
+    cliente = tracker.app.test_client()
+    assert cliente.post('/announce', json={'info_hash': 'teste', 'address': 'http://p9'}).status_code == 400
+    assert cliente.post('/announce', json=[1, 2]).status_code == 400
+    assert cliente.post('/register', json={'peer_id': 'p9', 'info_hash': 'teste'}).status_code == 400
+    assert cliente.post('/update_blocks', json={'info_hash': 'teste', 'have': [0]}).status_code == 400
+    assert cliente.post('/update_blocks', json={'peer_id': 'p1', 'info_hash': 'teste', 'have': [0], 'seq': 'x'}).status_code == 400
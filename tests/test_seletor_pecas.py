@@ -0,0 +1,129 @@
+import random
+
+from seletor_pecas import SeletorDePecas
+
+
+def novo_seletor(partes_por_peca, pecas_aleatorias_iniciais=0):
+    return SeletorDePecas(partes_por_peca, pecas_aleatorias_iniciais, gerador=random.Random(7))
+
+
+def verificar_baldes(seletor):
+    """Cada peça em falta está no balde da sua disponibilidade, na posição registada; as obtidas em nenhum."""
+    vistas = set()
+    for contagem, balde in seletor.baldes.items():
+        assert balde, 'balde vazio deveria ter sido apagado'
+        for indice, peca in enumerate(balde):
+            assert len(seletor.donos[peca]) == contagem
+            assert seletor.posicao[peca] == indice
+            vistas.add(peca)
+    assert vistas == set(range(seletor.total_de_pecas)) - seletor.minhas_pecas
+    assert set(seletor.posicao) == vistas
+    assert seletor.contagens == sorted(seletor.baldes)
+
+
+def test_have_sobe_a_peca_de_balde():
+    seletor = novo_seletor([1] * 4)
+    seletor.registrar_have('a', 2)
+    assert seletor.baldes[1] == [2]
+    assert sorted(seletor.baldes[0]) == [0, 1, 3]
+    seletor.registrar_have('b', 2)
+    assert seletor.baldes[2] == [2] and 1 not in seletor.baldes
+    verificar_baldes(seletor)
+
+
+def test_have_repetido_ou_fora_do_intervalo_nao_muda_os_baldes():
+    seletor = novo_seletor([1] * 4)
+    seletor.registrar_have('a', 1)
+    seletor.registrar_have('a', 1)
+    seletor.registrar_have('a', 4)
+    seletor.registrar_have('a', -1)
+    assert seletor.donos[1] == {'a'}
+    assert seletor.pecas_dos_peers['a'] == {1}
+    verificar_baldes(seletor)
+
+
+def test_saida_de_um_peer_desce_as_suas_pecas_de_balde():
+    seletor = novo_seletor([1] * 5)
+    seletor.registrar_bitfield('a', {0, 1, 2})
+    seletor.registrar_bitfield('b', {1, 2})
+    seletor.registrar_have('c', 2)
+    assert [len(seletor.donos[peca]) for peca in range(5)] == [1, 2, 3, 0, 0]
+
+    seletor.remover_peer('b')
+    assert [len(seletor.donos[peca]) for peca in range(5)] == [1, 1, 2, 0, 0]
+    verificar_baldes(seletor)
+    seletor.remover_peer('a')
+    seletor.remover_peer('c')
+    assert list(seletor.baldes) == [0]
+    verificar_baldes(seletor)
+
+
+def test_novo_bitfield_substitui_o_anterior():
+    seletor = novo_seletor([1] * 4)
+    seletor.registrar_bitfield('a', {0, 1})
+    seletor.registrar_bitfield('a', {1, 3})
+    assert seletor.donos[0] == set() and seletor.donos[3] == {'a'}
+    verificar_baldes(seletor)
+
+
+def test_peca_obtida_sai_dos_baldes_e_volta_se_for_perdida():
+    seletor = novo_seletor([1] * 3)
+    seletor.registrar_bitfield('a', {0, 1, 2})
+    seletor.marcar_peca_obtida(1)
+    assert seletor.pecas_faltantes() == 2
+    verificar_baldes(seletor)
+    seletor.registrar_have('b', 1)   # Uma peça já obtida continua a contar donos, mas fora dos baldes.
+    verificar_baldes(seletor)
+    seletor.perder_peca(1)
+    assert seletor.baldes[2] == [1]
+    verificar_baldes(seletor)
+
+
+def test_escolhe_a_peca_mais_rara():
+    seletor = novo_seletor([1] * 3)
+    seletor.registrar_bitfield('a', {0, 1, 2})
+    seletor.registrar_bitfield('b', {1, 2})
+    seletor.registrar_bitfield('c', {2})
+    assert seletor.escolher({'a', 'b', 'c'}, {}) == (0, 0, 'a')
+
+
+def test_modo_aleatorio_escolhe_qualquer_peca_com_fonte_livre():
+    seletor = novo_seletor([1] * 6, pecas_aleatorias_iniciais=4)
+    seletor.registrar_bitfield('a', {0, 1, 2})
+    seletor.registrar_bitfield('b', {2, 3})
+    escolhidas = set()
+    for _ in range(200):
+        peca, _, _ = seletor.escolher({'a', 'b'}, {(0, 0): {'a'}})
+        seletor.descartar_peca(peca)   # Sem peças começadas, cada escolha volta a ser ao acaso.
+        escolhidas.add(peca)
+    assert escolhidas == {1, 2, 3}   # Nem a peça em voo, nem as que ninguém tem.
+    assert seletor.escolher({'b'}, {(2, 0): {'a'}, (3, 0): {'b'}}) is None
+    verificar_baldes(seletor)
+
+
+def test_termina_pecas_comecadas_antes_de_outras():
+    seletor = novo_seletor([2, 2])
+    seletor.registrar_bitfield('a', {0, 1})
+    peca, parte, _ = seletor.escolher({'a'}, {})
+    seguinte = seletor.escolher({'a'}, {(peca, parte): {'a'}})
+    assert seguinte == (peca, 1 - parte, 'a')
+    assert seletor.escolher({'a'}, {(peca, 0): {'a'}, (peca, 1): {'a'}})[0] == 1 - peca
+
+
+def test_sem_fonte_livre_nao_escolhe_nada():
+    seletor = novo_seletor([1] * 2)
+    seletor.registrar_bitfield('a', {0, 1})
+    assert seletor.escolher({'b'}, {}) is None
+    assert seletor.escolher(set(), {}) is None
+
+
+def test_endgame_pede_a_mesma_parte_a_varias_fontes_ate_o_limite():
+    seletor = novo_seletor([1])
+    for id_peer in 'abc':
+        seletor.registrar_have(id_peer, 0)
+    em_voo = {}
+    for _ in range(2):
+        peca, parte, fonte = seletor.escolher_endgame({'a', 'b', 'c'}, em_voo, 2)
+        em_voo.setdefault((peca, parte), set()).add(fonte)
+    assert len(em_voo[(0, 0)]) == 2
+    assert seletor.escolher_endgame({'a', 'b', 'c'}, em_voo, 2) is None
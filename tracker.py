@@ -1,38 +1,480 @@
+import base64
 import flask
 import random
 import threading
 import logging
+import os
+import time
+
+from bitfield import codificar_bitfield, decodificar_bitfield
+from metainfo import ArmazenamentoPecas, carregar_metainfo, gerar_arquivo_exemplo, gerar_metainfo, salvar_metainfo
+from metricas import TIPO_CONTEUDO, LockMedido, LogAmostrado, RegistroMetricas, metricas_de_lock, registrar_em_segundo_plano
+from persistencia import DiarioDeEstado
+from sincronizacao import LockLeituraEscrita
 
 # Configuração básica do sistema de logs para exibir mensagens no terminal.
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Mensagens por peer (registo, atualização, saída) repetem-se a cada pedido: são amostradas.
+log_amostrado = LogAmostrado(logging.getLogger())
+
+# --- Intervalos de announce ---
+INTERVALO_MINIMO_ANNOUNCE = 5        # Segundos: intervalo mínimo sugerido aos peers, mesmo com a rede vazia.
+INTERVALO_MAXIMO_ANNOUNCE = 300      # Segundos: teto do intervalo, por maior que seja a rede.
+ANNOUNCES_POR_SEGUNDO_ALVO = 50      # Taxa de announces que o rastreador procura manter com a rede toda.
+PEDIDOS_POR_SEGUNDO_ALVO = 200       # Acima desta taxa total de pedidos, os intervalos crescem na mesma proporção.
+JANELA_TAXA = 10                     # Segundos da janela usada para medir a taxa de pedidos.
+EVENTOS_ANNOUNCE = (None, 'started', 'completed', 'stopped')   # Valores aceites em 'event' (None: announce periódico).
+CAMPOS_ESTATISTICAS = ('uploaded', 'downloaded', 'left')        # Contadores de 'stats', inteiros não negativos.
+
+# --- Persistência (opcional, com --pasta-estado) ---
+INTERVALO_FSYNC = 1                  # Segundos entre fsyncs do diário: uma queda da máquina perde no máximo isto.
+INTERVALO_INSTANTANEO = 60           # Segundos entre instantâneos compactos do estado.
+MAX_REGISTROS_DIARIO = 100_000       # Com este número de registos no diário, o instantâneo é antecipado.
+
+# --- Métricas (rota '/metrics') ---
+metricas = RegistroMetricas()
+latencia_por_endpoint = metricas.histograma('minibit_rastreador_pedido_segundos', 'Tempo de atendimento de cada pedido, por endpoint.', ('endpoint',))
+announces_por_evento = metricas.contador('minibit_rastreador_announces_total', 'Announces recebidos, por evento e status HTTP.', ('evento', 'status'))
 
 # --- Variáveis Globais ---
-TOTAL_DE_BLOCOS = 50                 # O número total de blocos que compõem o ficheiro.
-peers_ativos = {}                    # Dicionário para armazenar os peers ativos e os seus endereços. Ex: {'peer_1': 'http://127.0.0.1:5001'}.
-blocos_dos_peers = {}                # Dicionário que mapeia cada peer aos blocos que ele possui.
-lock = threading.Lock()              # Lock para garantir o acesso seguro às estruturas de dados partilhadas em ambiente com múltiplas threads.
-blocos_do_rastreador = set(range(TOTAL_DE_BLOCOS))     # O rastreador conhece todos os blocos para a distribuição inicial.
-blocos_nao_distribuidos = set(range(TOTAL_DE_BLOCOS)) # Conjunto para controlar os blocos que ainda não foram entregues a nenhum peer.
+TOTAL_DE_BLOCOS = 50                 # Número de blocos do ficheiro de exemplo gerado quando nenhum é indicado.
+enxames = {}                         # Enxames servidos pelo rastreador, indexados pelo info-hash do ficheiro. Ex: {'9f2c...': Enxame}.
+# Lock de leitores/escritor das estruturas partilhadas: `with lock:` escreve, `with lock.leitura():` lê.
+# Cada uso mede o tempo de espera e de posse (minibit_rastreador_lock_*).
+lock = LockMedido(LockLeituraEscrita(), *metricas_de_lock(metricas, 'minibit_rastreador'), 'rastreador')
+lock_trafego = threading.Lock()      # Lock próprio dos contadores de tráfego, para não disputar o lock principal em cada pedido.
+inicio_janela_taxa = time.time()     # Início da janela atual de contagem de pedidos.
+pedidos_na_janela = 0                # Pedidos recebidos desde `inicio_janela_taxa`.
+taxa_de_pedidos = 0.0                # Pedidos por segundo medidos na última janela completa.
+trafego_por_endpoint = {}            # Bytes recebidos/enviados por endpoint. Ex: {'/update_blocks': {'requisicoes': 3, 'bytes_recebidos': 120, 'bytes_enviados': 90}}.
+diario = None                        # DiarioDeEstado onde cada mudança dos enxames é anotada (None: estado só em memória).
 
 # Inicializa a aplicação Flask.
 app = flask.Flask(__name__)
 
-def obter_peers_aleatorios(id_peer_solicitante, num_peers=5):
+def contadores_de_trafego(campo):
+    with lock_trafego:
+        return {(endpoint,): contadores[campo] for endpoint, contadores in trafego_por_endpoint.items()}
+
+metricas.contador('minibit_rastreador_pedidos_total', 'Pedidos atendidos, por endpoint.', ('endpoint',),
+                  funcao=lambda: contadores_de_trafego('requisicoes'))
+metricas.contador('minibit_rastreador_bytes_recebidos_total', 'Bytes recebidos, por endpoint.', ('endpoint',),
+                  funcao=lambda: contadores_de_trafego('bytes_recebidos'))
+metricas.contador('minibit_rastreador_bytes_enviados_total', 'Bytes enviados, por endpoint.', ('endpoint',),
+                  funcao=lambda: contadores_de_trafego('bytes_enviados'))
+metricas.medidor('minibit_rastreador_pedidos_por_segundo', 'Taxa de pedidos medida na última janela.', funcao=lambda: taxa_de_pedidos)
+metricas.medidor('minibit_rastreador_peers', 'Peers ativos, por enxame.', ('info_hash',),
+                 funcao=lambda: {(h,): len(e.peers_ativos) for h, e in list(enxames.items())})
+metricas.medidor('minibit_rastreador_intervalo_announce_segundos', "'interval' sugerido agora aos peers.",
+                 funcao=lambda: calcular_intervalos()[0])
+
+class Enxame:
+    """Estado de um enxame: os peers que partilham um ficheiro, os blocos de cada um e o índice invertido."""
+
+    def __init__(self, info_hash, total_de_blocos, metainfo=None, armazenamento=None):
+        self.info_hash = info_hash
+        self.total_de_blocos = total_de_blocos           # O número total de blocos que compõem o ficheiro.
+        self.metainfo = metainfo                         # Metainfo (tamanho das peças e hashes) do ficheiro distribuído.
+        self.armazenamento = armazenamento               # Peças do ficheiro original, servidas aos peers na distribuição inicial.
+        self.peers_ativos = {}                           # Peers ativos e os seus endereços. Ex: {'peer_1': 'http://127.0.0.1:5001'}.
+        self.ids_dos_peers = []                          # IDs dos peers ativos numa lista, para sortear amostras sem copiar o dicionário inteiro.
+        self.blocos_dos_peers = {}                       # Dicionário que mapeia cada peer aos blocos que ele possui.
+        self.donos_por_bloco = {}                        # Índice invertido que mapeia cada bloco aos peers que o possuem. Ex: {3: {'peer_1', 'peer_4'}}.
+        self.disponibilidade_blocos = [0] * total_de_blocos       # Contador de quantos peers possuem cada bloco (mantido junto ao índice).
+        self.blocos_do_rastreador = set(range(total_de_blocos))     # O rastreador conhece todos os blocos para a distribuição inicial.
+        self.blocos_nao_distribuidos = set(range(total_de_blocos))  # Blocos que ainda não foram entregues a nenhum peer.
+        self.sequencias_dos_peers = {}                   # Último número de sequência de atualização aplicado para cada peer.
+        self.ultimo_announce = {}                        # Instante do último announce aceito de cada peer.
+        self.estatisticas_dos_peers = {}                 # Últimas estatísticas enviadas em cada announce. Ex: {'peer_1': {'uploaded': 0, 'downloaded': 0, 'left': 40}}.
+        self.semeadores = 0                              # Peers cujas últimas estatísticas têm 'left' == 0 ('complete' do announce).
+
+def carregar_conteudo(metainfo, caminho_arquivo):
+    """Acrescenta ao rastreador o enxame de um ficheiro, indexado pelo info-hash do seu metainfo."""
+    enxame = Enxame(metainfo['info_hash'], len(metainfo['pieces']), metainfo, ArmazenamentoPecas(caminho_arquivo, metainfo))
+    # Define que a entidade 'tracker' possui todos os blocos (apenas para referência interna).
+    registrar_posse_blocos(enxame, 'tracker', enxame.blocos_do_rastreador)
+    with lock:
+        enxames[enxame.info_hash] = enxame
+    return enxame
+
+def obter_enxame(info_hash):
+    """
+    Retorna o enxame do info-hash, ou None se o rastreador não o conhecer.
+    Sem info-hash, vale o único enxame do rastreador, para que peers de um só ficheiro continuem a funcionar.
     """
-    Retorna uma lista de peers aleatórios da rede, excluindo o próprio solicitante.
+    if info_hash is None and len(enxames) == 1:
+        return next(iter(enxames.values()))
+    return enxames.get(info_hash)
+
+def enxame_desconhecido():
+    return flask.jsonify({'error': 'Enxame desconhecido'}), 404
+
+def anotar(enxame, operacao, **campos):
+    """Acrescenta ao diário uma mudança do enxame, se a persistência estiver ativa. Deve ser chamada com o `lock` adquirido."""
+    if diario is not None:
+        diario.registrar(dict(campos, op=operacao, info_hash=enxame.info_hash))
+
+@app.before_request
+def marcar_inicio_pedido():
+    flask.g.inicio_pedido = time.perf_counter()
+
+@app.after_request
+def contabilizar_trafego(resposta):
+    """Acumula os bytes que passaram pelo fio em cada endpoint, mede a latência e a taxa de pedidos do rastreador."""
+    global inicio_janela_taxa, pedidos_na_janela, taxa_de_pedidos
+    recebidos = flask.request.content_length or 0
+    enviados = resposta.calculate_content_length() or 0
+    endpoint = flask.request.url_rule.rule if flask.request.url_rule else flask.request.path
+    latencia_por_endpoint.observar(time.perf_counter() - flask.g.inicio_pedido, endpoint)
+    with lock_trafego:
+        contadores = trafego_por_endpoint.setdefault(endpoint, {'requisicoes': 0, 'bytes_recebidos': 0, 'bytes_enviados': 0})
+        contadores['requisicoes'] += 1
+        contadores['bytes_recebidos'] += recebidos
+        contadores['bytes_enviados'] += enviados
+
+        pedidos_na_janela += 1
+        agora = time.time()
+        if agora - inicio_janela_taxa >= JANELA_TAXA:
+            taxa_de_pedidos = pedidos_na_janela / (agora - inicio_janela_taxa)
+            inicio_janela_taxa, pedidos_na_janela = agora, 0
+    return resposta
+
+def calcular_intervalos():
+    """
+    Calcula (interval, min_interval) do announce a partir da carga do rastreador.
+    O intervalo cresce com o número de peers (somado em todos os enxames, pois cada peer anuncia-se em cada
+    enxame) para manter cerca de ANNOUNCES_POR_SEGUNDO_ALVO announces/s, e cresce mais se a taxa total de
+    pedidos medida passar de PEDIDOS_POR_SEGUNDO_ALVO.
+    """
+    with lock_trafego:
+        fator_carga = max(1.0, taxa_de_pedidos / PEDIDOS_POR_SEGUNDO_ALVO)
+    num_peers = sum(len(enxame.ids_dos_peers) for enxame in list(enxames.values()))
+    intervalo = num_peers / ANNOUNCES_POR_SEGUNDO_ALVO * fator_carga
+    intervalo = int(min(INTERVALO_MAXIMO_ANNOUNCE, max(INTERVALO_MINIMO_ANNOUNCE, intervalo)))
+    return intervalo, max(1, intervalo // 2)
+
+def obter_peers_aleatorios(enxame, id_peer_solicitante, num_peers=5):
+    """
+    Retorna uma lista de peers aleatórios do enxame, excluindo o próprio solicitante.
     Se a rede tiver menos de `num_peers` (além do solicitante), retorna todos os peers disponíveis.
+    O custo é O(num_peers): sorteia um a mais e descarta o solicitante, sem percorrer a rede toda.
     """
-    with lock:
-        # Cria uma lista com todos os IDs de peers, exceto o que fez o pedido.
-        peers_disponiveis = [pid for pid in peers_ativos if pid != id_peer_solicitante]
+    with lock.leitura():
+        amostra = random.sample(enxame.ids_dos_peers, min(num_peers + 1, len(enxame.ids_dos_peers)))
+        ids_peers_aleatorios = [pid for pid in amostra if pid != id_peer_solicitante][:num_peers]
+        return {pid: enxame.peers_ativos[pid] for pid in ids_peers_aleatorios}
+
+def registrar_posse_blocos(enxame, id_peer, blocos):
+    """
+    Acrescenta `blocos` ao conjunto do peer e atualiza incrementalmente o índice invertido.
+    Apenas os blocos realmente novos tocam no índice, logo o custo é proporcional ao delta.
+    Deve ser chamada com o `lock` adquirido.
+    """
+    blocos_atuais = enxame.blocos_dos_peers.setdefault(id_peer, set())
+    novos_blocos = set(blocos) - blocos_atuais
+    blocos_atuais.update(novos_blocos)
+
+    # O rastreador não é uma fonte válida para os peers, por isso não entra no índice.
+    if id_peer == 'tracker':
+        return novos_blocos
+
+    if novos_blocos and diario is not None:
+        anotar(enxame, 'posse', id_peer=id_peer, blocos=sorted(novos_blocos))
+    # Referências locais: ao restaurar um estado guardado, este laço corre para todos os blocos de todos os peers.
+    donos_por_bloco, disponibilidade = enxame.donos_por_bloco, enxame.disponibilidade_blocos
+    for id_bloco in novos_blocos:
+        donos = donos_por_bloco.get(id_bloco)
+        if donos is None:
+            donos = donos_por_bloco[id_bloco] = set()
+        donos.add(id_peer)
+        disponibilidade[id_bloco] += 1
+    return novos_blocos
+
+def blocos_invalidos(enxame, dados):
+    """
+    Verifica os blocos de um registo ou de uma atualização: os IDs em 'have' ou 'blocks' e o 'bitfield', que tem
+    de ser base64 estrito com exatamente um bit por bloco do enxame (arredondado ao byte).
+    Retorna a mensagem de erro se algo não for válido, ou None. Deve ser chamada antes de mudar
+    qualquer estado, para que uma atualização inválida não chegue ao índice nem ao diário.
+    """
+    blocos = dados.get('have', dados.get('blocks', []))
+    if not isinstance(blocos, list):
+        return "'have'/'blocks' deve ser uma lista de IDs de blocos"
+    total_de_blocos = enxame.total_de_blocos
+    for id_bloco in blocos:
+        if type(id_bloco) is not int or not 0 <= id_bloco < total_de_blocos:
+            return f"Bloco inválido: {id_bloco!r} (o enxame tem {total_de_blocos} blocos)"
+    if dados.get('bitfield') is not None:
+        try:
+            campo = base64.b64decode(dados['bitfield'], validate=True)
+        except (TypeError, ValueError):
+            return "'bitfield' não é base64 válido"
+        if len(campo) != (total_de_blocos + 7) // 8:
+            return f"'bitfield' com {len(campo)} bytes; o enxame tem {total_de_blocos} blocos"
+    return None
+
+def announce_invalido(enxame, dados):
+    """
+    Verifica um announce antes de tomar o lock. Um 'started' remove primeiro o estado anterior do peer (e anota-o
+    no diário), por isso tudo o que o registo vai ler tem de ser validado antes. Retorna a mensagem de erro ou None.
+    """
+    if not identificador_valido(dados.get('peer_id')):
+        return "'peer_id' é obrigatório"
+    if dados.get('event') not in EVENTOS_ANNOUNCE:
+        return f"'event' inválido: {dados['event']!r}"
+    if dados.get('event') != 'stopped' and not texto_preenchido(dados.get('address')):
+        return "'address' é obrigatório"
+    for campo in ('seq', 'num_want'):
+        if campo in dados and not inteiro_nao_negativo(dados[campo]):
+            return f"'{campo}' deve ser um inteiro não negativo"
+    if 'stats' in dados:
+        estatisticas = dados['stats']
+        if not isinstance(estatisticas, dict):
+            return "'stats' deve ser um objeto {'uploaded', 'downloaded', 'left'}"
+        for campo in CAMPOS_ESTATISTICAS:
+            if campo in estatisticas and not inteiro_nao_negativo(estatisticas[campo]):
+                return f"'stats.{campo}' deve ser um inteiro não negativo"
+    return blocos_invalidos(enxame, dados)
+
+def texto_preenchido(valor):
+    return isinstance(valor, str) and bool(valor)
+
+def identificador_valido(valor):
+    """IDs de peers são texto; o simulador de enxame usa inteiros, para uma ordem reprodutível nos conjuntos."""
+    return texto_preenchido(valor) or type(valor) is int
+
+def inteiro_nao_negativo(valor):
+    return type(valor) is int and valor >= 0
+
+def obter_donos_dos_blocos(enxame, ids_dos_blocos):
+    """
+    Consulta o índice invertido e retorna {id_bloco (str): [peers que o possuem]}.
+    O custo é O(k) no número de blocos pedidos, independente do número de peers na rede.
+    Deve ser chamada com o `lock` adquirido.
+    """
+    return {str(id_bloco): list(enxame.donos_por_bloco.get(id_bloco, ())) for id_bloco in ids_dos_blocos}
+
+def registrar_peer_no_enxame(enxame, id_peer, endereco_peer, bitfield=None):
+    """
+    Regista um novo peer e distribui-lhe um conjunto inicial de blocos, garantindo que todos os blocos
+    sejam eventualmente disponibilizados na rede. `bitfield` (base64) traz os blocos que o peer já possui.
+    Retorna o corpo da resposta de registo. Deve ser chamada com o `lock` adquirido.
+    """
+    if bitfield:
+        registrar_posse_blocos(enxame, id_peer, decodificar_bitfield(bitfield, enxame.total_de_blocos))
+
+    # Só regista o peer se ele não for já conhecido.
+    if id_peer not in enxame.peers_ativos:
+        enxame.peers_ativos[id_peer] = endereco_peer
+        enxame.ids_dos_peers.append(id_peer)
+        anotar(enxame, 'peer', id_peer=id_peer, endereco=endereco_peer)
+        blocos_nao_distribuidos = enxame.blocos_nao_distribuidos
         
-        # Se houver poucos peers, retorna todos os que estão disponíveis.
-        if len(peers_disponiveis) < num_peers:
-            return {pid: peers_ativos[pid] for pid in peers_disponiveis}
-        # Caso contrário, seleciona uma amostra aleatória.
+        num_blocos_para_entregar = min(10, enxame.total_de_blocos)
+        blocos_iniciais = []
+
+        # LÓGICA CRÍTICA: Prioriza a distribuição de blocos que ainda não estão na rede.
+        if blocos_nao_distribuidos:
+            # Calcula quantos blocos não distribuídos pode entregar.
+            num_a_atribuir = min(num_blocos_para_entregar, len(blocos_nao_distribuidos))
+            blocos_para_atribuir = random.sample(list(blocos_nao_distribuidos), k=num_a_atribuir)
+            
+            # Atualiza o conjunto de blocos não distribuídos, removendo os que acabaram de ser entregues.
+            for bloco in blocos_para_atribuir:
+                blocos_nao_distribuidos.remove(bloco)
+            anotar(enxame, 'distribuidos', blocos=blocos_para_atribuir)
+            blocos_iniciais = blocos_para_atribuir
+        # Se todos os blocos já foram distribuídos pelo menos uma vez, entrega um conjunto totalmente aleatório.
         else:
-            ids_peers_aleatorios = random.sample(peers_disponiveis, num_peers)
-            return {pid: peers_ativos[pid] for pid in ids_peers_aleatorios}
+            log_amostrado.registrar('todos_distribuidos', logging.INFO, "Todos os blocos já foram distribuídos. Fornecendo conjunto aleatório.")
+            blocos_iniciais = random.sample(list(enxame.blocos_do_rastreador), k=num_blocos_para_entregar)
+
+        # Armazena os blocos que o novo peer possui e atualiza o índice invertido.
+        registrar_posse_blocos(enxame, id_peer, blocos_iniciais)
+        log_amostrado.registrar('registo', logging.INFO, f"Peer {id_peer} registado com {len(blocos_iniciais)} blocos iniciais. "
+                                f"{len(blocos_nao_distribuidos)} blocos restantes para a distribuição inicial.")
+
+    blocos_do_peer = enxame.blocos_dos_peers.get(id_peer, set())
+    # Um novo registo reinicia a sequência de atualizações do peer.
+    enxame.sequencias_dos_peers[id_peer] = 0
+    anotar(enxame, 'seq', id_peer=id_peer, seq=0)
+    return {
+        'status': 'registered',
+        'info_hash': enxame.info_hash,
+        'initial_blocks': list(blocos_do_peer),
+        'bitfield': codificar_bitfield(blocos_do_peer, enxame.total_de_blocos),
+        'total_blocks': enxame.total_de_blocos,
+        'seq': 0
+    }
+
+def aplicar_atualizacao(enxame, id_peer, dados):
+    """
+    Aplica uma atualização de blocos de um peer já registado. Aceita três formatos:
+      - 'have' + 'seq': apenas os blocos novos desde a última atualização (delta), com número de sequência;
+      - 'bitfield' (+ 'seq'): o estado completo em base64, usado para ressincronizar;
+      - 'blocks': a lista completa em JSON (formato antigo, mantido por compatibilidade).
+    Retorna o corpo da resposta: 'resync' se a sequência tiver um buraco (atualização perdida).
+    Deve ser chamada com o `lock` adquirido.
+    """
+    sequencia = dados.get('seq')
+    if 'have' in dados:
+        novos_blocos = dados['have']
+    elif 'bitfield' in dados:
+        novos_blocos = decodificar_bitfield(dados['bitfield'], enxame.total_de_blocos)
+    else:
+        novos_blocos = dados.get('blocks', [])
+
+    # Como os blocos só são acrescentados, aplicar um delta repetido ou fora de ordem é inofensivo.
+    if registrar_posse_blocos(enxame, id_peer, novos_blocos):
+        log_amostrado.registrar('atualizacao', logging.INFO, f"Peer {id_peer} atualizou. Total de blocos agora: {len(enxame.blocos_dos_peers[id_peer])}")
+
+    if sequencia is None:
+        return {'status': 'updated'}
+
+    ultima_sequencia = enxame.sequencias_dos_peers.get(id_peer, 0)
+    if 'bitfield' in dados or sequencia == ultima_sequencia + 1:
+        enxame.sequencias_dos_peers[id_peer] = max(sequencia, ultima_sequencia)
+        anotar(enxame, 'seq', id_peer=id_peer, seq=enxame.sequencias_dos_peers[id_peer])
+    elif sequencia > ultima_sequencia + 1:
+        logging.warning(f"Peer {id_peer} saltou da sequência {ultima_sequencia} para {sequencia}. Pedindo ressincronização.")
+        return {'status': 'resync', 'seq': ultima_sequencia}
+    # sequencia <= ultima_sequencia: atualização atrasada ou repetida, já refletida no estado.
+    return {'status': 'updated', 'seq': enxame.sequencias_dos_peers[id_peer]}
+
+def definir_estatisticas(enxame, id_peer, estatisticas):
+    """
+    Guarda as estatísticas do announce de um peer e atualiza o contador de semeadores quando 'left' passa
+    de ou para 0, para que o announce não percorra todos os peers. Deve ser chamada com o `lock` adquirido.
+    """
+    anteriores = enxame.estatisticas_dos_peers.get(id_peer)
+    enxame.semeadores += (estatisticas.get('left') == 0) - (anteriores is not None and anteriores.get('left') == 0)
+    enxame.estatisticas_dos_peers[id_peer] = estatisticas
+
+def remover_peer(enxame, id_peer):
+    """Retira um peer do enxame e do índice invertido. Deve ser chamada com o `lock` adquirido."""
+    if enxame.peers_ativos.pop(id_peer, None) is None:
+        return
+    anotar(enxame, 'saida', id_peer=id_peer)
+    enxame.ids_dos_peers.remove(id_peer)
+    for id_bloco in enxame.blocos_dos_peers.pop(id_peer, set()):
+        enxame.donos_por_bloco[id_bloco].discard(id_peer)
+        enxame.disponibilidade_blocos[id_bloco] -= 1
+    for estado in (enxame.sequencias_dos_peers, enxame.ultimo_announce):
+        estado.pop(id_peer, None)
+    estatisticas = enxame.estatisticas_dos_peers.pop(id_peer, None)
+    if estatisticas is not None and estatisticas.get('left') == 0:
+        enxame.semeadores -= 1
+    log_amostrado.registrar('saida', logging.INFO, f"Peer {id_peer} saiu da rede.")
+
+# --- Persistência: diário de mudanças e instantâneos compactos ---
+
+def blocos_compactos(blocos, total_de_blocos):
+    """Lista de IDs se o peer tiver poucos blocos, bitfield (base64) caso contrário: o que ocupar menos no JSON."""
+    if len(blocos) * 36 < total_de_blocos:
+        return sorted(blocos)
+    return codificar_bitfield(blocos, total_de_blocos)
+
+def expandir_blocos(blocos, total_de_blocos):
+    return decodificar_bitfield(blocos, total_de_blocos) if isinstance(blocos, str) else blocos
+
+def estado_do_rastreador():
+    """
+    Copia o estado persistente dos enxames: peers, blocos de cada um, sequências e blocos por distribuir.
+    O índice invertido e os contadores de disponibilidade são reconstruídos a partir daqui.
+    Deve ser chamada com o `lock` adquirido (basta a leitura).
+    """
+    estado = {}
+    for enxame in enxames.values():
+        total = enxame.total_de_blocos
+        estado[enxame.info_hash] = {
+            'nao_distribuidos': codificar_bitfield(enxame.blocos_nao_distribuidos, total),
+            'peers': {pid: [endereco, blocos_compactos(enxame.blocos_dos_peers.get(pid, ()), total),
+                            enxame.sequencias_dos_peers.get(pid, 0)]
+                      for pid, endereco in enxame.peers_ativos.items()}}
+    return {'enxames': estado}
+
+def restaurar_instantaneo(instantaneo):
+    """Aplica um instantâneo aos enxames carregados. Enxames que já não são servidos são ignorados."""
+    for info_hash, estado in instantaneo['enxames'].items():
+        enxame = enxames.get(info_hash)
+        if enxame is None:
+            logging.warning(f"Enxame {info_hash} do estado guardado não é servido por este rastreador. Ignorado.")
+            continue
+        enxame.blocos_nao_distribuidos = decodificar_bitfield(estado['nao_distribuidos'], enxame.total_de_blocos)
+        for id_peer, (endereco, blocos, sequencia) in estado['peers'].items():
+            enxame.peers_ativos[id_peer] = endereco
+            enxame.ids_dos_peers.append(id_peer)
+            enxame.sequencias_dos_peers[id_peer] = sequencia
+            enxame.blocos_dos_peers[id_peer] = set(expandir_blocos(blocos, enxame.total_de_blocos))
+        reconstruir_indice(enxame)
+
+def reconstruir_indice(enxame):
+    """
+    Refaz de uma só vez o índice invertido e a disponibilidade a partir de `blocos_dos_peers`. Juntar primeiro
+    os donos de cada bloco numa lista e criar cada conjunto no fim custa menos do que inserir peer a peer.
+    """
+    donos_por_bloco = [[] for _ in range(enxame.total_de_blocos)]
+    for id_peer, blocos in enxame.blocos_dos_peers.items():
+        if id_peer == 'tracker':
+            continue
+        for id_bloco in blocos:
+            donos_por_bloco[id_bloco].append(id_peer)
+    enxame.donos_por_bloco = {id_bloco: set(donos) for id_bloco, donos in enumerate(donos_por_bloco) if donos}
+    enxame.disponibilidade_blocos = [len(donos) for donos in donos_por_bloco]
+
+def aplicar_registro(registro):
+    """Refaz uma mudança anotada no diário."""
+    enxame = enxames.get(registro['info_hash'])
+    if enxame is None:
+        return
+    operacao, id_peer = registro['op'], registro.get('id_peer')
+    if operacao == 'peer':
+        if id_peer not in enxame.peers_ativos:
+            enxame.ids_dos_peers.append(id_peer)
+        enxame.peers_ativos[id_peer] = registro['endereco']
+    elif operacao == 'posse':
+        registrar_posse_blocos(enxame, id_peer, registro['blocos'])
+    elif operacao == 'distribuidos':
+        enxame.blocos_nao_distribuidos.difference_update(registro['blocos'])
+    elif operacao == 'seq':
+        enxame.sequencias_dos_peers[id_peer] = registro['seq']
+    elif operacao == 'saida':
+        remover_peer(enxame, id_peer)
+
+def abrir_estado(pasta):
+    """
+    Restaura o estado guardado em `pasta` (último instantâneo mais o diário) e passa a anotar cada mudança.
+    Deve ser chamada depois de carregados os enxames. Retorna o número de peers restaurados.
+    """
+    global diario
+    novo_diario = DiarioDeEstado(pasta)
+    instantaneo, registros = novo_diario.carregar()
+    with lock:
+        if instantaneo:
+            restaurar_instantaneo(instantaneo)
+        for registro in registros:
+            aplicar_registro(registro)
+        # Só a partir daqui as mudanças são anotadas: refazer o diário não o deve duplicar.
+        diario = novo_diario
+    return sum(len(enxame.peers_ativos) for enxame in enxames.values())
+
+def gravar_instantaneo():
+    """Grava um instantâneo compacto e descarta o diário que ele substitui."""
+    # Com o lock de leitura nenhum pedido altera o estado, por isso a cópia e a troca de diário são atômicas.
+    with lock.leitura():
+        estado = estado_do_rastreador()
+        geracao = diario.iniciar_instantaneo()
+    diario.concluir_instantaneo(geracao, estado)
+
+def manter_estado():
+    """Thread de fundo: fsync do diário a cada INTERVALO_FSYNC e instantâneos periódicos."""
+    ultimo_instantaneo = time.time()
+    while True:
+        time.sleep(INTERVALO_FSYNC)
+        diario.sincronizar()
+        if time.time() - ultimo_instantaneo >= INTERVALO_INSTANTANEO or diario.registros >= MAX_REGISTROS_DIARIO:
+            gravar_instantaneo()
+            ultimo_instantaneo = time.time()
 
 @app.route('/register', methods=['POST'])
 def registrar_peer():
@@ -40,54 +482,35 @@ def registrar_peer():
     Endpoint para registar um novo peer na rede.
     O rastreador distribui um conjunto inicial de blocos, garantindo que todos os blocos
     sejam eventualmente disponibilizados na rede.
+    O peer pode enviar em 'bitfield' (base64) os blocos que já possui, e em 'info_hash' o enxame.
     """
     dados = flask.request.json
-    id_peer = dados['peer_id']
-    endereco_peer = dados['address']
+    enxame = obter_enxame(dados.get('info_hash'))
+    if enxame is None:
+        return enxame_desconhecido()
+    if not identificador_valido(dados.get('peer_id')) or not texto_preenchido(dados.get('address')):
+        return flask.jsonify({'error': "'peer_id' e 'address' são obrigatórios"}), 400
+    erro = blocos_invalidos(enxame, dados)
+    if erro:
+        return flask.jsonify({'error': erro}), 400
     
     with lock:
-        # Só regista o peer se ele não for já conhecido.
-        if id_peer not in peers_ativos:
-            peers_ativos[id_peer] = endereco_peer
-            
-            num_blocos_para_entregar = min(10, TOTAL_DE_BLOCOS)
-            blocos_iniciais = []
-
-            # LÓGICA CRÍTICA: Prioriza a distribuição de blocos que ainda não estão na rede.
-            if blocos_nao_distribuidos:
-                # Calcula quantos blocos não distribuídos pode entregar.
-                num_a_atribuir = min(num_blocos_para_entregar, len(blocos_nao_distribuidos))
-                blocos_para_atribuir = random.sample(list(blocos_nao_distribuidos), k=num_a_atribuir)
-                
-                # Atualiza o conjunto de blocos não distribuídos, removendo os que acabaram de ser entregues.
-                for bloco in blocos_para_atribuir:
-                    blocos_nao_distribuidos.remove(bloco)
-                blocos_iniciais = blocos_para_atribuir
-            # Se todos os blocos já foram distribuídos pelo menos uma vez, entrega um conjunto totalmente aleatório.
-            else:
-                logging.info("Todos os blocos já foram distribuídos. Fornecendo conjunto aleatório.")
-                blocos_iniciais = random.sample(list(blocos_do_rastreador), k=num_blocos_para_entregar)
-
-            # Armazena os blocos que o novo peer possui.
-            blocos_dos_peers[id_peer] = set(blocos_iniciais)
-            logging.info(f"Peer {id_peer} registado com {len(blocos_iniciais)} blocos iniciais.")
-            logging.info(f"{len(blocos_nao_distribuidos)} blocos restantes para a distribuição inicial.")
+        resposta = registrar_peer_no_enxame(enxame, dados['peer_id'], dados['address'], dados.get('bitfield'))
         
     # Retorna o estado do registo e as informações necessárias para o peer.
-    return flask.jsonify({
-        'status': 'registered',
-        'initial_blocks': list(blocos_dos_peers.get(id_peer, [])),
-        'total_blocks': TOTAL_DE_BLOCOS
-    })
+    return flask.jsonify(resposta)
 
 @app.route('/get_peers', methods=['GET'])
 def obter_peers():
-    """Endpoint para um peer obter uma lista de outros peers ativos."""
+    """Endpoint para um peer obter uma lista de outros peers ativos no enxame 'info_hash'."""
     id_peer = flask.request.args.get('peer_id')
     if not id_peer:
         return flask.jsonify({'error': 'peer_id é obrigatório'}), 400
+    enxame = obter_enxame(flask.request.args.get('info_hash'))
+    if enxame is None:
+        return enxame_desconhecido()
         
-    lista_de_peers = obter_peers_aleatorios(id_peer)
+    lista_de_peers = obter_peers_aleatorios(enxame, id_peer)
     return flask.jsonify(lista_de_peers)
 
 @app.route('/get_block_info', methods=['POST'])
@@ -98,37 +521,209 @@ def obter_info_blocos():
     """
     dados = flask.request.json
     ids_dos_blocos = dados.get('block_ids', [])
-    donos_dos_blocos = {}
+    enxame = obter_enxame(dados.get('info_hash'))
+    if enxame is None:
+        return enxame_desconhecido()
     
-    with lock:
-        for id_bloco in ids_dos_blocos:
-            # Encontra todos os peers que possuem o bloco, EXCLUINDO o próprio rastreador da lista.
-            donos = [pid for pid, blocos in blocos_dos_peers.items() if id_bloco in blocos and pid != 'tracker']
-            donos_dos_blocos[str(id_bloco)] = donos
+    # Consulta só de leitura: várias podem correr em paralelo, bloqueando apenas durante as escritas.
+    with lock.leitura():
+        # O índice já exclui o próprio rastreador da lista de donos.
+        donos_dos_blocos = obter_donos_dos_blocos(enxame, ids_dos_blocos)
             
     return flask.jsonify(donos_dos_blocos)
 
 @app.route('/update_blocks', methods=['POST'])
 def atualizar_blocos():
-    """Endpoint para um peer informar ao rastreador que adquiriu novos blocos."""
+    """
+    Endpoint para um peer informar ao rastreador que adquiriu novos blocos.
+    Os formatos aceites estão descritos em `aplicar_atualizacao`.
+    """
     dados = flask.request.json
-    id_peer = dados['peer_id']
-    novos_blocos = set(dados['blocks'])
+    id_peer = dados.get('peer_id')
+    enxame = obter_enxame(dados.get('info_hash'))
+    if enxame is None:
+        return enxame_desconhecido()
+    if not identificador_valido(id_peer):
+        erro = "'peer_id' é obrigatório"
+    elif 'seq' in dados and not inteiro_nao_negativo(dados['seq']):
+        erro = "'seq' deve ser um inteiro não negativo"
+    else:
+        erro = blocos_invalidos(enxame, dados)
+    if erro:
+        return flask.jsonify({'status': 'error', 'message': erro}), 400
     
     with lock:
-        if id_peer in blocos_dos_peers:
-            # Adiciona os novos blocos ao conjunto de blocos do peer.
-            blocos_dos_peers[id_peer].update(novos_blocos)
-            logging.info(f"Peer {id_peer} atualizou. Total de blocos agora: {len(blocos_dos_peers[id_peer])}")
-        else:
+        if id_peer not in enxame.blocos_dos_peers:
             return flask.jsonify({'status': 'error', 'message': 'Peer não registado'}), 404
+        resposta = aplicar_atualizacao(enxame, id_peer, dados)
             
-    return flask.jsonify({'status': 'updated'})
+    return flask.jsonify(resposta)
+
+def processar_announce(dados, agora):
+    """
+    Processa um announce recebido no instante `agora` e retorna (corpo da resposta, status HTTP).
+    Separada da rota para que o simulador de enxame a execute com um relógio simulado.
+    """
+    enxame = obter_enxame(dados.get('info_hash'))
+    if enxame is None:
+        return {'error': 'Enxame desconhecido'}, 404
+    # Tudo é validado antes do lock: um pedido mal formado não pode remover o peer nem chegar ao diário.
+    erro = announce_invalido(enxame, dados)
+    if erro:
+        return {'error': erro}, 400
+    id_peer = dados['peer_id']
+    evento = dados.get('event')
+    intervalo, intervalo_minimo = calcular_intervalos()
+
+    with lock:
+        if evento == 'stopped':
+            remover_peer(enxame, id_peer)
+            return {'status': 'stopped'}, 200
+
+        if evento is None and agora - enxame.ultimo_announce.get(id_peer, 0) < intervalo_minimo:
+            return {'error': 'too_soon', 'interval': intervalo, 'min_interval': intervalo_minimo}, 429
+        # 'started' reinicia um peer já conhecido (por exemplo, depois de ele reiniciar): os blocos passam a ser
+        # os do bitfield que ele traz, e não os que o rastreador guardou da sessão anterior.
+        if evento == 'started':
+            remover_peer(enxame, id_peer)
+        enxame.ultimo_announce[id_peer] = agora
+
+        if evento == 'started' or id_peer not in enxame.peers_ativos:
+            resposta = registrar_peer_no_enxame(enxame, id_peer, dados['address'], dados.get('bitfield'))
+        else:
+            resposta = aplicar_atualizacao(enxame, id_peer, dados)
+
+        if 'stats' in dados:
+            definir_estatisticas(enxame, id_peer, dados['stats'])
+        resposta['complete'] = enxame.semeadores
+        resposta['incomplete'] = len(enxame.peers_ativos) - resposta['complete']
+
+    resposta['peers'] = obter_peers_aleatorios(enxame, id_peer, dados.get('num_want', 5))
+    resposta['interval'] = intervalo
+    resposta['min_interval'] = intervalo_minimo
+    return resposta, 200
+
+@app.route('/announce', methods=['POST'])
+def anunciar():
+    """
+    Endpoint que junta numa só ida e volta o registo, as atualizações de blocos, as estatísticas
+    e a lista de peers de um enxame. Campos do pedido:
+      - 'peer_id', 'address', 'info_hash' (opcional se o rastreador só tiver um enxame);
+      - 'event' (opcional): 'started' (primeiro announce), 'completed' ou 'stopped';
+      - 'have'/'bitfield' + 'seq' (opcional): blocos obtidos desde o último announce, como em '/update_blocks';
+      - 'stats' (opcional): {'uploaded', 'downloaded', 'left'};
+      - 'num_want' (opcional): quantos peers devolver.
+    A resposta traz 'interval' e 'min_interval', que crescem com a carga do rastreador. Um announce sem
+    evento antes de 'min_interval' é recusado (429) e o peer deve guardar as atualizações para o próximo.
+    """
+    dados = flask.request.json
+    if not isinstance(dados, dict):
+        return flask.jsonify({'error': 'O corpo deve ser um objeto JSON'}), 400
+    resposta, status = processar_announce(dados, time.time())
+    # Um 'event' desconhecido não vira rótulo da métrica, para não multiplicar as séries.
+    evento = dados.get('event') if dados.get('event') in EVENTOS_ANNOUNCE else 'invalido'
+    announces_por_evento.incrementar(evento or 'periodico', str(status))
+    return flask.jsonify(resposta), status
+
+@app.route('/metainfo', methods=['GET'])
+def obter_metainfo():
+    """Endpoint que retorna o metainfo (tamanho das peças e hash de cada uma) do ficheiro do enxame 'info_hash'."""
+    enxame = obter_enxame(flask.request.args.get('info_hash'))
+    if enxame is None:
+        return enxame_desconhecido()
+    return flask.jsonify(enxame.metainfo)
+
+@app.route('/swarms', methods=['GET'])
+def listar_enxames():
+    """Endpoint que lista os enxames do rastreador: info-hash, nome do ficheiro e número de peers."""
+    with lock.leitura():
+        return flask.jsonify([{'info_hash': enxame.info_hash, 'name': enxame.metainfo['name'], 'peers': len(enxame.peers_ativos)}
+                              for enxame in enxames.values()])
+
+@app.route('/request_block/<int:id_bloco>', methods=['GET'])
+def servir_bloco_inicial(id_bloco):
+    """
+    Endpoint que entrega os bytes de um bloco ao peer a quem ele foi atribuído no registo.
+    O rastreador só serve blocos da distribuição inicial; o resto circula entre os peers.
+    """
+    id_peer = flask.request.args.get('peer_id')
+    enxame = obter_enxame(flask.request.args.get('info_hash'))
+    if enxame is None:
+        return enxame_desconhecido()
+    with lock.leitura():
+        if enxame.armazenamento is None or id_bloco not in enxame.blocos_dos_peers.get(id_peer, ()):
+            return flask.jsonify({'error': 'Bloco não atribuído a este peer'}), 404
+    inicio, fim = enxame.armazenamento.limites_peca(id_bloco)
+    return flask.Response(enxame.armazenamento.fatias(id_bloco), mimetype='application/octet-stream',
+                          headers={'Content-Length': str(fim - inicio)})
+
+@app.route('/metrics', methods=['GET'])
+def expor_metricas():
+    """Endpoint com as métricas do rastreador (latências, locks, tráfego, announces) no formato de texto do Prometheus."""
+    return flask.Response(metricas.texto(), content_type=TIPO_CONTEUDO)
+
+@app.route('/stats', methods=['GET'])
+def obter_estatisticas():
+    """Endpoint que retorna os bytes trafegados por endpoint desde o início do rastreador."""
+    with lock_trafego:
+        return flask.jsonify({endpoint: dict(contadores) for endpoint, contadores in trafego_por_endpoint.items()})
 
 # Ponto de entrada do script.
 if __name__ == '__main__':
-    # Define que a entidade 'tracker' possui todos os blocos (apenas para referência interna).
-    blocos_dos_peers['tracker'] = blocos_do_rastreador
-    logging.info(f"Rastreador iniciado com {len(blocos_do_rastreador)} blocos. Aguardando peers para distribuição inicial...")
-    # Inicia o servidor Flask. 'use_reloader=False' é importante para evitar que o script reinicie e perca as variáveis em memória.
-    app.run(port=5000, debug=True, use_reloader=False)
+    import argparse
+    parser = argparse.ArgumentParser(description='Inicia o rastreador MiniBit.')
+    parser.add_argument('--arquivo', nargs='+', help='Ficheiros a distribuir, um enxame por ficheiro (padrão: gera minibit_exemplo.bin com 50 blocos).')
+    parser.add_argument('--metainfo', nargs='+', help='Metainfo já gerado para cada ficheiro, na mesma ordem (padrão: gerado na hora).')
+    parser.add_argument('--tamanho-peca', type=int, default=256 * 1024)
+    parser.add_argument('--algoritmo', choices=['sha1', 'sha256'], default='sha1')
+    parser.add_argument('--porta', type=int, default=5000)
+    parser.add_argument('--servidor', choices=['waitress', 'flask'], default='waitress',
+                        help="'waitress' (produção, multi-thread) ou 'flask' (servidor de desenvolvimento).")
+    parser.add_argument('--threads', type=int, default=16, help='Threads de atendimento do waitress.')
+    parser.add_argument('--max-conexoes', type=int, default=1000, help='Conexões simultâneas aceitas pelo waitress.')
+    parser.add_argument('--pasta-estado', help='Pasta do diário e dos instantâneos do estado; o estado sobrevive a reinícios (padrão: só em memória).')
+    args = parser.parse_args()
+    # A escrita dos logs sai dos pedidos (e do lock) para uma thread própria.
+    registrar_em_segundo_plano(logging.getLogger())
+
+    caminhos = args.arquivo
+    if caminhos is None:
+        caminhos = ['minibit_exemplo.bin']
+        if not os.path.exists(caminhos[0]):
+            gerar_arquivo_exemplo(caminhos[0], TOTAL_DE_BLOCOS, args.tamanho_peca)
+    if args.metainfo and len(args.metainfo) != len(caminhos):
+        parser.error("Indique um --metainfo para cada --arquivo.")
+    for indice, caminho_arquivo in enumerate(caminhos):
+        if args.metainfo:
+            metainfo = carregar_metainfo(args.metainfo[indice])
+            if os.path.getsize(caminho_arquivo) != metainfo['length']:
+                parser.error(f"{caminho_arquivo} não corresponde ao metainfo {args.metainfo[indice]}.")
+        else:
+            metainfo = gerar_metainfo(caminho_arquivo, args.tamanho_peca, args.algoritmo)
+            salvar_metainfo(metainfo, f'{caminho_arquivo}.minibit.json')
+        enxame = carregar_conteudo(metainfo, caminho_arquivo)
+        logging.info(f"Enxame {enxame.info_hash} ({metainfo['name']}) com {enxame.total_de_blocos} blocos.")
+
+    if args.pasta_estado:
+        inicio = time.perf_counter()
+        num_peers = abrir_estado(args.pasta_estado)
+        logging.info(f"Estado restaurado de {args.pasta_estado}: {num_peers} peers em {time.perf_counter() - inicio:.2f}s.")
+        threading.Thread(target=manter_estado, daemon=True).start()
+
+    logging.info(f"Rastreador iniciado com {len(enxames)} enxame(s). Aguardando peers para distribuição inicial...")
+    # O estado vive na memória deste processo, por isso a concorrência vem de threads, não de vários processos.
+    try:
+        if args.servidor == 'waitress':
+            try:
+                from waitress import serve
+            except ImportError:
+                parser.error("O waitress não está instalado (pip install waitress). Use --servidor flask.")
+            serve(app, host='127.0.0.1', port=args.porta, threads=args.threads, connection_limit=args.max_conexoes)
+        else:
+            # 'use_reloader=False' é importante para evitar que o script reinicie e perca as variáveis em memória.
+            app.run(port=args.porta, threaded=True, use_reloader=False)
+    finally:
+        # Num encerramento limpo, o próximo arranque só precisa de ler o instantâneo.
+        if diario is not None:
+            gravar_instantaneo()
+            diario.fechar()